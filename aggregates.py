@@ -0,0 +1,301 @@
+import argparse
+import sqlite3
+import numpy as np
+import pandas as pd
+import database
+import migrations
+
+
+
+# Summary tables materialized from flights. Each one is rebuilt from its SELECT and records
+# the flights data version it was built from in aggregate_builds.
+# {source} is the flights table for a full build and the staged new rows for an incremental update.
+DELAY_STATS = """
+               COUNT(dep_delay) AS delay_count,
+               TOTAL(dep_delay) AS delay_sum,
+               TOTAL(dep_delay * dep_delay) AS delay_sum_sq,
+               MIN(dep_delay) AS min_delay,
+               MAX(dep_delay) AS max_delay"""
+
+AGGREGATES = {
+    'agg_routes': f"""
+        SELECT origin, dest,
+               COUNT(*) AS num_flights,
+               MIN(distance) AS min_distance,
+               MAX(distance) AS max_distance,{DELAY_STATS}
+        FROM {{source}}
+        GROUP BY origin, dest
+    """,
+    'agg_carrier_month': """
+        SELECT carrier, year, month, COUNT(*) AS num_flights
+        FROM {source}
+        GROUP BY carrier, year, month
+    """,
+    'agg_origin_day': """
+        SELECT origin, year, month, day, COUNT(*) AS num_flights
+        FROM {source}
+        GROUP BY origin, year, month, day
+    """,
+    'agg_carrier_delay': f"""
+        SELECT carrier,
+               COUNT(*) AS num_flights,{DELAY_STATS}
+        FROM {{source}}
+        GROUP BY carrier
+    """,
+    'agg_hourly_delay': f"""
+        SELECT origin, year, month, day,
+               (CAST(dep_time AS INTEGER) / 100) % 24 AS dep_hour,{DELAY_STATS}
+        FROM {{source}}
+        WHERE dep_delay IS NOT NULL AND dep_time IS NOT NULL
+        GROUP BY origin, year, month, day, dep_hour
+    """,
+}
+
+# Group key of each summary table, also its unique index. Per-day and per-month tables include the year,
+# so flights appended for a later year get their own groups instead of being added to the same dates of an earlier one
+AGGREGATE_KEYS = {
+    'agg_routes': ('origin', 'dest'),
+    'agg_carrier_month': ('carrier', 'year', 'month'),
+    'agg_origin_day': ('origin', 'year', 'month', 'day'),
+    'agg_carrier_delay': ('carrier',),
+    'agg_hourly_delay': ('origin', 'year', 'month', 'day', 'dep_hour'),
+}
+
+# How a value column is combined with the same column of newly appended rows, anything not listed is summed
+MERGE_MIN = ('min_distance', 'min_delay')
+MERGE_MAX = ('max_distance', 'max_delay')
+
+
+def ensure_builds_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS aggregate_builds (
+            name TEXT PRIMARY KEY,
+            flights_version INTEGER NOT NULL,
+            built_at TEXT NOT NULL
+        )
+    """)
+
+
+def flights_version():
+    """
+    Current version of the flights data, bumped by triggers on every insert, delete or update of a
+    source column (see migrations.py). None if version tracking has not been installed yet.
+    """
+    try:
+        df = database.query("SELECT version FROM data_versions WHERE name = 'flights'")
+    except Exception:
+        return None
+    return None if df.empty else int(df['version'].iloc[0])
+
+
+def build_versions():
+    """Flights version each summary table was built from, by table name."""
+    try:
+        df = database.query('SELECT name, flights_version FROM aggregate_builds')
+    except Exception:
+        return {}
+    return dict(zip(df['name'], df['flights_version']))
+
+
+def build_aggregates(names=None):
+    """
+    Rebuild summary tables from scratch (all of them by default) in one transaction.
+    Also installs the flights version tracking if it is missing.
+    """
+    names = list(AGGREGATES) if names is None else list(names)
+
+    with database.write_connection() as conn:
+        migrations.apply_migrations(conn)
+        ensure_builds_table(conn)
+        version = conn.execute("SELECT version FROM data_versions WHERE name = 'flights'").fetchone()[0]
+
+        for name in names:
+            conn.execute(f'DROP TABLE IF EXISTS {name}')
+            conn.execute(f"CREATE TABLE {name} AS {AGGREGATES[name].format(source='flights')}")
+            conn.execute(f"CREATE UNIQUE INDEX ix_{name} ON {name}({', '.join(AGGREGATE_KEYS[name])})")
+            conn.execute(
+                "INSERT OR REPLACE INTO aggregate_builds (name, flights_version, built_at) VALUES (?, ?, datetime('now'))",
+                (name, version)
+            )
+            print(f'Built {name}.')
+
+        conn.execute('ANALYZE')
+
+
+def has_keys(name, conn=None):
+    """
+    True if the summary table has every column of its current group key. Tables built before the year
+    was added to the per-day and per-month keys do not, and count as stale until the next build_aggregates().
+    """
+    sql = 'SELECT name FROM pragma_table_info(?)'
+    columns = [row[0] for row in conn.execute(sql, (name,))] if conn is not None else list(database.query(sql, (name,))['name'])
+    return set(AGGREGATE_KEYS[name]) <= set(columns)
+
+
+def is_fresh(name):
+    """True if the summary table exists, has its current group key and was built from the current flights data."""
+    version = flights_version()
+    return version is not None and build_versions().get(name) == version and has_keys(name)
+
+
+def query_aggregate(name, sql, params=()):
+    """
+    Run a query against a summary table if it is up to date.
+    Returns None when the table is missing or stale, so the caller can fall back to the live computation.
+    """
+    if not is_fresh(name):
+        return None
+    return database.query(sql, params)
+
+
+def hourly_delays(origins, year, month, day):
+    """
+    Mean departure delay per departure hour for some origin airports on one day, from agg_hourly_delay.
+    returns: DataFrame with hour_numeric, hour_label, origin and dep_delay columns, or None if the table is stale.
+    """
+    placeholders = ', '.join('?' for _ in origins)
+    df = query_aggregate('agg_hourly_delay', f"""
+        SELECT dep_hour AS hour_numeric, origin, delay_sum / delay_count AS dep_delay
+        FROM agg_hourly_delay
+        WHERE year = ? AND month = ? AND day = ? AND origin IN ({placeholders}) AND delay_count > 0
+        ORDER BY dep_hour, origin
+    """, (year, month, day, *origins))
+
+    if df is not None:
+        df.insert(1, 'hour_label', df['hour_numeric'].apply(lambda h: f'{h:02d}:00'))
+    return df
+
+
+############# incremental maintenance ############################
+
+def current_version(conn):
+    """Flights data version as seen by a connection, None if version tracking is not installed."""
+    try:
+        row = conn.execute("SELECT version FROM data_versions WHERE name = 'flights'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return None if row is None else row[0]
+
+
+def merge_sql(conn, name, source):
+    """
+    Upsert that folds the summary of `source` into a summary table: counts and sums are added,
+    min/max columns keep the smaller/larger value (ignoring NULLs).
+    """
+    keys = AGGREGATE_KEYS[name]
+    columns = [d[0] for d in conn.execute(f'SELECT * FROM {name} LIMIT 0').description]
+
+    updates = []
+    for column in columns:
+        if column in keys:
+            continue
+        if column in MERGE_MIN:
+            updates.append(f'{column} = MIN(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))')
+        elif column in MERGE_MAX:
+            updates.append(f'{column} = MAX(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))')
+        else:
+            updates.append(f'{column} = {column} + excluded.{column}')
+
+    column_list = ', '.join(columns)
+    return f"""
+        INSERT INTO {name} ({column_list})
+        SELECT {column_list} FROM ({AGGREGATES[name].format(source=source)}) WHERE true
+        ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}
+    """
+
+
+def append_flights(df, verify=False):
+    """
+    Append new rows to flights and fold them into every up-to-date summary table in the same transaction,
+    so the summaries never disagree with the flights they describe. Summary tables that were already stale
+    are left alone until the next build_aggregates().
+    params: DataFrame of new flights with columns named like the flights table,
+            verify: afterwards compare the updated tables with a full rebuild and raise if they differ.
+    returns: names of the summary tables that were updated.
+    """
+    with database.write_connection() as conn:
+        present = [row[1] for row in conn.execute('PRAGMA table_info(flights)')]
+        unknown = [c for c in df.columns if c not in present]
+        if unknown:
+            raise ValueError(f'Columns not in the flights table: {unknown}')
+
+        ensure_builds_table(conn)
+        before = current_version(conn)
+        updated = [row[0] for row in conn.execute(
+            'SELECT name FROM aggregate_builds WHERE flights_version = ?', (before,)
+        ).fetchall() if row[0] in AGGREGATES and has_keys(row[0], conn)]
+
+        columns = ', '.join(df.columns)
+        placeholders = ', '.join('?' for _ in df.columns)
+        rows = df.astype(object).where(df.notna(), None).values.tolist()
+
+        # The new rows are staged once and summarized from the staging table, never from the whole of flights
+        conn.execute('DROP TABLE IF EXISTS temp.new_flights')
+        conn.execute('CREATE TEMP TABLE new_flights AS SELECT * FROM flights WHERE 0')
+        conn.executemany(f'INSERT INTO temp.new_flights ({columns}) VALUES ({placeholders})', rows)
+        conn.execute(f'INSERT INTO flights ({columns}) SELECT {columns} FROM temp.new_flights')
+        after = current_version(conn)
+
+        for name in updated:
+            conn.execute(merge_sql(conn, name, 'temp.new_flights'))
+            conn.execute(
+                "UPDATE aggregate_builds SET flights_version = ?, built_at = datetime('now') WHERE name = ?",
+                (after, name)
+            )
+        conn.execute('DROP TABLE temp.new_flights')
+
+    print(f"Appended {len(rows)} flights, updated {', '.join(updated) if updated else 'no summary tables'}.")
+
+    if verify:
+        report = verify_aggregates(updated)
+        failed = [name for name, mismatches in report.items() if mismatches]
+        if failed:
+            raise RuntimeError(f"Incremental update differs from a full rebuild for: {', '.join(failed)}")
+
+    return updated
+
+
+def verify_aggregates(names=None, tolerance=1e-9):
+    """
+    Compare summary tables with a full rebuild computed on the fly, without replacing them.
+    returns: dict of table name -> number of groups that are missing, extra or have different values.
+    """
+    names = list(AGGREGATES) if names is None else list(names)
+    report = {}
+
+    for name in names:
+        keys = list(AGGREGATE_KEYS[name])
+        stored = database.query(f'SELECT * FROM {name}', cache=False)
+        expected = database.query(AGGREGATES[name].format(source='flights'), cache=False)
+
+        merged = stored.merge(expected, on=keys, how='outer', suffixes=('_stored', '_expected'), indicator=True)
+        bad = (merged['_merge'] != 'both').to_numpy()
+        for column in expected.columns.difference(keys):
+            a = merged[f'{column}_stored'].astype(float).to_numpy()
+            b = merged[f'{column}_expected'].astype(float).to_numpy()
+            bad |= ~np.isclose(a, b, rtol=tolerance, atol=1e-6, equal_nan=True)
+
+        report[name] = int(bad.sum())
+        print(f"{name}: {'OK' if report[name] == 0 else f'{report[name]} groups differ'}")
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build, update and check the dashboard summary tables.')
+    parser.add_argument('--append', metavar='CSV', help='append the flights in a CSV file and update the summary tables incrementally')
+    parser.add_argument('--verify', action='store_true', help='compare the summary tables with a full rebuild')
+    args = parser.parse_args()
+
+    if args.append:
+        append_flights(pd.read_csv(args.append), verify=args.verify)
+    elif args.verify:
+        verify_aggregates()
+    else:
+        build_aggregates()
+
+    database.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import database
+import spatial
+
+
+
+AIRPORTS_QUERY = 'SELECT faa, name, lat, lon, tzone FROM airports'
+
+
+class AirportRegistry:
+    """
+    The airports table held in memory as parallel arrays (faa, names, lat, lon, tzone, is_us),
+    with dict indexes from FAA code and from name to row position, so a lookup is a dict access
+    instead of a query and a scan of the whole table.
+    When a code or name occurs more than once the first row wins.
+    """
+
+    def __init__(self, df):
+        df = df.reset_index(drop=True)
+        self.faa = df['faa'].to_numpy(dtype=object)
+        self.names = df['name'].to_numpy(dtype=object)
+        self.lat = pd.to_numeric(df['lat'], errors='coerce').to_numpy(dtype=np.float64)
+        self.lon = pd.to_numeric(df['lon'], errors='coerce').to_numpy(dtype=np.float64)
+        self.tzone = df['tzone'].to_numpy(dtype=object)
+        self.is_us = df['tzone'].astype(str).str.startswith('America').to_numpy()
+
+        self._by_faa = {}
+        self._by_name = {}
+        for i, (faa, name) in enumerate(zip(self.faa, self.names)):
+            self._by_faa.setdefault(faa, i)
+            self._by_name.setdefault(name, i)
+
+        # Vectorized lookups go through a pandas Index of the unique codes
+        self._faa_index = pd.Index(list(self._by_faa))
+        self._faa_rows = np.fromiter(self._by_faa.values(), dtype=np.int64, count=len(self._by_faa))
+
+    def __len__(self):
+        return len(self.faa)
+
+    def __contains__(self, faa):
+        return faa in self._by_faa
+
+    ############# single lookups ############################
+
+    def faa_for(self, name):
+        """FAA code of the airport with this name, raises KeyError if there is none."""
+        return self.faa[self._by_name[name]]
+
+    def name(self, faa):
+        """Name of the airport with this FAA code, the code itself if it is unknown."""
+        i = self._by_faa.get(faa)
+        return faa if i is None else self.names[i]
+
+    def lat_lon(self, faa):
+        """(lat, lon) of the airport with this FAA code, raises KeyError if it is unknown."""
+        i = self._by_faa[faa]
+        return self.lat[i], self.lon[i]
+
+    def timezone(self, faa):
+        i = self._by_faa.get(faa)
+        return None if i is None else self.tzone[i]
+
+    def in_usa(self, faa=None, name=None):
+        """True if the airport, given by FAA code or by name, is in an America/ time zone."""
+        i = self._by_faa[faa] if faa is not None else self._by_name[name]
+        return bool(self.is_us[i])
+
+    ############# vectorized lookups ############################
+
+    def positions(self, faa_codes):
+        """Row position of every code, -1 for unknown codes."""
+        found = self._faa_index.get_indexer(pd.Index(faa_codes))
+        return np.where(found >= 0, self._faa_rows[found], -1)
+
+    def coords(self, faa_codes):
+        """Coordinates of many airports at once, shape (n, 2) with columns lat, lon and NaN for unknown codes."""
+        rows = self.positions(faa_codes)
+        out = np.full((len(rows), 2), np.nan)
+        known = rows >= 0
+        out[known, 0] = self.lat[rows[known]]
+        out[known, 1] = self.lon[rows[known]]
+        return out
+
+    def names_for(self, faa_codes):
+        """Names of the airports whose code is in faa_codes, in table order."""
+        return list(self.names[np.isin(self.faa, list(faa_codes))])
+
+
+############# shared instance ############################
+
+@database.versioned_cache()
+def get_airport_registry():
+    """
+    Return the process-wide AirportRegistry, shared by every caller and Streamlit session.
+    It is built on first use and rebuilt when the database file changes.
+    """
+    return AirportRegistry(database.query(AIRPORTS_QUERY, cache=False))
+
+
+@database.versioned_cache()
+def get_airport_index():
+    """
+    Return the process-wide spatial.AirportIndex over all airports, shared by every caller and Streamlit session.
+    It is built on first use and rebuilt when the database file changes, like the registry.
+    """
+    return spatial.AirportIndex(database.query('SELECT faa, name, lat, lon FROM airports', cache=False))
@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+import database
+
+
+
+GRIDSIZE = 50                     # Bins along the x axis, the y axis of a grid gets as many
+VALUE_BINS = 64                   # Resolution of the per-bin value histograms the quantiles are read from
+CHUNK_ROWS = 50000                # Rows fetched from SQLite and binned at once
+QUANTILES = (0.5, 0.9)
+
+# Density plots offered by the analyses and the dashboard: query selecting x and y, axis labels
+DENSITY_PLOTS = {
+    'distance_vs_arrival_delay': (
+        'SELECT distance, arr_delay FROM flights WHERE distance IS NOT NULL AND arr_delay IS NOT NULL',
+        'Distance (miles)', 'Arrival Delay (minutes)'),
+    'wind_effect_vs_air_time': (
+        'SELECT wind_effect, air_time FROM flights WHERE wind_effect IS NOT NULL AND air_time IS NOT NULL',
+        'Wind Effect (mph along the route)', 'Air Time (minutes)'),
+}
+
+
+class GridBins:
+    """Fixed rectangular grid of nx by ny bins over x_range by y_range, bin i * ny + j is column i, row j."""
+
+    def __init__(self, x_range, y_range, nx=GRIDSIZE, ny=None):
+        self.x_range = tuple(float(v) for v in x_range)
+        self.y_range = tuple(float(v) for v in y_range)
+        self.nx = nx
+        self.ny = nx if ny is None else ny
+        self.x_edges = np.linspace(*self.x_range, self.nx + 1)
+        self.y_edges = np.linspace(*self.y_range, self.ny + 1)
+        self.n_bins = self.nx * self.ny
+
+    def index(self, x, y):
+        """Flat bin of every point, -1 outside the grid. The upper edges belong to the last bins, as in np.histogram2d."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        inside = (x >= self.x_edges[0]) & (x <= self.x_edges[-1]) & (y >= self.y_edges[0]) & (y <= self.y_edges[-1])
+        i = np.minimum(np.searchsorted(self.x_edges, x, side='right') - 1, self.nx - 1)
+        j = np.minimum(np.searchsorted(self.y_edges, y, side='right') - 1, self.ny - 1)
+        return np.where(inside, i * self.ny + j, -1)
+
+    def centers(self):
+        x = (self.x_edges[:-1] + self.x_edges[1:]) / 2
+        y = (self.y_edges[:-1] + self.y_edges[1:]) / 2
+        return np.repeat(x, self.ny), np.tile(y, self.nx)
+
+
+class HexBins:
+    """
+    Hexagonal bins over x_range by y_range, laid out like matplotlib's hexbin: nx hexagons across,
+    two offset rectangular lattices of centers, and every point goes to the nearer of its two candidate centers.
+    """
+
+    def __init__(self, x_range, y_range, nx=GRIDSIZE, ny=None):
+        self.x_range = tuple(float(v) for v in x_range)
+        self.y_range = tuple(float(v) for v in y_range)
+        self.nx = nx
+        self.ny = max(int(nx / np.sqrt(3)), 1) if ny is None else ny
+        padding = 1e-9 * (self.x_range[1] - self.x_range[0])  # Keeps points on the x edges inside, as matplotlib does
+        self.x_range = (self.x_range[0] - padding, self.x_range[1] + padding)
+        self.sx = (self.x_range[1] - self.x_range[0]) / self.nx or 1.0
+        self.sy = (self.y_range[1] - self.y_range[0]) / self.ny or 1.0
+        self.n_outer = (self.nx + 1) * (self.ny + 1)
+        self.n_bins = self.n_outer + self.nx * self.ny
+
+    def index(self, x, y):
+        """Flat bin of every point, -1 when its nearest center lies outside the lattices."""
+        ix = (np.asarray(x, dtype=np.float64) - self.x_range[0]) / self.sx
+        iy = (np.asarray(y, dtype=np.float64) - self.y_range[0]) / self.sy
+
+        ix1, iy1 = np.round(ix).astype(np.int64), np.round(iy).astype(np.int64)
+        ix2, iy2 = np.floor(ix).astype(np.int64), np.floor(iy).astype(np.int64)
+        d1 = (ix - ix1) ** 2 + 3 * (iy - iy1) ** 2
+        d2 = (ix - ix2 - 0.5) ** 2 + 3 * (iy - iy2 - 0.5) ** 2
+
+        outer = np.where((ix1 >= 0) & (ix1 <= self.nx) & (iy1 >= 0) & (iy1 <= self.ny),
+                         ix1 * (self.ny + 1) + iy1, -1)
+        inner = np.where((ix2 >= 0) & (ix2 < self.nx) & (iy2 >= 0) & (iy2 < self.ny),
+                         self.n_outer + ix2 * self.ny + iy2, -1)
+        return np.where(d1 < d2, outer, inner)
+
+    def centers(self):
+        x1, y1 = np.meshgrid(np.arange(self.nx + 1), np.arange(self.ny + 1), indexing='ij')
+        x2, y2 = np.meshgrid(np.arange(self.nx) + 0.5, np.arange(self.ny) + 0.5, indexing='ij')
+        x = np.concatenate([x1.ravel(), x2.ravel()]) * self.sx + self.x_range[0]
+        y = np.concatenate([y1.ravel(), y2.ravel()]) * self.sy + self.y_range[0]
+        return x, y
+
+    def polygons(self):
+        """Corner coordinates of every hexagon, shape (n_bins, 6, 2), e.g. for a matplotlib PolyCollection."""
+        x, y = self.centers()
+        dx = self.sx * np.array([0.5, 0.5, 0.0, -0.5, -0.5, 0.0])
+        dy = self.sy / 3 * np.array([-0.5, 0.5, 1.0, 0.5, -0.5, -1.0])
+        return np.stack([x[:, None] + dx, y[:, None] + dy], axis=-1)
+
+
+def _scale(values, value_range, n):
+    low, high = value_range
+    width = (high - low) or 1.0
+    return (np.asarray(values, dtype=np.float64) - low) / width * n
+
+
+class BinnedStats:
+    """
+    Count, sum and sum of squares of a value per bin, plus a histogram of the value in every bin
+    for approximate quantiles. Memory depends only on the number of bins, not on the number of points,
+    and two BinnedStats over the same bins merge by adding their arrays.
+    """
+
+    def __init__(self, bins, value_range, value_bins=VALUE_BINS):
+        self.bins = bins
+        self.value_range = tuple(float(v) for v in value_range)
+        self.value_bins = value_bins
+        self.count = np.zeros(bins.n_bins, dtype=np.int64)
+        self.sum = np.zeros(bins.n_bins)
+        self.sum_sq = np.zeros(bins.n_bins)
+        self.hist = np.zeros((bins.n_bins, value_bins), dtype=np.int64)
+
+    def add(self, x, y, value=None):
+        """Bin a chunk of points, value defaults to y. Points outside the bins or with a NaN are skipped."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        value = y if value is None else np.asarray(value, dtype=np.float64)
+
+        keep = ~(np.isnan(x) | np.isnan(y) | np.isnan(value))
+        x, y, value = x[keep], y[keep], value[keep]
+        index = self.bins.index(x, y)
+        keep = index >= 0
+        index, value = index[keep], value[keep]
+
+        n = self.bins.n_bins
+        self.count += np.bincount(index, minlength=n)
+        self.sum += np.bincount(index, weights=value, minlength=n)
+        self.sum_sq += np.bincount(index, weights=value * value, minlength=n)
+
+        slot = np.clip(np.floor(_scale(value, self.value_range, self.value_bins)), 0, self.value_bins - 1).astype(np.int64)
+        self.hist += np.bincount(index * self.value_bins + slot, minlength=n * self.value_bins).reshape(n, self.value_bins)
+
+    def merge(self, other):
+        """Add the statistics of another BinnedStats over the same bins and value range, returns self."""
+        if other.bins.n_bins != self.bins.n_bins or other.value_range != self.value_range \
+                or other.value_bins != self.value_bins:
+            raise ValueError('Can only merge BinnedStats over the same bins and value range')
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_sq += other.sum_sq
+        self.hist += other.hist
+        return self
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.sum / self.count, np.nan)
+
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.mean()
+            variance = np.where(self.count > 1, (self.sum_sq - self.count * mean * mean) / (self.count - 1), np.nan)
+        return np.sqrt(np.maximum(variance, 0))
+
+    def quantile(self, q, hist=None):
+        """Approximate q-quantile of the value per bin, interpolated within the value histogram slots."""
+        hist = self.hist if hist is None else hist
+        cumulative = np.cumsum(hist, axis=1)
+        total = cumulative[:, -1]
+        target = q * total
+
+        slot = np.minimum((cumulative < target[:, None]).sum(axis=1), self.value_bins - 1)
+        rows = np.arange(len(hist))
+        below = np.where(slot > 0, cumulative[rows, np.maximum(slot - 1, 0)], 0)
+        inside = hist[rows, slot]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(inside > 0, (target - below) / inside, 0.5)
+
+        low, high = self.value_range
+        width = (high - low) / self.value_bins
+        return np.where(total > 0, low + (slot + fraction) * width, np.nan)
+
+    def grid(self):
+        """Counts of a GridBins as an (nx, ny) array."""
+        if not isinstance(self.bins, GridBins):
+            raise ValueError('grid needs GridBins')
+        return self.count.reshape(self.bins.nx, self.bins.ny)
+
+    def frame(self, quantiles=QUANTILES):
+        """One row per non-empty bin: bin center x and y, count, mean, std and the requested quantiles."""
+        x, y = self.bins.centers()
+        df = pd.DataFrame({'x': x, 'y': y, 'count': self.count, 'mean': self.mean(), 'std': self.std()})
+        for q in quantiles:
+            df[f'p{int(q * 100)}'] = self.quantile(q)
+        return df[df['count'] > 0].reset_index(drop=True)
+
+    def profile(self, quantiles=QUANTILES):
+        """
+        Statistics of the value per x column of a GridBins, collapsing the y bins: one row per column
+        with its center, count, mean and the requested quantiles.
+        """
+        if not isinstance(self.bins, GridBins):
+            raise ValueError('profile needs GridBins')
+        shape = (self.bins.nx, self.bins.ny)
+        count = self.grid().sum(axis=1)
+        total = self.sum.reshape(shape).sum(axis=1)
+        hist = self.hist.reshape(shape + (self.value_bins,)).sum(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df = pd.DataFrame({
+                'x': (self.bins.x_edges[:-1] + self.bins.x_edges[1:]) / 2,
+                'count': count,
+                'mean': np.where(count > 0, total / count, np.nan),
+            })
+        for q in quantiles:
+            df[f'p{int(q * 100)}'] = self.quantile(q, hist)
+        return df
+
+
+############# binning queries ############################
+
+def bin_query(sql, params=(), kind='grid', gridsize=GRIDSIZE, ranges=None, value_range=None, chunk_size=CHUNK_ROWS):
+    """
+    Bins the rows of a query selecting x, y and optionally a value column (default: y), reading them with
+    cursor.fetchmany in chunks of chunk_size rows, so only one chunk is ever held in memory.
+    params: query and parameters, 'grid' or 'hex', bins along x, ((x_min, x_max), (y_min, y_max)) and
+            (value_min, value_max); the ranges default to the extent of the data, found with one MIN/MAX query.
+    returns: BinnedStats
+    """
+    with database.read_connection() as conn:
+        cursor = conn.execute(sql, params)
+        has_value = len(cursor.description) > 2
+        columns = [d[0] for d in cursor.description]
+
+        if ranges is None or value_range is None:
+            extent = ', '.join(f'MIN("{c}"), MAX("{c}")' for c in columns[:3])
+            bounds = conn.execute(f'SELECT {extent} FROM ({sql})', params).fetchone()
+            bounds = [0.0 if b is None else float(b) for b in bounds]
+            if ranges is None:
+                ranges = ((bounds[0], bounds[1]), (bounds[2], bounds[3]))
+            if value_range is None:
+                value_range = (bounds[4], bounds[5]) if has_value else ranges[1]
+
+        bins = (HexBins if kind == 'hex' else GridBins)(ranges[0], ranges[1], gridsize)
+        stats = BinnedStats(bins, value_range)
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = np.array(rows, dtype=np.float64)
+            stats.add(chunk[:, 0], chunk[:, 1], chunk[:, 2] if has_value else None)
+
+    return stats
+
+
+@database.versioned_cache(maxsize=16)
+def _density(name, kind, gridsize):
+    return bin_query(DENSITY_PLOTS[name][0], kind=kind, gridsize=gridsize)
+
+
+def density(name, kind='grid', gridsize=GRIDSIZE):
+    """BinnedStats of one of the DENSITY_PLOTS, cached until the database changes."""
+    return _density(name, kind, gridsize)
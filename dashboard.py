@@ -1,11 +1,22 @@
+import sqlite3
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-import sqlite3
+import aggregates
+import airport_registry
+import binning
+import database
+import delay_stats
+import dimensions
+import distances
+import figure_cache
+import flight_store
 import part1
+from queries import FlightQuery
 import part3
+import weather_join
 
 
 
@@ -13,6 +24,15 @@ import part3
 st.set_page_config(layout="wide")  # Must be the first command
 
 
+# Set to True to answer the statistics sections from the in-memory FlightStore instead of SQLite
+USE_FLIGHT_STORE = False
+
+
+def get_store():
+    """The shared FlightStore when it is enabled, otherwise None so the statistics query the database."""
+    return flight_store.get_flight_store() if USE_FLIGHT_STORE else None
+
+
 ############# flight statistics ############################
 
 def get_airport_name(faa):
@@ -20,42 +40,68 @@ def get_airport_name(faa):
     Given an FAA code, return the airport's name.
     Returns the FAA code itself if no matching record is found.
     """
-    query = "SELECT name FROM airports WHERE faa = ?"
-    conn = sqlite3.connect('flights_database.db')
-    df = pd.read_sql_query(query, conn, params=(faa,))
-    conn.close()
+    return airport_registry.get_airport_registry().name(faa)
 
-    if not df.empty:
-        return df["name"].iloc[0]
-    else:
-        return faa  # Fallback if no record found
 
+def get_flight_statistics(store=None):
+    # Summary tables are used when they are up to date, otherwise the statistics are computed live
+    routes = aggregates.query_aggregate(
+        'agg_routes', 'SELECT origin, dest, num_flights, min_distance, max_distance FROM agg_routes ORDER BY origin, dest'
+    )
+    carriers = aggregates.query_aggregate(
+        'agg_carrier_month', 'SELECT carrier, SUM(num_flights) AS num_flights FROM agg_carrier_month GROUP BY carrier ORDER BY carrier'
+    )
 
-def get_flight_statistics():
-    query = """
-        SELECT origin, dest, carrier, distance
-        FROM flights
-    """
-    df = get_df_from_database(query)
+    if routes is not None and carriers is not None and not routes.empty:
+        total_flights = int(routes['num_flights'].sum())
+        unique_destinations = routes['dest'].nunique()
 
-    if df.empty:
-        st.warning("No flight data available.")
-        return {}
+        # Longest and shortest flights
+        longest_flight = routes.loc[routes['max_distance'].idxmax()]
+        shortest_flight = routes.loc[routes['min_distance'].idxmin()]
 
-    total_flights = len(df)
-    unique_destinations = df['dest'].nunique()
+        route_counts = routes.set_index(['origin', 'dest'])['num_flights']
+        carrier_counts = carriers.set_index('carrier')['num_flights'].sort_values(ascending=False, kind='stable')
+    elif store is not None:
+        if len(store) == 0:
+            st.warning("No flight data available.")
+            return {}
 
+        total_flights = len(store)
+        unique_destinations = store.nunique('dest')
 
+        # Longest and shortest flights
+        distance = store.columns['distance']
+        longest_flight = store.frame(['origin', 'dest'], [np.nanargmax(distance)]).iloc[0]
+        shortest_flight = store.frame(['origin', 'dest'], [np.nanargmin(distance)]).iloc[0]
 
-    # Longest and shortest flights
-    longest_flight = df.loc[df['distance'].idxmax()]
-    shortest_flight = df.loc[df['distance'].idxmin()]
+        route_counts = store.group_count(['origin', 'dest']).set_index(['origin', 'dest'])['count']
+        carrier_counts = store.group_count('carrier').set_index('carrier')['count'].sort_values(ascending=False, kind='stable')
+    else:
+        query = """
+            SELECT origin, dest, carrier, distance
+            FROM flights
+        """
+        df = database.query(query)
+
+        if df.empty:
+            st.warning("No flight data available.")
+            return {}
+
+        total_flights = len(df)
+        unique_destinations = df['dest'].nunique()
+
+        # Longest and shortest flights
+        longest_flight = df.loc[df['distance'].idxmax()]
+        shortest_flight = df.loc[df['distance'].idxmin()]
+
+        route_counts = df.groupby(["origin", "dest"]).size()
+        carrier_counts = df['carrier'].value_counts()
 
     longest_flight = f"{get_airport_name(longest_flight['origin'])} ({longest_flight['origin']})  → {get_airport_name(longest_flight['dest'])} ({longest_flight['dest']})"
     shortest_flight = f"{get_airport_name(shortest_flight['origin'])} ({shortest_flight['origin']})  → {get_airport_name(shortest_flight['dest'])} ({shortest_flight['dest']})"
 
     # Calculate the most and least frequent routes by grouping on both origin and destination
-    route_counts = df.groupby(["origin", "dest"]).size()
     most_frequent_route_tuple = route_counts.idxmax()  # (origin, dest)
     least_frequent_route_tuple = route_counts.idxmin()  # (origin, dest)
 
@@ -72,7 +118,6 @@ def get_flight_statistics():
 
 
     # Compute highest and lowest volume carriers
-    carrier_counts = df['carrier'].value_counts()
     highest_volume_carrier = carrier_counts.idxmax()
     lowest_volume_carrier = carrier_counts.idxmin()
     highest_volume_carrier_name = get_carrier_name(highest_volume_carrier)
@@ -97,7 +142,7 @@ def display_flight_statistics():
     Displays flight statistics in a neat two-column table.
     """
     st.subheader("Flight Statistics (All Flights)")
-    stats = get_flight_statistics()
+    stats = get_flight_statistics(store=get_store())
     
     # Ensure highest/lowest volume carrier are strings
     highest_volume = stats["Highest Volume Carrier"]
@@ -143,7 +188,7 @@ def display_top_manufacturers_for_destination():
     
     # Retrieve only international airports (those with "international" in the name)
     airports_query = "SELECT faa, name FROM airports WHERE lower(name) LIKE '%international%'"
-    airports_df = get_df_from_database(airports_query)
+    airports_df = database.query(airports_query)
     
     # Let the user select a destination airport by name from the filtered international airports
     dest = st.selectbox("Select International Destination Airport", airports_df['name'], index=0, placeholder="Enter destination name")
@@ -151,36 +196,13 @@ def display_top_manufacturers_for_destination():
         # Retrieve the FAA code for the selected destination
         faa = airports_df[airports_df['name'] == dest]['faa'].item()
         
-        # Query flights with the selected destination FAA code
-        query_flights = f"SELECT tailnum FROM flights WHERE dest = '{faa}'"
-        flights_df = get_df_from_database(query_flights)
-        
-        if flights_df.empty:
-            st.warning("No flights found for this destination.")
-            return
-        
-        # Retrieve planes data including manufacturer information
-        query_planes = "SELECT tailnum, manufacturer FROM planes"
-        planes_df = get_df_from_database(query_planes)
-        
-        # Merge flights and planes data on tailnum
-        merged_df = pd.merge(flights_df, planes_df, on="tailnum", how="left")
+        # Top 5 manufacturers by flights with their share, looked up in the cached destination x manufacturer table
+        top5 = part3.top_manufacturers(faa, k=5)
         
-        if merged_df.empty or merged_df['manufacturer'].isnull().all():
-            st.warning("No manufacturer data available for flights to this destination.")
+        if top5.empty:
+            st.warning("No flights with manufacturer data found for this destination.")
             return
         
-        # Count the number of flights per manufacturer
-        manufacturer_counts = merged_df['manufacturer'].value_counts().reset_index()
-        manufacturer_counts.columns = ['manufacturer', 'num_flights']
-        
-        # Calculate the percentage of flights for additional insight
-        total = manufacturer_counts['num_flights'].sum()
-        manufacturer_counts['percentage'] = (manufacturer_counts['num_flights'] / total * 100).round(2)
-        
-        # Select the top 5 manufacturers
-        top5 = manufacturer_counts.head(5)
-        
         # Create a bar chart using Plotly Express with extra hover data
         fig = px.bar(
             top5, 
@@ -209,14 +231,23 @@ def display_airline_market_share():
     leveraging the airlines table for airline names.
     """
 
-    query = """
+    df = aggregates.query_aggregate('agg_carrier_month', """
         SELECT a.name AS airline_name,
-               COUNT(*) AS num_flights
-        FROM flights f
-        JOIN airlines a ON f.carrier = a.carrier
+               SUM(m.num_flights) AS num_flights
+        FROM agg_carrier_month m
+        JOIN airlines a ON m.carrier = a.carrier
         GROUP BY a.name
-    """
-    df = get_df_from_database(query)
+    """)
+
+    if df is None:
+        query = """
+            SELECT a.name AS airline_name,
+                   COUNT(*) AS num_flights
+            FROM flights f
+            JOIN airlines a ON f.carrier = a.carrier
+            GROUP BY a.name
+        """
+        df = database.query(query)
 
     if df.empty:
         st.warning("No flight data available.")
@@ -261,39 +292,50 @@ def display_flights_by_month():
     st.header("Monthly Flight Trends", divider="gray")
     
     # Retrieve distinct airline names from the airlines table.
-    query_airlines = "SELECT DISTINCT name FROM airlines"
-    airlines_df = get_df_from_database(query_airlines)
-    airline_options = ["All Airlines"] + sorted(airlines_df["name"].tolist())
+    airlines = dimensions.airlines()
+    airline_options = ["All Airlines"] + sorted(set(airlines.columns["name"]))
     
     # Allow user to filter by airline.
     selected_airline = st.selectbox("Filter by Airline", airline_options, index=0)
     
     # Query flights to count flights by month.
     if selected_airline == "All Airlines":
-        query_flights = """
-            SELECT month, COUNT(*) AS num_flights 
-            FROM flights 
-            GROUP BY month 
+        df = aggregates.query_aggregate('agg_carrier_month', """
+            SELECT month, SUM(num_flights) AS num_flights
+            FROM agg_carrier_month
+            GROUP BY month
             ORDER BY month
-        """
-        df = get_df_from_database(query_flights)
+        """)
+        if df is None:
+            query_flights = """
+                SELECT month, COUNT(*) AS num_flights 
+                FROM flights 
+                GROUP BY month 
+                ORDER BY month
+            """
+            df = database.query(query_flights)
     else:
         # Retrieve the carrier code corresponding to the selected airline.
-        query_carrier = f"SELECT carrier FROM airlines WHERE name = '{selected_airline}'"
-        carrier_df = get_df_from_database(query_carrier)
-        if carrier_df.empty:
+        carrier_code = airlines.key_for("name", selected_airline)
+        if carrier_code is None:
             st.warning("Selected airline not found in airlines table.")
             return
-        carrier_code = carrier_df.iloc[0]["carrier"]
         
-        query_flights = f"""
-            SELECT month, COUNT(*) AS num_flights 
-            FROM flights 
-            WHERE carrier = '{carrier_code}'
-            GROUP BY month 
+        df = aggregates.query_aggregate('agg_carrier_month', """
+            SELECT month, num_flights
+            FROM agg_carrier_month
+            WHERE carrier = ?
             ORDER BY month
-        """
-        df = get_df_from_database(query_flights)
+        """, (carrier_code,))
+        if df is None:
+            query_flights = """
+                SELECT month, COUNT(*) AS num_flights 
+                FROM flights 
+                WHERE carrier = ?
+                GROUP BY month 
+                ORDER BY month
+            """
+            df = database.query(query_flights, (carrier_code,))
     
     if df.empty:
         st.warning("No flight data available for the selected criteria.")
@@ -319,14 +361,16 @@ def display_flights_by_month():
 
 def display_plane_statistics():
     """
-    Updates the planes table with calculated average speeds
-    and displays a bar chart showing the top 10 fastest plane models.
+    Displays a bar chart showing the top 10 fastest plane models.
+    The speeds are written to the planes table by the plane_speed job (python jobs.py), the dashboard only reads them.
     """
-    part3.calculate_average_plane_speed()
-
-    # Retrieve the updated planes data (including manufacturer)
+    # Retrieve the planes data with the computed speeds (including manufacturer)
     query = "SELECT tailnum, model, speed, manufacturer FROM planes"
-    planes_df = get_df_from_database(query)
+    planes_df = database.query(query)
+
+    if planes_df['speed'].isnull().all():
+        st.info("Plane speeds have not been computed yet. Run `python jobs.py plane_speed` to compute them.")
+        return
 
     # Group by both model and manufacturer to get a single average speed per (model, manufacturer)
     planes_grouped = planes_df.groupby(["model", "manufacturer"], as_index=False)["speed"].mean()
@@ -364,151 +408,174 @@ def display_plane_statistics():
 
 
 
-#########################################################################################
+def display_density_analysis():
+    """
+    Density of flights over two variables as a grid heatmap or hexbin, with the mean and median per distance or
+    wind column. The bins are computed by binning.py in chunks and cached, so the chart does not grow with the data.
+    """
+    st.header("Flight Density Analysis", divider="gray")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        name = st.selectbox('Analysis', list(binning.DENSITY_PLOTS), key='density_plot',
+                            format_func=lambda n: n.replace('_', ' ').capitalize())
+    with col2:
+        kind = st.radio('Bins', ['grid', 'hex'], horizontal=True, key='density_kind',
+                        format_func=lambda k: 'Grid' if k == 'grid' else 'Hexbin')
+
+    try:
+        stats = binning.density(name, kind=kind)
+    except sqlite3.OperationalError:
+        # wind_effect only exists once part3.compute_wind_effect_on_flights has run
+        st.info("This analysis needs the wind effect per flight. Run `part3.compute_wind_effect_on_flights()` first.")
+        return
 
+    if stats.count.sum() == 0:
+        st.text("No flights to show.")
+        return
 
+    _, x_label, y_label = binning.DENSITY_PLOTS[name]
 
-def get_df_from_database(query):
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description])
-    return df
+    fig = go.Figure()
+    if kind == 'grid':
+        grid = stats.grid().T.astype(float)
+        grid[grid == 0] = np.nan
+        x = (stats.bins.x_edges[:-1] + stats.bins.x_edges[1:]) / 2
+        y = (stats.bins.y_edges[:-1] + stats.bins.y_edges[1:]) / 2
+        fig.add_trace(go.Heatmap(x=x, y=y, z=np.log10(grid), customdata=grid, colorscale='Viridis',
+                                 colorbar=dict(title='Flights (log10)'),
+                                 hovertemplate='Flights: %{customdata}<extra></extra>'))
+        profile = stats.profile()
+        fig.add_trace(go.Scatter(x=profile['x'], y=profile['mean'], mode='lines', name='Mean', line=dict(color='red')))
+        fig.add_trace(go.Scatter(x=profile['x'], y=profile['p50'], mode='lines', name='Median', line=dict(color='orange')))
+    else:
+        cells = stats.frame()
+        fig.add_trace(go.Scatter(
+            x=cells['x'], y=cells['y'], mode='markers',
+            marker=dict(symbol='hexagon', size=9, color=np.log10(cells['count']), colorscale='Viridis',
+                        colorbar=dict(title='Flights (log10)')),
+            customdata=cells['count'], hovertemplate='Flights: %{customdata}<extra></extra>', showlegend=False))
+
+    fig.update_layout(xaxis_title=x_label, yaxis_title=y_label, legend=dict(orientation='h', y=1.1))
+    st.plotly_chart(fig, use_container_width=True)
 
-def get_faa(name):
-    query = f'SELECT faa,name FROM airports'
-    df = get_df_from_database(query)
 
-    row = df.loc[df['name'] == name, 'faa'].item()
-    return row
 
-def get_carrier_name(carrier):
-    query = f'SELECT * FROM airlines'
-    df = get_df_from_database(query)
+#########################################################################################
 
-    name = df[df['carrier'] == carrier]['name']
-    
-    return name
+
+
+def get_faa(name):
+    return airport_registry.get_airport_registry().faa_for(name)
+
+def get_carrier_name(carrier):
+    """Full airline name for a carrier code, the code itself if the airline is unknown."""
+    return dimensions.airlines().get(carrier, 'name', carrier)
 
 def flight_info(departure, arrival):
-    query = f'SELECT origin,dest,dep_time,flight,year,month,day,carrier FROM flights'
-    df = get_df_from_database(query)
-    
-    df = df[df['origin'] == get_faa(departure)]
-    df = df[df['dest'] == get_faa(arrival)]
+    df = (FlightQuery()
+          .select('origin', 'dest', 'dep_time', 'flight', 'year', 'month', 'day', 'carrier')
+          .where(origin=get_faa(departure), dest=get_faa(arrival))
+          .fetch())
     
     return df
 
 def get_other_airports():
     
-    query = f'SELECT faa,name FROM airports'
-
-    df = get_df_from_database(query)
+    registry = airport_registry.get_airport_registry()
     nyc_airports = part3.get_nyc_airports()
 
-    # df = pd.concat([df1, df2]).drop_duplicates(keep=False)
-    df = df[~df['name'].isin(nyc_airports)]
-
-    return list(df['name'])
+    return list(registry.names[~np.isin(registry.names, nyc_airports)])
 
 def flights_per_airline(airport):
-    query = f'SELECT carrier,dest,origin FROM flights'
-    query2 = f'SELECT carrier,name FROM airlines'
-    df = get_df_from_database(query)
-    df2 = get_df_from_database(query2)
-
-    df = df[df['dest']== airport]
+    df = FlightQuery().select('carrier', 'dest', 'origin').where(dest=airport).fetch()
     
     st.dataframe(df)
     
-    rtn_df = pd.DataFrame(columns=['carrier','name','num_flights'],index=None)
-
-    airline_set = set(df['carrier'])
-    for id in airline_set:
-        num = df[df['carrier']==id].size
-        name = df2[df2['carrier']==id]['name'].item()
-        
-        new_row = pd.DataFrame({'carrier': [id], 'name': [name], 'num_flights': [num]})
-        rtn_df = pd.concat([rtn_df,new_row])
-    
-    rtn_df = rtn_df.reset_index(drop=True)
+    rtn_df = (FlightQuery()
+              .join('airlines')
+              .select('carrier', 'airlines.name')
+              .count()
+              .where(dest=airport)
+              .group_by('carrier', 'airlines.name')
+              .fetch())
 
     return rtn_df
 
 def in_usa(name=None,faa=None):
-    if name is not None:
-        query = f'SELECT name,tzone FROM airports'
-        df = get_df_from_database(query)
-        row = df[df['name'] == name]
-
-    elif faa is not None:
-        query = f'SELECT faa,tzone FROM airports'
-        df = get_df_from_database(query)
-        row = df[df['faa'] == faa]
+    return airport_registry.get_airport_registry().in_usa(faa=faa, name=name)
     
-    time_zone = row['tzone'].item()
-
-    if time_zone[:7] != 'America':
-        return False
+def average_daily_flights(airport=None, store=None):
+    if airport is not None:
+        df = aggregates.query_aggregate(
+            'agg_origin_day', 'SELECT year, month, day, num_flights FROM agg_origin_day WHERE origin = ?', (get_faa(airport),)
+        )
     else:
-        return True
-    
-def average_daily_flights(airport=None):
-    query = f'SELECT month, day,origin FROM flights'
-    df = get_df_from_database(query)
+        df = aggregates.query_aggregate(
+            'agg_origin_day',
+            'SELECT year, month, day, SUM(num_flights) AS num_flights FROM agg_origin_day GROUP BY year, month, day'
+        )
 
-    if airport is not None:
-        faa = get_faa(airport)
-        df = df[df['origin'] == faa]
+    if df is None and store is not None:
+        mask = store.mask(origin=get_faa(airport)) if airport is not None else None
+        df = store.group_count(['year', 'month', 'day'], mask, name='num_flights')
+    elif df is None:
+        query = FlightQuery().select('year', 'month', 'day').count().group_by('year', 'month', 'day')
+
+        if airport is not None:
+            query.where(origin=get_faa(airport))
 
-    total_days = df.groupby(['month', 'day']).ngroups  
+        df = query.fetch()
 
-    total_flights = len(df.index)
+    total_days = len(df.index)
+
+    total_flights = df['num_flights'].sum()
 
     daily_average = round(total_flights / total_days, 2)
 
     return int(daily_average)
 
     
-def average_monthly_flights(airport=None):
-    query = f'SELECT month,origin FROM flights'
-    df = get_df_from_database(query)
-
+def average_monthly_flights(airport=None, store=None):
     if airport is not None:
-        faa = get_faa(airport)
-        df = df[df['origin'] == faa]
+        df = aggregates.query_aggregate(
+            'agg_origin_day',
+            'SELECT year, month, SUM(num_flights) AS num_flights FROM agg_origin_day WHERE origin = ? GROUP BY year, month',
+            (get_faa(airport),)
+        )
+    else:
+        df = aggregates.query_aggregate(
+            'agg_carrier_month',
+            'SELECT year, month, SUM(num_flights) AS num_flights FROM agg_carrier_month GROUP BY year, month'
+        )
 
-    months = set(df['month'])
-    
+    if df is None and store is not None:
+        mask = store.mask(origin=get_faa(airport)) if airport is not None else None
+        df = store.group_count(['year', 'month'], mask, name='num_flights')
+    elif df is None:
+        query = FlightQuery().select('year', 'month').count().group_by('year', 'month')
+
+        if airport is not None:
+            query.where(origin=get_faa(airport))
 
-    current_month = 1
-    total_size = 0
-    for i in months:
-        df_month = df[df['month'] == current_month]
-        total_size += len(df_month.index)
-        current_month += 1
+        df = query.fetch()
 
-    average = round(total_size / len(months),2)
+    total_size = df['num_flights'].sum()
+
+    average = round(total_size / len(df.index),2)
     return int(average)
 
 # def get_nyc_names():
 #     nyc_lst = ['FOK','ISP','FRG','JFK','LGA','HPN','MGJ','SWF','BGM','ELM','ITH','JHW',
 #                'DKK','BUF','IAG','ROC','SYC','RME','ALB','SCH','GFL','ART','LKP','SLK','PBG','MSS','OGS']
 #     query = f'SELECT name, faa FROM airports'
-#     df = get_df_from_database(query)
+#     df = database.query(query)
 
 #     df = df[df['faa'].isin(nyc_lst)]
 #     return list(df['name'])
 
 def get_lat_lon(faa):
-    query = f'SELECT faa,lat,lon FROM airports'
-    df = get_df_from_database(query)
-
-    airport = df[df['faa'] == faa]
-    lat = airport['lat'].item()
-    lon = airport['lon'].item()
-
-    return lat,lon
+    return airport_registry.get_airport_registry().lat_lon(faa)
 
 def get_flight_path(row):
     origin = row[0]
@@ -554,8 +621,8 @@ def get_flight_path(row):
 
 def fill_departure_time(name):
     faa = get_faa(name)
-    query = f'SELECT dep_time, sched_dep_time, dep_delay FROM flights WHERE origin = "{faa}"'
-    df = get_df_from_database(query)
+    query = 'SELECT dep_time, sched_dep_time, dep_delay FROM flights WHERE origin = ?'
+    df = database.query(query, (faa,))
 
     for _,row in df.iterrows():
         # If departure time is unknown, calculate based on scheduled departure time and delay time
@@ -574,11 +641,13 @@ def get_daily_flight_info(month,day,faa=None):
     day = st.text_input('Day')
 
     if faa is not None:
-        query = f'SELECT * FROM flights WHERE month="{month}" and day="{day}" and origin="{faa}"'
+        query = 'SELECT * FROM flights WHERE month = ? and day = ? and origin = ?'
+        params = (month, day, faa)
     else:
-        query = f'SELECT * FROM flights WHERE month="{month}" and day="{day}"'
+        query = 'SELECT * FROM flights WHERE month = ? and day = ?'
+        params = (month, day)
 
-    df = get_df_from_database(query)
+    df = database.query(query, params)
     st.dataframe(df)
 
 
@@ -588,25 +657,21 @@ def get_daily_flight_info(month,day,faa=None):
 
 def get_flight_delays(airport_faa, month, day):
     """Fetch departure flight delays for a given airport."""
-    query = f"""
+    query = """
         SELECT dep_time, dep_delay, sched_dep_time
         FROM flights
-        WHERE month = {month} AND day = {day} 
-        AND origin = '{airport_faa}' 
+        WHERE month = ? AND day = ? 
+        AND origin = ? 
         AND dep_delay IS NOT NULL
     """
-    df = get_df_from_database(query)
+    df = database.query(query, (month, day, airport_faa))
     return df if 'dep_time' in df.columns else pd.DataFrame()
 
 
 def get_weather_info(airport_faa, month, day):
     """Fetch weather info for a selected airport and date."""
-    query = f"""
-        SELECT temp, wind_speed, visib
-        FROM weather
-        WHERE month = {month} AND day = {day} AND origin = '{airport_faa}'
-    """
-    return get_df_from_database(query)
+    weather_df = weather_join.day_weather(airport_faa, month, day)
+    return weather_df[['temp', 'wind_speed', 'visib']].reset_index(drop=True)
 
 def display_delay_chart(df):
     """Display average delay as a function of time, handling missing data safely."""
@@ -658,12 +723,10 @@ def display_delay_chart(df):
 def display_weather_info(selected_airport, month, day):
     """Displays weather info for an airport and date. Falls back to temp_min/avg/max if temp is missing."""
     
-    query = f"""
-        SELECT temp, temp_min, temp_avg, temp_max, wind_speed, visib
-        FROM weather
-        WHERE month = {month} AND day = {day} AND origin = '{selected_airport}'
-    """
-    weather_df = get_df_from_database(query)
+    # The day's observations come from the in-memory weather index, temp_min/avg/max only exist once part4 filled them
+    weather_df = weather_join.day_weather(selected_airport, month, day)
+    columns = ['temp', 'temp_min', 'temp_avg', 'temp_max', 'wind_speed', 'visib']
+    weather_df = weather_df[[c for c in columns if c in weather_df.columns]]
 
     st.subheader("Weather Forecast")
 
@@ -807,24 +870,30 @@ def time_based_statistics():
     #  Use a separate expander outside of the first one
     with st.expander("Delays across JFK, LGA and EWR", expanded=False):
         st.markdown("### **Compare Delays Across JFK, LGA and EWR**")  # Styled title inside
-        display_departure_delay_comparison_custom(month, day)
+        display_departure_delay_comparison_custom(selected_date.year, month, day)
 
 
 
 
-def display_departure_delay_comparison_custom(month, day):
+def display_departure_delay_comparison_custom(year, month, day):
     """Custom comparison of delays across JFK, LGA, EWR for a selected date."""
     nyc_airports_faa = ['JFK', 'LGA', 'EWR']
-    df = get_flight_delays_multiple(nyc_airports_faa, month, day)
+    df_grouped = aggregates.hourly_delays(nyc_airports_faa, year, month, day)
 
-    if df.empty:
+    if df_grouped is None:
+        df = get_flight_delays_multiple(nyc_airports_faa, year, month, day)
+
+        if df.empty:
+            st.warning(f"No flight delay data available for {month}/{day}.")
+            return
+
+        df['hour_numeric'] = ((df['dep_time'] // 100) % 24).astype(int)    # dep_time is stored as REAL
+        df['hour_label'] = df['hour_numeric'].apply(lambda h: f"{h:02d}:00")
+        df_grouped = df.groupby(['hour_numeric', 'hour_label', 'origin'])['dep_delay'].mean().reset_index()
+    elif df_grouped.empty:
         st.warning(f"No flight delay data available for {month}/{day}.")
         return
 
-    df['hour_numeric'] = (df['dep_time'] // 100) % 24
-    df['hour_label'] = df['hour_numeric'].apply(lambda h: f"{h:02d}:00")
-    df_grouped = df.groupby(['hour_numeric', 'hour_label', 'origin'])['dep_delay'].mean().reset_index()
-
     color_map = {'JFK': '#2A61C6', 'LGA': '#90C5FD', 'EWR': '#000080'}
 
     fig = px.line(
@@ -869,17 +938,17 @@ def display_departure_delay_comparison_custom(month, day):
 ################ Delay analysis ################
 
 
-def get_flight_delays_multiple(airport_faa_list, month, day):
+def get_flight_delays_multiple(airport_faa_list, year, month, day):
     """Fetches flight delays for multiple departure airports on a given date."""
-    airport_faa_str = "', '".join(airport_faa_list)  # Format for SQL IN clause
+    placeholders = ', '.join('?' for _ in airport_faa_list)  # One bound parameter per airport in the IN clause
     query = f"""
         SELECT origin, dep_time, dep_delay
         FROM flights
-        WHERE month = {month} AND day = {day}
-        AND origin IN ('{airport_faa_str}')
+        WHERE year = ? AND month = ? AND day = ?
+        AND origin IN ({placeholders})
         AND dep_delay IS NOT NULL
     """
-    df = get_df_from_database(query)
+    df = database.query(query, (year, month, day, *airport_faa_list))
     
     if df.empty or 'dep_time' not in df.columns:
         return pd.DataFrame()  # Return an empty DataFrame if no data is found
@@ -920,17 +989,13 @@ def initialize_page():
 
 
     # Load airports data
-    query = 'SELECT faa, name, lat, lon, tzone FROM airports'
-    all_airports_df = get_df_from_database(query)
+    all_airports_df = database.query(figure_cache.AIRPORTS_QUERY)
 
     # Create Page Title
     st.title('Flight Information Dashboard')
 
     display_flight_statistics()  # Add statistics section
     display_airline_market_share() # show airline flights didtribution
-    # Load airports data
-    query = 'SELECT faa, name, lat, lon, tzone FROM airports'
-    all_airports_df = get_df_from_database(query)
 
    
 
@@ -961,13 +1026,13 @@ def initialize_page():
             airport = st.selectbox('Select Departing Airport', names, index=None, placeholder='Enter airport name')
             if airport:
                 st.session_state.delay_info_ap = airport
-                st.text(f'Average Daily Flights: {round(average_daily_flights(airport))} flights')
-                st.text(f'Average Monthly Flights: {round(average_monthly_flights(airport))} flights')
+                st.text(f'Average Daily Flights: {round(average_daily_flights(airport, store=get_store()))} flights')
+                st.text(f'Average Monthly Flights: {round(average_monthly_flights(airport, store=get_store()))} flights')
 
 
         if st.session_state.fetch_general_info:
-            st.text(f'Average Daily Flights from NYC: {round(average_daily_flights())} flights')
-            st.text(f'Average Monthly Flights from NYC: {round(average_monthly_flights())} flights')
+            st.text(f'Average Daily Flights from NYC: {round(average_daily_flights(store=get_store()))} flights')
+            st.text(f'Average Monthly Flights from NYC: {round(average_monthly_flights(store=get_store()))} flights')
 
     # Map of Airports Section
     st.header('Map of Airports', divider='gray')
@@ -990,15 +1055,8 @@ def initialize_page():
             st.session_state.map_type = 'inter'
             st.session_state.map_airport_loc = None
 
-    # Determine which map to show
-    if st.session_state.map_airport_loc is not None:
-        fig = st.session_state.map_airport_loc
-    elif st.session_state.map_type == 'inter':
-        fig = part1.all_airports(all_airports_df)
-    else:
-        fig = part1.only_usa(all_airports_df)
-
-    st.plotly_chart(fig, key='main_map')
+    # Filled in below, once the selected airport of this run is known
+    main_map = st.empty()
 
     # Dropdown for selecting an airport location
     col3, col4 = st.columns([0.9, 0.1])
@@ -1013,19 +1071,32 @@ def initialize_page():
             st.session_state.selected_airport = selected
             temp_df = all_airports_df[all_airports_df['name'] == selected]
             codes = temp_df['faa'].item()
-            if in_usa(selected):
-                st.session_state.map_airport_loc = part1.flight_paths([codes], temp_df)
-            else:
-                st.session_state.map_airport_loc = part1.flight_paths([codes], temp_df)
 
-            st.plotly_chart(st.session_state.map_airport_loc)
+            # The selected airport is drawn over the cached base map of its region, the base layers are not rebuilt
+            st.session_state.map_type = 'usa' if in_usa(selected) else 'inter'
+            st.session_state.map_airport_loc = figure_cache.highlight(st.session_state.map_type, temp_df, airports_df=all_airports_df)
+
+            st.plotly_chart(part1.flight_paths([codes], temp_df))
+
+            # Airports near the selected one, found through the spatial index instead of scanning every airport
+            radius = st.slider('Show airports within (miles)', 0, 500, 0, step=25)
+            if radius > 0:
+                st.plotly_chart(part1.nearby_airports_map(all_airports_df, codes, radius, airport_registry.get_airport_index()))
 
     with col4:
         if st.button('Clear'):
             st.session_state.map_airport_loc = None
             st.session_state.selected_airport = None
             st.session_state.map_type = 'inter'
-            st.plotly_chart(part1.all_airports(all_airports_df), key='reset_map')
+
+    # Determine which map to show
+    if st.session_state.map_airport_loc is not None:
+        fig = st.session_state.map_airport_loc
+    else:
+        # Base maps are built once per airports data version and served from the figure cache
+        fig = figure_cache.base_map(st.session_state.map_type, all_airports_df)
+
+    main_map.plotly_chart(fig, key='main_map')
 
     # # Airport Specific Details Section
     # st.header('Airport Specific Details', divider='gray')
@@ -1038,17 +1109,32 @@ def initialize_page():
 
     # Airlines' Average Departure Delays Section
     st.header("Airlines' Average Departure Delays", divider='gray')
-    delay_data = part3.average_departure_delay()
+    col1, col2 = st.columns(2)
+    with col1:
+        delay_origin = st.selectbox('Departure Airport', ['All', 'JFK', 'LGA', 'EWR'], index=0, key='delay_origin')
+    with col2:
+        delay_month = st.selectbox('Month', ['All'] + list(range(1, 13)), index=0, key='delay_month')
 
-    # Converts to a pandas dataframe so it can be used for px.bar
-    delay_df = pd.DataFrame(list(delay_data.items()), columns=['airline_name', 'average_departure_delay'])
+    # Mean, median, tail percentiles and on-time rate per carrier from one cached group-by
+    stats = delay_stats.carrier_delay_stats(
+        origin=None if delay_origin == 'All' else delay_origin,
+        month=None if delay_month == 'All' else delay_month,
+        use_store=USE_FLIGHT_STORE
+    )
+    delay_df = stats.rename(columns={'mean': 'average_departure_delay'})
+    delay_df['average_departure_delay'] = delay_df['average_departure_delay'].round(2)
+    delay_df['on_time_rate'] = (delay_df['on_time_rate'] * 100).round(1)
 
     # Initializes the figure
     fig = px.bar(delay_df, 
                  x="average_departure_delay", 
                  y="airline_name", orientation="h", 
                  title="Average Departure Delay by Airline", 
-                 labels={"average_departure_delay": "Average Departure Delay (minutes)", "airline_name": "Airline"})
+                 hover_data={"median": ':.0f', "p90": ':.0f', "p99": ':.0f', "on_time_rate": ':.1f', "delay_count": True, "missing": True},
+                 labels={"average_departure_delay": "Average Departure Delay (minutes)", "airline_name": "Airline",
+                         "median": "Median (min)", "p90": "90th percentile (min)", "p99": "99th percentile (min)",
+                         "on_time_rate": f"On time (%, ≤{delay_stats.ON_TIME_MINUTES} min)", "delay_count": "Flights with delay data",
+                         "missing": "Flights without delay data"})
     
     # Displays the figure
     st.plotly_chart(fig, use_container_width=True)
@@ -1070,6 +1156,14 @@ def initialize_page():
             st.text(f'Departure Time: {dep_hour}:{dep_min}')
             st.text(f'Date: {date}')
             st.text(f'Airline: {carrier}')
+
+            matrix = distances.get_distance_matrix()
+            if matrix is not None and origin in matrix and dest in matrix:
+                st.text(f'Great-circle Distance: {round(matrix.distance(origin, dest))} miles')
+
+            usage = {plane_type: n for plane_type, n in part3.get_airplane_usage(origin, dest).items() if n > 0}
+            if usage:
+                st.text('Aircraft on this route: ' + ', '.join(f'{plane_type} ({n} flights)' for plane_type, n in usage.items()))
         else:
             st.text('Please enter flight details in sidebar. Additional flight info will appear here once details are entered.')
 
@@ -1169,6 +1263,7 @@ def main():
     display_flights_by_month()
     display_top_manufacturers_for_destination()
     display_plane_statistics()
+    display_density_analysis()
 
 
 if __name__ == '__main__':
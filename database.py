@@ -0,0 +1,401 @@
+import functools
+import os
+import sqlite3
+import threading
+import queue
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import pandas as pd
+
+
+
+DB_PATH = 'flights_database.db'
+POOL_SIZE = 4
+CACHE_MAX_BYTES = 64 * 1024 * 1024   # Upper bound on the memory held by cached query results
+
+# Pragmas applied to every pooled read connection
+READ_PRAGMAS = {
+    'query_only': 1,               # Reject any write that slips through a reader
+    'mmap_size': 268435456,        # Map up to 256 MB of the database file
+    'cache_size': -65536,          # 64 MB page cache (negative value is in KiB)
+    'temp_store': 'MEMORY',
+}
+
+# Pragmas applied to the single writer connection
+WRITE_PRAGMAS = {
+    'busy_timeout': 30000,
+    'cache_size': -65536,
+    'temp_store': 'MEMORY',
+}
+
+
+############# connection pool ############################
+
+class ConnectionPool:
+    """
+    A fixed-size pool of read-only SQLite connections that can be shared between threads.
+    Connections are created lazily and handed out one thread at a time.
+    """
+
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+        for name, value in READ_PRAGMAS.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+
+        # Pool is exhausted, wait for another thread to hand a connection back
+        return self._idle.get()
+
+    def release(self, conn):
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_writer = None
+_writer_lock = threading.RLock()
+
+
+def get_pool():
+    """Return the process-wide read connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, POOL_SIZE)
+    return _pool
+
+
+@contextmanager
+def read_connection():
+    """Borrow a read-only connection from the pool for the duration of a `with` block."""
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def get_writer():
+    """Return the single writer connection used by the derived-column jobs."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = sqlite3.connect(DB_PATH, check_same_thread=False)
+            for name, value in WRITE_PRAGMAS.items():
+                _writer.execute(f'PRAGMA {name} = {value}')
+    return _writer
+
+
+@contextmanager
+def write_connection():
+    """
+    Hold the writer connection for the duration of a `with` block.
+    Commits on success and rolls back if the block raises.
+    """
+    with _writer_lock:
+        conn = get_writer()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # Anything written here makes cached results stale straight away
+            get_cache().clear()
+
+
+def file_version():
+    """mtime and size of the database file, None if it does not exist. Changes with every committed write."""
+    try:
+        stat = os.stat(DB_PATH)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def versioned_cache(maxsize=None):
+    """
+    Decorator for functions that build something from the database, like the shared in-memory tables.
+    The result is kept per argument tuple and rebuilt once file_version() changes. All results of the older
+    version are dropped at that point, so nothing outdated stays referenced. At most maxsize argument tuples
+    are kept, least recently used first out (None: no limit). The wrapped function gets cache_clear().
+    """
+    def decorate(build):
+        entries = OrderedDict()     # argument tuple -> result, all built at version
+        state = {'version': None}
+        lock = threading.RLock()
+
+        @functools.wraps(build)
+        def cached(*args):
+            version = file_version()
+            with lock:
+                if version != state['version']:
+                    entries.clear()
+                    state['version'] = version
+                if args in entries:
+                    entries.move_to_end(args)
+                    return entries[args]
+
+                value = build(*args)
+                entries[args] = value
+                if maxsize is not None and len(entries) > maxsize:
+                    entries.popitem(last=False)
+                return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+                state['version'] = None
+
+        cached.cache_clear = cache_clear
+        return cached
+    return decorate
+
+
+def close_all():
+    """Close every pooled reader and the writer connection."""
+    global _pool, _writer
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    get_cache().close()
+
+
+############# query result cache ############################
+
+class QueryCache:
+    """
+    Process-wide LRU cache of query results keyed on normalized SQL plus parameters.
+    The cache is bounded by the memory of the stored DataFrames and is emptied whenever the
+    database changes, detected through PRAGMA data_version and the file's mtime and size.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (DataFrame, size in bytes)
+        self._bytes = 0
+        self._version = None
+        self._watcher = None            # Dedicated connection so data_version sees commits from every other connection
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(sql, params):
+        return ' '.join(sql.split()), tuple(params)
+
+    def _current_version(self):
+        try:
+            stat = os.stat(self.db_path)
+            file_version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_version = None
+
+        if self._watcher is None:
+            self._watcher = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+        data_version = self._watcher.execute('PRAGMA data_version').fetchone()[0]
+
+        return data_version, file_version
+
+    def _check_version(self):
+        """Drop every entry if the database changed since the last lookup. Caller holds the lock."""
+        version = self._current_version()
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key):
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Callers are free to modify what they get back, so never hand out the cached object itself
+            return entry[0].copy()
+
+    @property
+    def version(self):
+        """The database version the cached entries belong to, taken before running a query that will be put()."""
+        with self._lock:
+            return self._version
+
+    def put(self, key, df, version):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            # Skip results that were read while the database was being changed
+            self._check_version()
+            if version is None or version != self._version:
+                return
+
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df.copy(), size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = None
+
+    def close(self):
+        self.clear()
+        with self._lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide query result cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryCache(DB_PATH, CACHE_MAX_BYTES)
+    return _cache
+
+
+def cache_stats():
+    """Return hit/miss/eviction counters and the current size of the result cache."""
+    return get_cache().stats()
+
+
+def clear_cache():
+    get_cache().clear()
+
+
+############# instrumented query API ############################
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(sql, elapsed, rows):
+    key = ' '.join(sql.split())
+    with _stats_lock:
+        entry = _stats.setdefault(key, {'calls': 0, 'total_time': 0.0, 'rows': 0})
+        entry['calls'] += 1
+        entry['total_time'] += elapsed
+        entry['rows'] += rows
+
+
+def query(sql, params=(), cache=True):
+    """
+    Run a read-only query on a pooled connection and return the result as a DataFrame.
+    Parameters are bound by SQLite, so values never need to be formatted into the SQL string.
+    Results are served from the result cache until the database changes, pass cache=False to always hit SQLite.
+    """
+    if cache:
+        key = QueryCache.make_key(sql, params)
+        df = get_cache().get(key)
+        if df is not None:
+            return df
+        version = get_cache().version
+
+    start = time.perf_counter()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            df = pd.DataFrame(cursor.fetchall(), columns=[x[0] for x in cursor.description])
+        finally:
+            cursor.close()
+    _record(sql, time.perf_counter() - start, len(df.index))
+
+    if cache:
+        get_cache().put(key, df, version)
+    return df
+
+
+def query_stats():
+    """Return a DataFrame with call count, total time and rows returned for every query issued so far."""
+    with _stats_lock:
+        rows = [{'sql': sql, **entry} for sql, entry in _stats.items()]
+    df = pd.DataFrame(rows, columns=['sql', 'calls', 'total_time', 'rows'])
+    if not df.empty:
+        df['avg_time'] = df['total_time'] / df['calls']
+        df = df.sort_values('total_time', ascending=False).reset_index(drop=True)
+    return df
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,121 @@
+import calendar
+import datetime
+import numpy as np
+import pandas as pd
+import database
+
+
+
+CUBE_KEYS = ('dest', 'origin', 'carrier')
+METRICS = ('flights', 'delayed', 'delay_count', 'delay_sum')
+
+# One row per (dest, origin, carrier, date) with the counts and delay sum of its flights.
+# delayed counts flights with a positive departure delay, delay_count those with any departure delay recorded.
+CUBE_QUERY = """
+    SELECT dest, origin, carrier, year, month, day,
+           COUNT(*) AS flights,
+           COUNT(CASE WHEN dep_delay > 0 THEN 1 END) AS delayed,
+           COUNT(dep_delay) AS delay_count,
+           TOTAL(dep_delay) AS delay_sum
+    FROM flights
+    WHERE dest IS NOT NULL AND origin IS NOT NULL AND carrier IS NOT NULL
+    GROUP BY dest, origin, carrier, year, month, day
+"""
+
+
+class DelayCube:
+    """
+    Flight and delay counts over dest x origin x carrier x day, stored sparsely: one row per
+    (dest, origin, carrier) combination that occurs, one column per day, as running totals along the days.
+    The total over any date range is then two lookups per combination, and a filter on dest/origin/carrier
+    only selects combination rows, so no query touches the flights table.
+    """
+
+    def __init__(self, df):
+        dates = pd.to_datetime(pd.DataFrame({'year': df['year'], 'month': df['month'], 'day': df['day']}))
+        self.start = dates.min().date() if len(df) else datetime.date(2013, 1, 1)
+        self.days = (dates.max().date() - self.start).days + 1 if len(df) else 0
+        day_index = (dates - pd.Timestamp(self.start)).dt.days.to_numpy()
+
+        combo_codes, combos = pd.factorize(pd.MultiIndex.from_frame(df[list(CUBE_KEYS)]))
+        self.keys = {key: combos.get_level_values(i).to_numpy(dtype=object) for i, key in enumerate(CUBE_KEYS)}
+
+        # prefix[m][c, d] is the total of metric m for combination c over the days before day d
+        self.prefix = {}
+        for metric in METRICS:
+            dtype = np.float64 if metric == 'delay_sum' else np.int64
+            grid = np.zeros((len(combos), self.days + 1), dtype=dtype)
+            grid[combo_codes, day_index + 1] = df[metric].to_numpy(dtype=dtype)
+            self.prefix[metric] = np.cumsum(grid, axis=1, out=grid)
+
+    def __len__(self):
+        return len(self.keys['dest'])
+
+    def _rows(self, filters):
+        """Positions of the combinations matching every filter, a list/tuple/set matches any of its values."""
+        rows = np.ones(len(self), dtype=bool)
+        for key, value in (filters or {}).items():
+            if key not in self.keys:
+                raise ValueError(f"Unknown filter '{key}', expected one of {', '.join(CUBE_KEYS)}")
+            values = list(value) if isinstance(value, (list, tuple, set, np.ndarray, pd.Series)) else [value]
+            rows &= np.isin(self.keys[key], values)
+        return np.flatnonzero(rows)
+
+    def _to_date(self, value):
+        if isinstance(value, tuple):
+            month, day = value
+            return datetime.date(self.start.year, month, day)
+        return pd.Timestamp(value).date()
+
+    def _day_bounds(self, date_range):
+        """Prefix column bounds [low, high) for an inclusive (start, end) date range, clipped to the cube."""
+        if date_range is None:
+            return 0, self.days
+        start, end = (self._to_date(d) for d in date_range)
+        low = min(max((start - self.start).days, 0), self.days)
+        high = min(max((end - self.start).days + 1, 0), self.days)
+        return low, max(low, high)
+
+    def years(self):
+        """Every calendar year the cube's days fall in, oldest first."""
+        if self.days == 0:
+            return []
+        last = self.start + datetime.timedelta(days=self.days - 1)
+        return list(range(self.start.year, last.year + 1))
+
+    def month_range(self, month, year=None):
+        """Inclusive (first day, last day) date range of a month, in the cube's first year by default."""
+        year = self.start.year if year is None else year
+        return datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+    def counts(self, filters=None, date_range=None):
+        """
+        Totals of every metric for the flights matching the filters within the date range.
+        params: filters on dest, origin and carrier (a value or a list of values),
+                inclusive (start, end) dates as datetime.date, anything pandas parses, or (month, day) tuples.
+        returns: dict with flights, delayed, delay_count and delay_sum.
+        """
+        rows = self._rows(filters)
+        low, high = self._day_bounds(date_range)
+
+        result = {}
+        for metric, prefix in self.prefix.items():
+            total = prefix[rows, high].sum() - prefix[rows, low].sum()
+            result[metric] = float(total) if metric == 'delay_sum' else int(total)
+        return result
+
+
+############# shared instance ############################
+
+@database.versioned_cache()
+def get_delay_cube():
+    """
+    Return the process-wide DelayCube.
+    It is built from one group-by over flights on first use and rebuilt when the database file changes.
+    """
+    return DelayCube(database.query(CUBE_QUERY, cache=False))
+
+
+def delay_counts(filters=None, date_range=None):
+    """Flight and delay totals for any dest/origin/carrier subset and date range, see DelayCube.counts."""
+    return get_delay_cube().counts(filters, date_range)
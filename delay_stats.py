@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import database
+import dimensions
+import flight_store
+from queries import FlightQuery
+
+
+
+ON_TIME_MINUTES = 15              # A departure at most this late counts as on time
+QUANTILES = (0.5, 0.9, 0.99)
+STATS_COLUMNS = ['carrier', 'airline_name', 'flights', 'delay_count', 'missing',
+                 'mean', 'median', 'p90', 'p99', 'on_time_rate']
+
+
+def _as_key(value):
+    """Normalizes an optional filter (None, a value or a list of values) to something hashable."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, np.ndarray, pd.Series)):
+        return tuple(sorted(value))
+    return (value,)
+
+
+def summarize(df, on_time=ON_TIME_MINUTES):
+    """
+    Delay statistics per carrier from a DataFrame with carrier and dep_delay columns, in one group-by.
+    NaN delays (cancelled flights) count towards flights and missing but not towards any delay statistic.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+
+    grouped = df.groupby('carrier', sort=True)['dep_delay']
+    stats = pd.DataFrame({
+        'flights': grouped.size(),
+        'delay_count': grouped.count(),
+        'mean': grouped.mean(),
+    })
+    stats['missing'] = stats['flights'] - stats['delay_count']
+
+    quantiles = grouped.quantile(list(QUANTILES)).unstack()
+    stats['median'] = quantiles[0.5]
+    stats['p90'] = quantiles[0.9]
+    stats['p99'] = quantiles[0.99]
+
+    on_time_flights = (df['dep_delay'] <= on_time).groupby(df['carrier']).sum()
+    stats['on_time_rate'] = on_time_flights / stats['delay_count'].where(stats['delay_count'] > 0)
+
+    stats = stats.reset_index()
+    stats['airline_name'] = dimensions.airlines().map(stats['carrier'], 'name')
+    return stats[STATS_COLUMNS]
+
+
+@database.versioned_cache(maxsize=32)
+def _carrier_delay_stats(origins, months, on_time, use_store):
+    # The store is fetched here rather than passed in, so no cache entry keeps an outdated FlightStore alive
+    if use_store:
+        store = flight_store.get_flight_store()
+        filters = {}
+        if origins is not None:
+            filters['origin'] = list(origins)
+        if months is not None:
+            filters['month'] = list(months)
+        mask = store.mask(**filters)
+        df = pd.DataFrame({
+            'carrier': store.values('carrier', mask),
+            'dep_delay': store.values('dep_delay', mask).astype(np.float64),
+        }).dropna(subset=['carrier'])
+    else:
+        query = FlightQuery().select('carrier', 'dep_delay').where_not_null('carrier')
+        if origins is not None:
+            query.where(origin=list(origins))
+        if months is not None:
+            query.where(month=list(months))
+        df = query.fetch()
+        df['dep_delay'] = pd.to_numeric(df['dep_delay'], errors='coerce')
+
+    return summarize(df, on_time)
+
+
+def carrier_delay_stats(origin=None, month=None, use_store=False, on_time=ON_TIME_MINUTES):
+    """
+    Departure delay statistics per carrier: number of flights, non-missing delay count, missing count,
+    mean, median, 90th and 99th percentile and on-time rate.
+    params: optional origin FAA code(s) and month(s) to slice by, whether to read the shared FlightStore,
+            lateness in minutes that still counts as on time.
+    returns: DataFrame with one row per carrier (columns in STATS_COLUMNS), cached until the database changes.
+    """
+    stats = _carrier_delay_stats(_as_key(origin), _as_key(month), on_time, bool(use_store))
+    return stats.copy()
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import database
+
+
+
+# Dimension tables cached in memory and the key column of each
+DIMENSIONS = {
+    'airlines': 'carrier',
+    'planes': 'tailnum',
+}
+
+
+class Dimension:
+    """
+    A small dimension table (airlines, planes) held in memory as one array per column,
+    with a dict from key to row position for single lookups and a pandas Index for vectorized map().
+    When a key occurs more than once the first row wins.
+    """
+
+    def __init__(self, df, key):
+        df = df.reset_index(drop=True)
+        self.key = key
+        self.columns = {c: df[c].to_numpy() for c in df.columns}
+
+        self._rows = {}
+        for i, value in enumerate(self.columns[key]):
+            self._rows.setdefault(value, i)
+        self.keys = list(self._rows)
+        self._index = pd.Index(self.keys)
+        self._positions = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        self._reverse = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def get(self, key, column, default=None):
+        """Value of one column for one key, default if the key is unknown."""
+        i = self._rows.get(key)
+        return default if i is None else self.columns[column][i]
+
+    def map(self, keys, column):
+        """
+        Vectorized lookup of one column for a sequence of keys, like a left join on the key.
+        returns: object array aligned with keys, None where the key is unknown.
+        """
+        found = self._index.get_indexer(pd.Index(keys))
+        out = np.full(len(found), None, dtype=object)
+        known = found >= 0
+        out[known] = self.columns[column][self._positions[found[known]]]
+        return out
+
+    def contains(self, keys):
+        """Vectorized membership test, boolean array aligned with keys."""
+        return self._index.get_indexer(pd.Index(keys)) >= 0
+
+    def key_for(self, column, value):
+        """First key whose column equals value (e.g. the carrier code of an airline name), None if there is none."""
+        if column not in self._reverse:
+            lookup = {}
+            for k, v in zip(self.columns[self.key], self.columns[column]):
+                lookup.setdefault(v, k)
+            self._reverse[column] = lookup
+        return self._reverse[column].get(value)
+
+    def frame(self):
+        return pd.DataFrame(self.columns)
+
+
+############# shared instances ############################
+
+@database.versioned_cache()
+def get_dimension(table):
+    """
+    Return the process-wide Dimension for a table in DIMENSIONS.
+    It is loaded on first use and reloaded when the database file changes.
+    """
+    return Dimension(database.query(f'SELECT * FROM {table}', cache=False), DIMENSIONS[table])
+
+
+def airlines():
+    return get_dimension('airlines')
+
+
+def planes():
+    return get_dimension('planes')
@@ -0,0 +1,149 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import database
+import part1
+
+
+
+DISTANCE_MATRIX_PATH = 'geodesic_distances.npy'
+
+
+def index_path(matrix_path):
+    """Path of the FAA code list stored next to a distance matrix file."""
+    return os.path.splitext(matrix_path)[0] + '_faa.json'
+
+
+def build_distance_matrix(df, path=DISTANCE_MATRIX_PATH, block_size=part1.DISTANCE_BLOCK_SIZE):
+    """
+    Writes the all-pairs geodesic distance matrix to disk as a float32 .npy file plus an FAA index.
+    Blocks are written straight into a memory-mapped file, so the full matrix is never held in memory.
+    params: DataFrame with faa, lat and lon columns, output path, number of rows per block.
+    """
+
+    faa = [str(code) for code in df['faa']]
+    n = len(faa)
+
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n, n))
+    for start, block in part1.geodesic_distance_blocks(df['lat'], df['lon'], block_size, np.float32):
+        matrix[start:start + len(block)] = block
+    matrix.flush()
+    del matrix
+
+    with open(index_path(path), 'w') as f:
+        json.dump(faa, f)
+
+    # A rebuilt file must not be served from an old mapping
+    _matrices.pop(path, None)
+
+    print(f"Distance matrix for {n} airports written to '{path}'.")
+
+
+class DistanceMatrix:
+    """
+    Read-only view of a distance matrix file. The matrix is opened with np.memmap,
+    so pages are only read from disk when a lookup touches them.
+    """
+
+    def __init__(self, path=DISTANCE_MATRIX_PATH):
+        self.path = path
+        self.matrix = np.load(path, mmap_mode='r')
+
+        with open(index_path(path)) as f:
+            self.faa = pd.Index(json.load(f))
+        self.index = {code: i for i, code in enumerate(self.faa)}
+
+    def __contains__(self, faa):
+        return faa in self.index
+
+    def distance(self, origin, dest):
+        """Geodesic distance in miles between two airports, NaN if either code is unknown."""
+        i = self.index.get(origin)
+        j = self.index.get(dest)
+        if i is None or j is None:
+            return float('nan')
+        return float(self.matrix[i, j])
+
+    def distances(self, origins, dests):
+        """Vectorized distance lookup for equally long sequences of origin and destination codes."""
+        i = self.faa.get_indexer(pd.Index(origins))
+        j = self.faa.get_indexer(pd.Index(dests))
+        if len(i) != len(j):
+            raise ValueError('origins and dests must have the same length')
+
+        result = np.full(len(i), np.nan, dtype=np.float64)
+        known = (i >= 0) & (j >= 0)
+        result[known] = self.matrix[i[known], j[known]]
+        return result
+
+
+_matrices = {}
+
+
+def get_distance_matrix(path=DISTANCE_MATRIX_PATH):
+    """Return the shared DistanceMatrix for a file, or None if it has not been built yet."""
+    if path not in _matrices:
+        if not os.path.exists(path) or not os.path.exists(index_path(path)):
+            return None
+        _matrices[path] = DistanceMatrix(path)
+    return _matrices[path]
+
+
+############# routes ############################
+
+ROUTES_TABLE = 'routes'
+
+
+def build_routes(conn=None):
+    """
+    Builds the routes dimension table with one row per (origin, dest) pair that appears in flights:
+    geodesic distance, initial great-circle bearing and the unit direction vector of that bearing
+    (direction_x pointing east, direction_y north). Only the few hundred flown routes are computed,
+    flights get these values by joining on origin and dest.
+    Routes whose airports are missing from the airports table, or that start and end at the same airport, get NULLs.
+    Uses the shared writer connection when no connection is given.
+    """
+    if conn is None:
+        with database.write_connection() as conn:
+            return build_routes(conn)
+
+    query = """
+        SELECT r.origin, r.dest,
+               a1.lat AS origin_lat, a1.lon AS origin_lon,
+               a2.lat AS dest_lat, a2.lon AS dest_lon
+        FROM (SELECT DISTINCT origin, dest FROM flights) AS r
+        LEFT JOIN airports AS a1 ON a1.faa = r.origin
+        LEFT JOIN airports AS a2 ON a2.faa = r.dest
+    """
+    routes = pd.read_sql_query(query, conn)
+
+    coords = [routes[c].astype(float) for c in ('origin_lat', 'origin_lon', 'dest_lat', 'dest_lon')]
+    routes['geodesic_distance'] = part1.calculate_geodesic_distance(*coords)
+
+    bearing = part1.calculate_initial_bearing(*coords).where(routes['geodesic_distance'] > 0)
+    routes['bearing'] = bearing
+    routes['direction_x'] = np.sin(np.radians(bearing))
+    routes['direction_y'] = np.cos(np.radians(bearing))
+
+    columns = ['origin', 'dest', 'geodesic_distance', 'bearing', 'direction_x', 'direction_y']
+    rows = routes[columns].astype(object)
+    rows = rows.where(rows.notna(), None).values.tolist()
+
+    conn.execute('DROP TABLE IF EXISTS route_distances')  # Replaced by the routes table
+    conn.execute(f'DROP TABLE IF EXISTS {ROUTES_TABLE}')
+    conn.execute(f"""
+        CREATE TABLE {ROUTES_TABLE} (
+            origin TEXT NOT NULL,
+            dest TEXT NOT NULL,
+            geodesic_distance REAL,
+            bearing REAL,
+            direction_x REAL,
+            direction_y REAL,
+            PRIMARY KEY (origin, dest)
+        )
+    """)
+    conn.executemany(f'INSERT INTO {ROUTES_TABLE} ({", ".join(columns)}) VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    print(f'Stored {len(rows)} routes in {ROUTES_TABLE}.')
+    return routes[columns]
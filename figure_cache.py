@@ -0,0 +1,102 @@
+import os
+import threading
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import airport_registry
+import database
+import part1
+
+
+
+FIGURE_CACHE_DIR = '.figure_cache'
+
+# Base maps that can be cached, with the part1 function that builds each one
+BASE_MAPS = {
+    'inter': part1.all_airports,
+    'usa': part1.only_usa,
+}
+
+AIRPORTS_QUERY = airport_registry.AIRPORTS_QUERY
+
+_figures = {}   # (kind, version) -> Figure
+_lock = threading.Lock()
+
+
+def airports_version(df):
+    """Short hash of the airports data, base maps are rebuilt whenever it changes."""
+    return format(int(pd.util.hash_pandas_object(df, index=False).sum()) & 0xFFFFFFFFFFFF, '012x')
+
+
+def figure_path(kind, version):
+    return os.path.join(FIGURE_CACHE_DIR, f'{kind}-{version}.json')
+
+
+def base_map(kind, airports_df=None):
+    """
+    Return the base airport map ('inter' or 'usa').
+    The figure is built once per version of the airports data, written to disk as JSON and
+    kept in memory, so later calls and later processes skip the Plotly Express build entirely.
+    The same Figure object is shared, use highlight() or copy it before changing it.
+    """
+    if kind not in BASE_MAPS:
+        raise ValueError(f"Unknown base map '{kind}'")
+
+    if airports_df is None:
+        airports_df = database.query(AIRPORTS_QUERY)
+    version = airports_version(airports_df)
+    key = (kind, version)
+
+    with _lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            return fig
+
+        path = figure_path(kind, version)
+        if os.path.exists(path):
+            with open(path) as f:
+                fig = pio.from_json(f.read())
+        else:
+            fig = BASE_MAPS[kind](airports_df)
+            os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+            for name in os.listdir(FIGURE_CACHE_DIR):
+                if name.startswith(f'{kind}-'):
+                    os.remove(os.path.join(FIGURE_CACHE_DIR, name))
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(fig.to_json())
+            os.replace(tmp_path, path)
+
+        # Figures of older data versions are no longer needed
+        for old in [k for k in _figures if k[0] == kind]:
+            del _figures[old]
+        _figures[key] = fig
+        return fig
+
+
+def highlight(kind, points, color='red', size=12, airports_df=None):
+    """
+    Return a copy of a cached base map with extra markers drawn on top, without rebuilding the base layers.
+    params: base map kind, DataFrame with lat, lon and optionally name columns, marker color and size.
+    """
+    fig = go.Figure(base_map(kind, airports_df))
+
+    fig.add_trace(go.Scattergeo(
+        lat = points['lat'],
+        lon = points['lon'],
+        mode = 'markers',
+        text = points['name'] if 'name' in points.columns else None,
+        hoverinfo = 'text' if 'name' in points.columns else 'lon+lat',
+        marker = dict(color=color, size=size, line=dict(color='black', width=1)),
+        showlegend = False
+    ))
+    return fig
+
+
+def clear():
+    """Forget every cached base map, in memory and on disk."""
+    with _lock:
+        _figures.clear()
+        if os.path.isdir(FIGURE_CACHE_DIR):
+            for name in os.listdir(FIGURE_CACHE_DIR):
+                os.remove(os.path.join(FIGURE_CACHE_DIR, name))
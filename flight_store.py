@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+import database
+
+
+
+# Columns kept by the store and the dtype each one is held in.
+# String keys become integer codes, missing values are -1 for codes and time fields and NaN for floats.
+CATEGORY_COLUMNS = ('origin', 'dest', 'carrier', 'tailnum')
+INT_COLUMNS = {
+    'year': np.int16, 'month': np.int8, 'day': np.int8,
+    'dep_time': np.int16, 'sched_dep_time': np.int16,
+    'arr_time': np.int16, 'sched_arr_time': np.int16,
+    'hour': np.int8, 'minute': np.int8,
+    'flight': np.int32,
+}
+FLOAT_COLUMNS = ('dep_delay', 'arr_delay', 'air_time', 'distance')
+
+MISSING = -1
+LOAD_CHUNK_SIZE = 50000
+
+
+class _Encoder:
+    """Assigns stable integer codes to the string values of one column while it is read in chunks."""
+
+    def __init__(self):
+        self.lookup = {}
+        self.values = []
+
+    def encode(self, values):
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, value in enumerate(uniques):
+            code = self.lookup.get(value)
+            if code is None:
+                code = len(self.values)
+                self.lookup[value] = code
+                self.values.append(value)
+            mapping[i] = code
+        return np.where(codes < 0, MISSING, mapping[codes] if len(mapping) else MISSING)
+
+
+class FlightStore:
+    """
+    The flights table held in memory as NumPy arrays, one per column.
+    String keys are categorical integer codes, time fields are small ints and delays/distances float32,
+    which takes a fraction of the memory of a DataFrame with object columns.
+    Filters produce boolean masks and group-bys are done with np.bincount / np.unique on the codes.
+    """
+
+    def __init__(self, columns, categories):
+        self.columns = columns          # name -> np.ndarray
+        self.categories = categories    # name -> np.ndarray of the strings behind the codes
+        self.size = len(next(iter(columns.values()))) if columns else 0
+        self._code_lookup = {name: {v: i for i, v in enumerate(values)} for name, values in categories.items()}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.columns.values())
+
+    ############# loading ############################
+
+    @classmethod
+    def load(cls, chunk_size=LOAD_CHUNK_SIZE):
+        """Read the flights table in chunks into a new store."""
+        wanted = list(CATEGORY_COLUMNS) + list(INT_COLUMNS) + list(FLOAT_COLUMNS)
+
+        with database.read_connection() as conn:
+            present = {row[1] for row in conn.execute('PRAGMA table_info(flights)')}
+            names = [c for c in wanted if c in present]
+
+            encoders = {c: _Encoder() for c in CATEGORY_COLUMNS if c in names}
+            parts = {c: [] for c in names}
+
+            cursor = conn.execute(f"SELECT {', '.join(names)} FROM flights")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                chunk = pd.DataFrame.from_records(rows, columns=names)
+
+                for c in names:
+                    if c in encoders:
+                        parts[c].append(encoders[c].encode(chunk[c].to_numpy()))
+                    elif c in INT_COLUMNS:
+                        values = pd.to_numeric(chunk[c], errors='coerce')
+                        parts[c].append(values.fillna(MISSING).to_numpy().astype(INT_COLUMNS[c]))
+                    else:
+                        parts[c].append(pd.to_numeric(chunk[c], errors='coerce').to_numpy(dtype=np.float32))
+            cursor.close()
+
+        columns = {}
+        categories = {}
+        for c in names:
+            if c in encoders:
+                values = np.array(encoders[c].values, dtype=object)
+                code_type = np.int16 if len(values) < np.iinfo(np.int16).max else np.int32
+                data = np.concatenate(parts[c]) if parts[c] else np.empty(0)
+                columns[c] = data.astype(code_type)
+                categories[c] = values
+            elif c in INT_COLUMNS:
+                columns[c] = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=INT_COLUMNS[c])
+            else:
+                columns[c] = np.concatenate(parts[c]) if parts[c] else np.empty(0, dtype=np.float32)
+
+        return cls(columns, categories)
+
+    ############# primitives ############################
+
+    def codes(self, column, values):
+        """Codes for one or more string values of a categorical column, -2 for values that never occur."""
+        lookup = self._code_lookup[column]
+        if isinstance(values, (list, tuple, set, np.ndarray, pd.Series)):
+            return np.array([lookup.get(v, -2) for v in values], dtype=np.int64)
+        return lookup.get(values, -2)
+
+    def mask(self, **filters):
+        """
+        Boolean mask of the rows matching every filter. A list/tuple/set matches any of its values.
+        e.g. store.mask(origin='JFK', month=[1, 2])
+        """
+        result = np.ones(self.size, dtype=bool)
+        for column, value in filters.items():
+            data = self.columns[column]
+            if column in self.categories:
+                value = self.codes(column, value)
+            if isinstance(value, (list, tuple, set, np.ndarray)):
+                result &= np.isin(data, np.asarray(list(value)))
+            else:
+                result &= data == value
+        return result
+
+    def valid(self, column):
+        """Mask of the rows where a column is not missing."""
+        data = self.columns[column]
+        if data.dtype.kind == 'f':
+            return ~np.isnan(data)
+        return data != MISSING
+
+    def values(self, column, mask=None):
+        """Column values for the selected rows, decoded back to strings for categorical columns."""
+        data = self.columns[column] if mask is None else self.columns[column][mask]
+        if column in self.categories:
+            decoded = np.full(len(data), None, dtype=object)
+            present = data >= 0
+            decoded[present] = self.categories[column][data[present]]
+            return decoded
+        return data
+
+    def count(self, mask=None):
+        return self.size if mask is None else int(np.count_nonzero(mask))
+
+    def nunique(self, column, mask=None):
+        data = self.columns[column] if mask is None else self.columns[column][mask]
+        data = data[data != MISSING] if data.dtype.kind != 'f' else data[~np.isnan(data)]
+        return len(np.unique(data))
+
+    def _group_keys(self, by, mask):
+        """Combined integer key per selected row plus the decode information, rows with a missing key are dropped."""
+        by = (by,) if isinstance(by, str) else tuple(by)
+        keep = np.ones(self.size, dtype=bool) if mask is None else mask.copy()
+        for column in by:
+            keep &= self.valid(column)
+
+        key = np.zeros(np.count_nonzero(keep), dtype=np.int64)
+        sizes = []
+        for column in by:
+            data = self.columns[column][keep].astype(np.int64)
+            if column in self.categories:
+                size = len(self.categories[column])
+                offset = 0
+            else:
+                offset = int(data.min()) if len(data) else 0
+                size = (int(data.max()) - offset + 1) if len(data) else 1
+                data = data - offset
+            key = key * size + data
+            sizes.append((column, size, offset))
+        return by, keep, key, sizes
+
+    def _decode_keys(self, keys, sizes):
+        out = {}
+        for column, size, offset in reversed(sizes):
+            part = keys % size
+            keys = keys // size
+            if column in self.categories:
+                out[column] = self.categories[column][part]
+            else:
+                out[column] = part + offset
+        return {column: out[column] for column, _, _ in sizes}
+
+    def group_count(self, by, mask=None, name='count'):
+        """Number of rows per group, like df.groupby(by).size(), sorted by the group keys."""
+        by, keep, key, sizes = self._group_keys(by, mask)
+        keys, counts = np.unique(key, return_counts=True)
+        df = pd.DataFrame(self._decode_keys(keys, sizes))
+        df[name] = counts
+        return df.sort_values(list(by)).reset_index(drop=True)
+
+    def group_agg(self, column, by, mask=None):
+        """
+        NaN-aware sum, count of non-missing values, row count and mean of a float column per group.
+        returns: DataFrame with the group columns plus sum, count, rows and mean.
+        """
+        by, keep, key, sizes = self._group_keys(by, mask)
+        keys, inverse, rows = np.unique(key, return_inverse=True, return_counts=True)
+
+        data = self.columns[column][keep].astype(np.float64)
+        present = ~np.isnan(data)
+        sums = np.bincount(inverse[present], weights=data[present], minlength=len(keys))
+        counts = np.bincount(inverse[present], minlength=len(keys))
+
+        df = pd.DataFrame(self._decode_keys(keys, sizes))
+        df['sum'] = sums
+        df['count'] = counts
+        df['rows'] = rows
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['mean'] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        return df.sort_values(list(by)).reset_index(drop=True)
+
+    def frame(self, columns, mask=None):
+        """Decoded DataFrame of some columns for the selected rows."""
+        return pd.DataFrame({c: self.values(c, mask) for c in columns})
+
+
+############# shared instance ############################
+
+@database.versioned_cache()
+def get_flight_store():
+    """
+    Return the process-wide FlightStore, shared by every Streamlit session.
+    It is loaded on first use and reloaded when the database file changes.
+    """
+    return FlightStore.load()
@@ -0,0 +1,159 @@
+import argparse
+import aggregates
+import database
+import distances
+
+
+
+# Derived-data jobs write into the database from flights. Each run records the flights data version
+# it was computed from in derived_jobs, and a job whose recorded version is current is skipped.
+
+
+def ensure_jobs_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS derived_jobs (
+            name TEXT PRIMARY KEY,
+            flights_version INTEGER NOT NULL,
+            ran_at TEXT NOT NULL
+        )
+    """)
+
+
+def recorded_version(conn, name):
+    ensure_jobs_table(conn)
+    row = conn.execute('SELECT flights_version FROM derived_jobs WHERE name = ?', (name,)).fetchone()
+    return None if row is None else row[0]
+
+
+def run_job(name, job, force=False):
+    """
+    Run job(conn) on the writer connection in one transaction unless it already ran on the current flights data.
+    Without version tracking (see migrations.py) the job always runs.
+    returns: True if the job ran, False if it was skipped.
+    """
+    with database.write_connection() as conn:
+        version = aggregates.current_version(conn)
+        if not force and version is not None and recorded_version(conn, name) == version:
+            print(f'{name} is up to date.')
+            return False
+
+        job(conn)
+
+        if version is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO derived_jobs (name, flights_version, ran_at) VALUES (?, ?, datetime('now'))",
+                (name, version)
+            )
+    print(f'{name} updated.')
+    return True
+
+
+############# bulk writes ############################
+
+BULK_CHUNK_ROWS = 50000
+
+
+def bulk_update(conn, table, df, columns, key='rowid', df_key=None, chunk_size=BULK_CHUNK_ROWS, label=None):
+    """
+    Write columns of a DataFrame back into a table, matching df[df_key] against table.key.
+    The values are staged in a temp table with one executemany INSERT, then applied with a set-based
+    UPDATE ... FROM per chunk of staged rows, printing progress after each chunk. Runs in the caller's transaction.
+    returns: the number of table rows updated.
+    """
+    df_key = key if df_key is None else df_key
+    label = label or f"{table}.{', '.join(columns)}"
+    staging = f'temp.bulk_{table}'
+
+    conn.execute(f'DROP TABLE IF EXISTS {staging}')
+    conn.execute(f"""
+        CREATE TEMP TABLE bulk_{table} (
+            seq INTEGER PRIMARY KEY,
+            key {'INTEGER' if key == 'rowid' else ''},
+            {', '.join(columns)}
+        )
+    """)
+
+    values = df[[df_key] + list(columns)]
+    rows = values.astype(object).where(values.notna(), None).values.tolist()
+    conn.executemany(
+        f"INSERT INTO {staging} (key, {', '.join(columns)}) VALUES ({', '.join('?' for _ in range(len(columns) + 1))})",
+        rows
+    )
+
+    assignments = ', '.join(f'{column} = s.{column}' for column in columns)
+    total = len(rows)
+    updated = 0
+    for start in range(0, total, chunk_size):
+        cursor = conn.execute(f"""
+            UPDATE {table}
+            SET {assignments}
+            FROM {staging} AS s
+            WHERE {table}.{key} = s.key AND s.seq > ? AND s.seq <= ?
+        """, (start, start + chunk_size))
+        updated += cursor.rowcount
+        print(f'{label}: {min(start + chunk_size, total)}/{total} rows written')
+
+    conn.execute(f'DROP TABLE {staging}')
+    return updated
+
+
+############# plane speed ############################
+
+def plane_speed_job(conn):
+    """
+    Average speed in mph of every plane over its flights, written to planes.speed with one set-based UPDATE.
+    Planes without a flight with a positive air_time keep their current speed.
+    """
+    conn.execute('DROP TABLE IF EXISTS temp.plane_speeds')
+    conn.execute('CREATE TEMP TABLE plane_speeds (tailnum TEXT PRIMARY KEY, speed REAL)')
+    conn.execute("""
+        INSERT INTO temp.plane_speeds (tailnum, speed)
+        SELECT tailnum, ROUND(AVG(distance / (air_time / 60.0)), 4)
+        FROM flights
+        WHERE air_time > 0 AND tailnum IS NOT NULL
+        GROUP BY tailnum
+    """)
+    conn.execute("""
+        UPDATE planes
+        SET speed = s.speed
+        FROM temp.plane_speeds AS s
+        WHERE planes.tailnum = s.tailnum AND s.speed IS NOT NULL
+    """)
+    conn.execute('DROP TABLE temp.plane_speeds')
+
+
+def update_plane_speeds(force=False):
+    return run_job('plane_speed', plane_speed_job, force)
+
+
+############# routes ############################
+
+def update_routes(force=False):
+    """Rebuild the routes table (distance, bearing and direction of every flown route) when flights changed."""
+    return run_job('routes', distances.build_routes, force)
+
+
+JOBS = {
+    'plane_speed': update_plane_speeds,
+    'routes': update_routes,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the derived-data jobs that are out of date.')
+    parser.add_argument('jobs', nargs='*', help=f"jobs to run: {', '.join(JOBS)} (default: all)")
+    parser.add_argument('--force', action='store_true', help='run even if the job is up to date')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.jobs if name not in JOBS]
+    if unknown:
+        parser.error(f"unknown job: {', '.join(unknown)}")
+
+    for name in args.jobs or JOBS:
+        JOBS[name](force=args.force)
+
+    database.close_all()
+
+
+if __name__ == '__main__':
+    main()
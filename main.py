@@ -1,7 +1,10 @@
 import part1
 import part3
 import part4
-import sqlite3
+import aggregates
+import database
+import distances
+import jobs
 import pandas as pd
 
 
@@ -13,13 +16,15 @@ def main():
     lst = ['GRR','LAX','AAF','ABR']
     part1.create_histogram(df,lst)
     
-    connection = sqlite3.connect("flights_database.db")
-    part3.verify_computed_distances(connection)
+    distances.build_distance_matrix(df)
+    jobs.update_routes()
+    part3.verify_computed_distance()
+    part3.compute_wind_effect_on_flights()
 
-    connection.close()
+    aggregates.build_aggregates()
+    jobs.update_plane_speeds()
 
-    distance_df = part1.calculate_all_distances(df)
-    distance_df.to_csv("geodesic_distances.csv", index=False)
+    database.close_all()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,223 @@
+import argparse
+import time
+import database
+import pandas as pd
+
+
+
+# Curated, versioned index set. Each migration is applied once and recorded in schema_migrations.
+# Covering indexes include every column the matching dashboard query reads, so SQLite never touches the table rows.
+MIGRATIONS = [
+    # Route, carrier and per-day lookups on flights are served by the covering indexes of migration 4,
+    # which lead with the same columns, so inserts into flights do not maintain the same key twice
+    (1, 'flights tailnum lookups', [
+        'CREATE INDEX IF NOT EXISTS ix_flights_tailnum ON flights(tailnum)',
+    ]),
+    (2, 'per-hour weather lookups', [
+        'CREATE INDEX IF NOT EXISTS ix_weather_origin_hour ON weather(origin, year, month, day, hour)',
+    ]),
+    (3, 'dimension table keys', [
+        'CREATE INDEX IF NOT EXISTS ix_airports_faa ON airports(faa)',
+        'CREATE INDEX IF NOT EXISTS ix_airports_name ON airports(name)',
+        'CREATE INDEX IF NOT EXISTS ix_airlines_carrier ON airlines(carrier)',
+        'CREATE INDEX IF NOT EXISTS ix_planes_tailnum ON planes(tailnum)',
+    ]),
+    (4, 'covering indexes for dashboard queries', [
+        # get_flight_delays / get_flight_delays_multiple
+        'CREATE INDEX IF NOT EXISTS cx_flights_day_origin_delay ON flights(month, day, origin, dep_delay, dep_time, sched_dep_time)',
+        # display_flights_by_month and the carrier market share
+        'CREATE INDEX IF NOT EXISTS cx_flights_carrier_month ON flights(carrier, month)',
+        # destination_manufacturers and the per-destination carrier lookups
+        'CREATE INDEX IF NOT EXISTS cx_flights_dest_tailnum ON flights(dest, tailnum)',
+        # route_plane_usage and flight_info
+        'CREATE INDEX IF NOT EXISTS cx_flights_route_tailnum ON flights(origin, dest, tailnum)',
+    ]),
+    (5, 'flights data version tracking', [
+        # Bumped on every change to the source columns of flights, summary tables record the value they were built from.
+        # Updates of derived columns (wind effect, local times) leave the version alone.
+        'CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)',
+        "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('flights', 0)",
+        "CREATE TRIGGER IF NOT EXISTS trg_flights_version_insert AFTER INSERT ON flights "
+        "BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'flights'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_flights_version_delete AFTER DELETE ON flights "
+        "BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'flights'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_flights_version_update "
+        "AFTER UPDATE OF year, month, day, dep_time, sched_dep_time, dep_delay, arr_time, sched_arr_time, "
+        "arr_delay, carrier, flight, tailnum, origin, dest, air_time, distance, hour, minute ON flights "
+        "BEGIN UPDATE data_versions SET version = version + 1 WHERE name = 'flights'; END",
+    ]),
+    (6, 'drop redundant flights indexes', [
+        # Databases migrated before the indexes above were trimmed still have them.
+        # Each is a prefix of a migration 4 covering index, cx_flights_dest_month_delay served delayed_flights_by_destination,
+        # which reads the delay cube now, and dest lookups use cx_flights_dest_tailnum.
+        'DROP INDEX IF EXISTS ix_flights_origin_dest',
+        'DROP INDEX IF EXISTS ix_flights_carrier',
+        'DROP INDEX IF EXISTS ix_flights_day_origin',
+        'DROP INDEX IF EXISTS cx_flights_dest_month_delay',
+    ]),
+]
+
+
+# The queries the dashboard issues, with representative parameters, used for the before/after report
+DASHBOARD_QUERIES = [
+    ('get_airport_name',
+     'SELECT name FROM airports WHERE faa = ?', ('JFK',)),
+    ('get_flight_delays',
+     'SELECT dep_time, dep_delay, sched_dep_time FROM flights WHERE month = ? AND day = ? AND origin = ? AND dep_delay IS NOT NULL',
+     (1, 1, 'JFK')),
+    ('get_flight_delays_multiple',
+     'SELECT origin, dep_time, dep_delay FROM flights WHERE year = ? AND month = ? AND day = ? AND origin IN (?, ?, ?) '
+     'AND dep_delay IS NOT NULL',
+     (2023, 1, 1, 'JFK', 'LGA', 'EWR')),
+    ('flight_info',
+     'SELECT origin, dest, dep_time, flight, year, month, day, carrier FROM flights WHERE origin = ? AND dest = ?',
+     ('JFK', 'LAX')),
+    ('display_flights_by_month',
+     'SELECT month, COUNT(*) AS num_flights FROM flights WHERE carrier = ? GROUP BY month ORDER BY month',
+     ('AA',)),
+    ('display_airline_market_share',
+     'SELECT a.name AS airline_name, COUNT(*) AS num_flights FROM flights f JOIN airlines a ON f.carrier = a.carrier GROUP BY a.name',
+     ()),
+    ('destination_manufacturers',
+     'SELECT dest, tailnum, COUNT(*) AS num_flights FROM flights GROUP BY dest, tailnum',
+     ()),
+    ('route_plane_usage',
+     'SELECT origin, dest, tailnum, COUNT(*) AS num_flights FROM flights GROUP BY origin, dest, tailnum',
+     ()),
+    ('delay_cube',
+     'SELECT dest, origin, carrier, year, month, day, COUNT(*) AS flights, '
+     'COUNT(CASE WHEN dep_delay > 0 THEN 1 END) AS delayed, COUNT(dep_delay) AS delay_count, TOTAL(dep_delay) AS delay_sum FROM flights '
+     'WHERE dest IS NOT NULL AND origin IS NOT NULL AND carrier IS NOT NULL GROUP BY dest, origin, carrier, year, month, day',
+     ()),
+    ('average_daily_flights',
+     'SELECT year, month, day, COUNT(*) AS num_flights FROM flights WHERE origin = ? GROUP BY year, month, day',
+     ('JFK',)),
+    ('weather_index',
+     'SELECT * FROM weather',
+     ()),
+]
+
+
+def ensure_migrations_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+
+
+def applied_versions(conn):
+    ensure_migrations_table(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def pending_migrations(conn):
+    done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def apply_migrations(conn):
+    """
+    Apply every migration that is not yet recorded, then refresh planner statistics with ANALYZE.
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    for version, name, statements in pending_migrations(conn):
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, datetime('now'))",
+            (version, name)
+        )
+        applied.append(version)
+        print(f'Applied migration {version}: {name}')
+
+    conn.execute('ANALYZE')
+    return applied
+
+
+############# query plan report ############################
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN output for a query as a single string."""
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def time_query(conn, sql, params=(), repeat=3):
+    """Return the best wall time in milliseconds over a few runs of a query."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def profile_dashboard_queries(queries=DASHBOARD_QUERIES):
+    """Collect the query plan and timing of every dashboard query on a pooled read connection."""
+    rows = []
+    with database.read_connection() as conn:
+        for label, sql, params in queries:
+            try:
+                plan = explain(conn, sql, params)
+                ms = time_query(conn, sql, params)
+            except Exception as e:  # A column the query needs may not exist yet (e.g. temp_min before part4 runs)
+                plan, ms = f'error: {e}', None
+            rows.append({'query': label, 'plan': plan, 'time_ms': ms})
+    return pd.DataFrame(rows)
+
+
+def migrate(report=True):
+    """Entry point: apply pending index migrations and print before/after plans and timings."""
+    before = profile_dashboard_queries() if report else None
+
+    with database.write_connection() as conn:
+        applied = apply_migrations(conn)
+
+    if applied:
+        # Pooled readers keep prepared statements from before the new indexes existed
+        database.close_all()
+    else:
+        print('Schema is up to date.')
+
+    if report:
+        after = profile_dashboard_queries()
+        comparison = before.merge(after, on='query', suffixes=('_before', '_after'))
+
+        for _, row in comparison.iterrows():
+            print(f"\n{row['query']}")
+            print(f"  before: {row['plan_before']}  ({format_ms(row['time_ms_before'])})")
+            print(f"  after:  {row['plan_after']}  ({format_ms(row['time_ms_after'])})")
+
+        return comparison
+
+
+def format_ms(ms):
+    return 'n/a' if ms is None or pd.isna(ms) else f'{ms:.2f} ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create and version the flights database indexes.')
+    parser.add_argument('--no-report', action='store_true', help='skip the EXPLAIN QUERY PLAN / timing report')
+    parser.add_argument('--status', action='store_true', help='list pending migrations without applying them')
+    args = parser.parse_args()
+
+    if args.status:
+        with database.write_connection() as conn:
+            pending = pending_migrations(conn)
+        for version, name, _ in pending:
+            print(f'Pending migration {version}: {name}')
+        if not pending:
+            print('Schema is up to date.')
+        return
+
+    migrate(report=not args.no_report)
+    database.close_all()
+
+
+if __name__ == '__main__':
+    main()
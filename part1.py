@@ -4,6 +4,7 @@ import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
 import math
+import spatial
 
 
 
@@ -70,6 +71,68 @@ def only_usa(df):
     return fig
 
 
+# Adds flight paths to a figure as one marker trace and one line trace per group
+# Flights on the same route are drawn once, with the number of flights in the hover text,
+# and every line of a group goes into a single trace separated by None, so the figure size
+# depends on the number of routes and groups rather than the number of flights.
+# Parameters:
+#   fig --> plotly Figure the traces are added to
+#   paths --> DataFrame with origin_lat, origin_lon, dest, dest_lat, dest_lon columns, one row per flight
+#   group --> optional column of paths to split traces on (e.g. airline name), None for a single group
+#   colors --> optional dict of group value to color
+#   marker_color, line_color --> colors used when no group color is given
+#   showlegend --> whether the marker trace of each group appears in the legend
+# Output: None
+# Return: Figure with the added traces
+def add_batched_paths(fig, paths, group=None, colors=None, marker_color='blue', line_color='green', showlegend=False):
+    route_cols = ['origin_lat', 'origin_lon', 'dest', 'dest_lat', 'dest_lon']
+    keys = route_cols if group is None else [group] + route_cols
+
+    routes = paths.groupby(keys, sort=False).size().reset_index(name='num_flights')
+    groups = [(None, routes)] if group is None else routes.groupby(group, sort=False)
+
+    for name, routes in groups:
+        n = len(routes)
+
+        # origin, destination, None for every route so one trace draws all the separate segments
+        lon = np.empty(3 * n, dtype=object)
+        lat = np.empty(3 * n, dtype=object)
+        lon[0::3], lon[1::3] = routes['origin_lon'].to_numpy(), routes['dest_lon'].to_numpy()
+        lat[0::3], lat[1::3] = routes['origin_lat'].to_numpy(), routes['dest_lat'].to_numpy()
+
+        hover = 'Flight to ' + routes['dest'].astype(str)
+        if name is not None:
+            hover = hover + f'<br>Airline: {name}'
+        hover = hover + '<br>Flights: ' + routes['num_flights'].astype(str)
+
+        color_m = colors.get(name, marker_color) if colors else marker_color
+        color_l = colors.get(name, line_color) if colors else line_color
+
+        fig.add_trace(go.Scattergeo(
+            lon = routes['dest_lon'],
+            lat = routes['dest_lat'],
+            mode = 'markers',
+            name = name if name is not None else 'Destinations',
+            marker=dict(color=color_m, size=8),
+            text = hover,
+            hoverinfo = 'text',
+            legendgroup = name,
+            showlegend = showlegend
+        ))
+
+        fig.add_trace(go.Scattergeo(
+            lon = lon,
+            lat = lat,
+            mode = 'lines',
+            line=dict(color=color_l, width=1),
+            hoverinfo = 'skip',
+            legendgroup = name,
+            showlegend = False
+        ))
+
+    return fig
+
+
 # Display all flight paths from airports list
 # Parameters: 
 #   airports --> list of airports faa codes
@@ -93,24 +156,77 @@ def flight_paths(airports, df):
     
     destinations = df[df['faa'].isin(airports)]
 
-    for i, dest in destinations.iterrows():
+    paths = pd.DataFrame({
+        'origin_lat': start_lat,
+        'origin_lon': start_lon,
+        'dest': destinations['faa'],
+        'dest_lat': destinations['lat'],
+        'dest_lon': destinations['lon'],
+    })
+    add_batched_paths(fig, paths)
 
-        fig.add_trace(go.Scattergeo(
-            lon = [dest['lon']],
-            lat = [dest['lat']],
+    return fig
+
+
+# Finds all airports within a radius of a given airport
+# Parameters:
+#   df --> DataFrame of airport data
+#   faa --> faa code of the airport at the center
+#   miles --> search radius in miles
+#   index --> optional prebuilt spatial.AirportIndex over df, built on the fly if not given
+# Output: None
+# Return: DataFrame of nearby airports (excluding the center airport) with a distance column, nearest first
+def airports_near(df, faa, miles, index=None):
+    if index is None:
+        index = spatial.AirportIndex(df)
+
+    center = df[df['faa'] == faa]
+    if center.empty:
+        return df.iloc[0:0].assign(distance=[])
+
+    hits = index.within(center['lat'].iloc[0], center['lon'].iloc[0], miles)
+    hits = hits[hits['faa'] != faa].drop(columns='query')
+
+    return hits.merge(df, on='faa', how='left')[list(df.columns) + ['distance']]
+
+
+# Display an airport and every airport within a radius of it
+# Parameters:
+#   df --> DataFrame of airport data
+#   faa --> faa code of the airport at the center
+#   miles --> search radius in miles
+#   index --> optional prebuilt spatial.AirportIndex over df
+# Output: Scatter Geo with the center airport in red and the nearby airports in blue
+# Return: Figure
+def nearby_airports_map(df, faa, miles, index=None):
+    nearby = airports_near(df, faa, miles, index)
+    center = df[df['faa'] == faa]
+
+    fig = go.Figure()
+
+    fig.add_trace(go.Scattergeo(
+            lon = nearby['lon'],
+            lat = nearby['lat'],
             mode = 'markers',
-            name=f"{dest['faa']}",
+            name='Nearby',
+            text = nearby['name'] + ' (' + nearby['distance'].round(0).astype(int).astype(str) + ' mi)',
+            hoverinfo='text',
             marker=dict(color='blue'),
             showlegend=False
         ))
 
-        fig.add_trace(go.Scattergeo(
-            lon = [start_lon, dest['lon']],
-            lat = [start_lat, dest['lat']],
-            mode = 'lines',
-            line=dict(color='green'),
+    fig.add_trace(go.Scattergeo(
+            lon = center['lon'],
+            lat = center['lat'],
+            mode = 'markers',
+            name=faa,
+            text = center['name'],
+            hoverinfo='text',
+            marker=dict(color='red', size=10),
             showlegend=False
         ))
+
+    fig.update_layout(geo=dict(fitbounds='locations'))
     return fig
 
 
@@ -186,15 +302,92 @@ def calculate_geodesic_distance(lat1, lon1, lat2, lon2):
     return distance
 
 
-def calculate_all_distances(df):
-    distances = []
+def calculate_initial_bearing(lat1, lon1, lat2, lon2):
+    """Calculates the initial great-circle bearing from the first to the second airport.
+    params: latitude and longitude of airport pairs.
+    returns: bearing in degrees clockwise from north, in [0, 360).
+    """
 
-    for i , row1 in df.iterrows():
-        for j , row2 in df.iterrows():
-            if i != j:
-                dist = calculate_geodesic_distance(row1['lat'], row1['lon'], row2['lat'], row2['lon'])
-                distances.append({'airport1': row1['faa'], 'airport2': row2['faa'], 'distance_m': dist})
-    
-    return pd.DataFrame(distances)
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    delta_lamda = lon2 - lon1
+
+    x = np.sin(delta_lamda) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(delta_lamda)
+
+    return np.degrees(np.arctan2(x, y)) % 360
+
+
+DISTANCE_BLOCK_SIZE = 256  # Rows of the distance matrix computed at once, peak memory is about 6 * block * n values
+
+
+def geodesic_distance_blocks(lat, lon, block_size=DISTANCE_BLOCK_SIZE, dtype=np.float64):
+    """Computes the all-pairs geodesic distance matrix one block of rows at a time.
+    Uses the same formula as calculate_geodesic_distance, broadcast over a block of origins and all destinations.
+    params: arrays of latitude and longitude, number of rows per block, float32 or float64.
+    yields: (start, block) where block[i, j] is the distance from airport start + i to airport j.
+    """
+
+    lat = np.radians(np.asarray(lat, dtype=dtype))
+    lon = np.radians(np.asarray(lon, dtype=dtype))
+    n = len(lat)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        lat1 = lat[start:stop, None]
+        lon1 = lon[start:stop, None]
+
+        delta_phi = lat[None, :] - lat1
+        half_lamda = (lon[None, :] - lon1) / 2
+        phi_m = (lat1 + lat[None, :]) / 2
+
+        a = 2 * np.sin(delta_phi / 2) * np.cos(half_lamda)
+        b = 2 * np.cos(phi_m) * np.sin(half_lamda)
+
+        yield start, R * np.sqrt(a * a + b * b)
+
+
+def calculate_distance_matrix(df, block_size=DISTANCE_BLOCK_SIZE, dtype=np.float64):
+    """Calculates the dense geodesic distance matrix between all airports.
+    params: DataFrame with faa, lat and lon columns, number of rows per block, float32 or float64.
+    returns: square DataFrame indexed by faa code on both axes.
+    """
+
+    faa = df['faa'].to_numpy()
+    matrix = np.empty((len(faa), len(faa)), dtype=dtype)
+
+    for start, block in geodesic_distance_blocks(df['lat'], df['lon'], block_size, dtype):
+        matrix[start:start + len(block)] = block
+
+    return pd.DataFrame(matrix, index=pd.Index(faa, name='faa'), columns=faa)
+
+
+def calculate_all_distances(df, block_size=DISTANCE_BLOCK_SIZE, dtype=np.float64):
+    """Calculates the geodesic distance between every ordered pair of different airports.
+    params: DataFrame with faa, lat and lon columns, number of rows per block, float32 or float64.
+    returns: long-format DataFrame with airport1, airport2 and distance_m columns.
+    """
+
+    faa = pd.Categorical(df['faa'])
+    n = len(faa)
+    codes = faa.codes
+    frames = []
+
+    for start, block in geodesic_distance_blocks(df['lat'], df['lon'], block_size, dtype):
+        rows = np.arange(start, start + len(block))
+
+        # Drop the diagonal, an airport's distance to itself
+        keep = rows[:, None] != np.arange(n)[None, :]
+        i, j = np.nonzero(keep)
+
+        frames.append(pd.DataFrame({
+            'airport1': pd.Categorical.from_codes(codes[rows[i]], faa.categories),
+            'airport2': pd.Categorical.from_codes(codes[j], faa.categories),
+            'distance_m': block[keep],
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=['airport1', 'airport2', 'distance_m'])
+
+    return pd.concat(frames, ignore_index=True)
 
 
@@ -1,117 +1,104 @@
 import sqlite3
+import aggregates
+import airport_registry
+import binning
+import database
+import delay_cube
+import delay_stats
+import dimensions
+import distances
+import jobs
 import part1
+from queries import FlightQuery
+import streaming_stats
+import weather_join
 import pandas as pd
+import numpy as np
 from matplotlib import pyplot as plt
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import LogNorm
 import plotly.graph_objects as go
-import seaborn as sns
-
-def get_df_from_database(query):
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-    cursor.execute(query)
-    df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description])
-    return df
 
 def get_faa(name):
-    query = f'SELECT faa,name FROM airports'
-    df = get_df_from_database(query)
-
-    row = df.loc[df['name'] == name, 'faa'].item()
-    return row
+    return airport_registry.get_airport_registry().faa_for(name)
 
-def verify_computed_distance(conn, csv_path="geodesic_distances.csv"):
+def verify_computed_distance(conn=None, output_csv="distance_comparison.csv"):
     """
-    Compare the flight distances stored in the database with geodesic distances from a CSV file.
+    Compare the flight distances stored in the database with the geodesic distance of each route.
     
     Params:
-    - conn: connection to the SQLite database.
-    - csv_path (str): Path to the geodesic distances CSV file.
+    - conn: optional connection to the SQLite database, the shared read pool is used when omitted.
+    - output_csv (str): Path the full comparison is written to, None to skip writing it.
     
     Returns:
     - merged_df (DataFrame): DataFrame containing flight distances and geodesic distances.
     """
     
-    flights_df = pd.read_sql_query("SELECT origin, dest, distance FROM flights;", conn)
-    
-    # Load the geodesic distances from CSV
-    geodesic_df = pd.read_csv(csv_path)
-
-    # Rename columns to match for easier merging
-    geodesic_df.rename(columns={"airport1": "origin", "airport2": "dest", "distance_m": "geodesic_distance"}, inplace=True)
+    # Only the routes that are actually flown are computed into the routes table,
+    # the job is versioned, so this only does work when flights changed since the last build
+    jobs.update_routes()
 
-    # Merge both DataFrames on origin and destination
-    merged_df = flights_df.merge(geodesic_df, on=["origin", "dest"], how="left")
-
-    # Compute the difference between actual and computed distances
-    merged_df["difference"] = merged_df["distance"] - merged_df["geodesic_distance"]
+    # Join every flight against its route and compute the difference between actual and computed distances
+    query = """
+        SELECT f.origin, f.dest, f.distance,
+               r.geodesic_distance,
+               f.distance - r.geodesic_distance AS difference
+        FROM flights AS f
+        LEFT JOIN routes AS r
+          ON r.origin = f.origin AND r.dest = f.dest;
+    """
+    merged_df = database.query(query, cache=False) if conn is None else pd.read_sql_query(query, conn)
 
     # Save results to CSV
-    merged_df.to_csv("distance_comparison.csv", index=False)
-
-    print("Comparison complete! Check 'distance_comparison.csv' for full results.")
+    if output_csv is not None:
+        merged_df.to_csv(output_csv, index=False)
+        print(f"Comparison complete! Check '{output_csv}' for full results.")
 
     return merged_df.head()
 
 def get_nyc_names(codes):
-    query = f'SELECT name, faa FROM airports'
-    df = get_df_from_database(query)
-
-    df = df[df['faa'].isin(codes)]
-    return list(df['name'])
+    return airport_registry.get_airport_registry().names_for(codes)
 
 def get_nyc_airports():
     """Retrieve all NYC airports from the database."""
     
     
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-    cursor.execute(f'SELECT origin FROM flights')
-
-    df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description])
+    df = database.query('SELECT origin FROM flights')
 
     airport_set = set(df['origin'])
-    conn.close()
     return get_nyc_names(airport_set)
 
 
 def visualize_flight_destinations(month_x, day_x, nyc_airport):
     """Generate a map of all destinations from a given NYC airport on a specific day, with airline info as hover text."""
     
-
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-
-
     query = """
     SELECT flights.dest, flights.carrier, 
-           airports.lat AS dest_lat, airports.lon AS dest_lon, 
            airlines.name AS airline_name
     FROM flights
-    JOIN airports ON flights.dest = airports.faa
     JOIN airlines ON flights.carrier = airlines.carrier
     WHERE flights.month = ? AND flights.day = ? AND flights.origin = ?;
     """
 
-    df = pd.read_sql_query(query, conn, params=(month_x, day_x, nyc_airport))
-
-    # Get origin airport coordinates
-    origin_query = "SELECT lat, lon FROM airports WHERE faa = ?;"
-    origin_data = pd.read_sql_query(origin_query, conn, params=(nyc_airport,))
+    df = database.query(query, (month_x, day_x, nyc_airport))
 
-    # Close connection
-    conn.close()
+    # Destination coordinates from the registry, flights to airports missing from the airports table are dropped
+    registry = airport_registry.get_airport_registry()
+    df = df[registry.positions(df['dest']) >= 0].reset_index(drop=True)
+    coords = registry.coords(df['dest'])
+    df['dest_lat'] = coords[:, 0]
+    df['dest_lon'] = coords[:, 1]
 
     # Check if flights exist
     if df.empty:
         print(f"No flights found from {nyc_airport} on {month_x}/{day_x}")
         return
     
-    if origin_data.empty: # also check if theere areany flights for that nyc airport
+    if nyc_airport not in registry: # also check if theere areany flights for that nyc airport
         print(f"Origin airport {nyc_airport} not found in airports table.")
         return
     
-    start_lat = origin_data["lat"].iloc[0]
-    start_lon = origin_data["lon"].iloc[0]
+    start_lat, start_lon = registry.lat_lon(nyc_airport)
 
     # Assign unique colors to airlines, for better visibility
     airlines_colors = {airline: f"rgb({i*30 % 255}, {(i*60) % 255}, {(i*90) % 255})" for i, airline in enumerate(df["airline_name"].unique())}
@@ -129,31 +116,10 @@ def visualize_flight_destinations(month_x, day_x, nyc_airport):
         showlegend=True
     ))
 
-    # Plot destinations and flight paths with airline info
-    for _, row in df.iterrows():
-        airline_info = f"Flight to {row['dest']}<br>Airline: {row['airline_name']}" #
-        color = airlines_colors[row["airline_name"]]
-
-        fig.add_trace(go.Scattergeo(
-            lon=[row["dest_lon"]],
-            lat=[row["dest_lat"]],
-            mode='markers',
-            name=row["airline_name"],  # Airline name in the legend
-            marker=dict(color=color, size=8),
-            text=airline_info, 
-            hoverinfo="text",
-            showlegend=True
-        ))
-
-        fig.add_trace(go.Scattergeo(
-            lon=[start_lon, row["dest_lon"]],
-            lat=[start_lat, row["dest_lat"]],
-            mode='lines',
-            line=dict(color=color, width=1),
-            text=airline_info, 
-            hoverinfo="text",
-            showlegend=False
-        ))
+    # Plot destinations and flight paths with airline info, one marker and one line trace per airline
+    df["origin_lat"] = start_lat
+    df["origin_lon"] = start_lon
+    part1.add_batched_paths(fig, df, group="airline_name", colors=airlines_colors, showlegend=True)
 
 
     fig.update_layout(
@@ -166,25 +132,21 @@ def visualize_flight_destinations(month_x, day_x, nyc_airport):
     fig.show()
 
 
-def get_flight_statistics(month_x, day_x, nyc_airport):
-    """Retrieve flight statistics for a given date and airport in NYC."""
-
-
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-
-
-    query = f'''
-    SELECT dest, carrier, dep_delay, distance
-    FROM flights
-    WHERE month = {month_x} AND day = {day_x} AND origin = '{nyc_airport}';
-    '''
+def get_flight_statistics(month_x, day_x, nyc_airport, store=None):
+    """Retrieve flight statistics for a given date and airport in NYC.
+    Reads from the in-memory FlightStore when one is given, otherwise from the database."""
 
-    cursor.execute(query)
-    flights = pd.DataFrame(cursor.fetchall(), columns=[x[0] for x in cursor.description])
+    if store is not None:
+        mask = store.mask(month=month_x, day=day_x, origin=nyc_airport)
+        flights = store.frame(['dest', 'carrier', 'dep_delay', 'distance'], mask)
+    else:
+        query = '''
+        SELECT dest, carrier, dep_delay, distance
+        FROM flights
+        WHERE month = ? AND day = ? AND origin = ?;
+        '''
 
-    # Close connection
-    conn.close()
+        flights = database.query(query, (month_x, day_x, nyc_airport))
 
     if flights.empty:
         print(f"No flight data available for {nyc_airport} on {month_x}/{day_x}")
@@ -225,72 +187,86 @@ Parameters:
     departure -> faa code for airport the flight is departing from
     arrival -> faa code for the airport the flight will be arriving at
 '''
-def get_airplane_usage(departure, arrival):
-    """Return a dictionary describing the number of times each plane type was used for a specific route."""
-
-    plane_dict = {'Fixed wing single engine': 0, 'Rotorcraft': 0, 'Fixed wing multi engine': 0}
-
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-
-    query1 = f'SELECT tailnum,origin,dest FROM flights'
-    query2 = f'SELECT tailnum,type FROM planes'
-
-    cursor.execute(query1)
-    flights = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description]) #Creates dataframe with data from flights table
+def _with_plane_column(counts, column):
+    """
+    Flight counts per tailnum with one planes column added from the cached planes dimension,
+    flights whose tailnum is not in planes are dropped, like an inner join on planes.
+    """
+    planes = dimensions.planes()
+    counts = counts[planes.contains(counts['tailnum'])].copy()
+    counts[column] = planes.map(counts['tailnum'], column)
+    return counts
+
+
+@database.versioned_cache()
+def _load_route_plane_usage(by):
+    """(usage table, {(origin, dest): {value: num_flights}}) for one planes column, rebuilt when the database changes."""
+    # Counts flights per route and tailnum for every route at once in SQLite,
+    # then resolves the planes column in memory and adds up the tailnums of each value
+    counts = (FlightQuery()
+              .select('origin', 'dest', 'tailnum')
+              .count()
+              .group_by('origin', 'dest', 'tailnum')
+              .fetch())
+    table = (_with_plane_column(counts, by)
+             .groupby(['origin', 'dest', by], dropna=False)['num_flights'].sum()
+             .reset_index())
+
+    lookup = {}
+    for origin, dest, value, num in zip(table['origin'], table['dest'], table[by], table['num_flights']):
+        lookup.setdefault((origin, dest), {})[value] = int(num)
+
+    return table, lookup
+
+
+def route_plane_usage(by='type'):
+    """
+    Number of flights per route and plane type (or another planes column such as 'manufacturer' or 'model')
+    for every (origin, dest) route, from one group-by and the cached planes dimension. Cached until the database changes.
+    returns: DataFrame with origin, dest, <by> and num_flights columns
+    """
+    return _load_route_plane_usage(by)[0].copy()
 
-    cursor.execute(query2)
-    planes = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description]) #Creates dataframe with data from planes table
 
-    planes_lst = list(planes['tailnum']) #Makes list of all the 'tailnum' column from planes dataframe
+def route_usage(departure, arrival, by='type'):
+    """Usage counts of one route from the cached route_plane_usage table, {value: num_flights}."""
+    return dict(_load_route_plane_usage(by)[1].get((departure, arrival), {}))
 
-    #Filters data in flights dataframe to only include flights from given origin to destination
-    flights = flights[flights['origin'] == departure]
-    flights = flights[flights['dest'] == arrival]
 
-    #Iterates through each tailnum of the the filtered flights dataframe
-    for flight in list(flights['tailnum']):
-        #Increases the plane type counter in the dictionary if the flight has a tailnum in the planes dataframe
-        if flight in planes_lst:
-            plane_type = planes['type'].loc[planes_lst.index(flight)]
-            plane_dict[plane_type] += 1
+def get_airplane_usage(departure, arrival):
+    """Return a dictionary describing the number of times each plane type was used for a specific route."""
 
+    plane_dict = {'Fixed wing single engine': 0, 'Rotorcraft': 0, 'Fixed wing multi engine': 0}
+    plane_dict.update(route_usage(departure, arrival))
 
     return plane_dict #Returns the dictionary with the count of each plane type
 
     
 
-def average_departure_delay():
-    """Compute and visualize the average departure delay per airline."""
+def average_departure_delay(use_store=False):
+    """Compute and visualize the average departure delay per airline.
+    Flights without a departure delay (cancelled) are left out of the average.
+    Reads the agg_carrier_delay summary table when it is up to date, otherwise the cached
+    carrier delay statistics (from the shared in-memory FlightStore when use_store is set)."""
 
     delay_dict = {} #Empty dictionary to hold delay times for each airline
 
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-
-    query1 = f'SELECT * FROM airlines'
-    query2 = f'SELECT dep_delay, carrier FROM flights'
-
-    cursor.execute(query1)
-    airlines_df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description]) 
-    airlines_df.index = airlines_df['carrier'] #Sets airline dataframe indexes to be their carrier
+    airlines = dimensions.airlines() #Cached airlines table, looked up by carrier
 
-    cursor.execute(query2)
-    flights_df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description])
+    carrier_delays = aggregates.query_aggregate('agg_carrier_delay', 'SELECT carrier, delay_sum, delay_count FROM agg_carrier_delay')
 
-    airline_set = set(airlines_df['carrier']) #Creates set of airline carriers, getting all the names with no duplicants
+    if carrier_delays is not None:
+        carrier_delays['mean'] = carrier_delays['delay_sum'] / carrier_delays['delay_count'].where(carrier_delays['delay_count'] > 0)
+    else:
+        carrier_delays = delay_stats.carrier_delay_stats(use_store=use_store) #Mean delay per carrier from one group-by
+    means = carrier_delays.set_index('carrier')['mean']
 
-    # Iterates through each carrier
-    for carrier in airline_set:
-        filtered_flights = flights_df[flights_df['carrier'] == carrier] #Filteres flight dataframe by that carrier
+    # Every airline gets an entry, airlines without any delay data get NaN
+    for carrier in airlines.keys:
+        average = round(float(means.get(carrier, float('nan'))), 2) #Calculates the average for each carrier and rounds it to 2 decimal places
 
-        sum = filtered_flights['dep_delay'].sum() #Gets the sum of all the delays for that carrier
-        total = filtered_flights['dep_delay'].size #Gets the total number of flights for that carrier
-
-        average = round(sum / total, 2) #Calculates the average for each carrier and rounds it to 2 decimal places
-
-        name = airlines_df.loc[carrier] #Gets the full airline name by the carrier index
-        delay_dict[name[1]] = average #Adds the carrier to the dictionary and sets its value to the average delay time
+        name = airlines.get(carrier, 'name') #Gets the full airline name by the carrier
+        delay_dict[name] = average #Adds the carrier to the dictionary and sets its value to the average delay time
 
     # #Sets up pyplot
     # plt.figure(figsize=(7,7))
@@ -312,28 +288,11 @@ Parameters:
 '''
 def delayed_flights_by_destination(months, dest):
     """Return the number of delayed flights to a given destination within a specified time range."""
-    
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-
-    query1 = f'SELECT month,dep_delay,dest FROM flights'
-
-    cursor.execute(query1)
-
-    flights_df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description]) #Creates dataframe from flights table
-    
-    # Filters the flights dataframe by destination airport and if the flight is in the given range of months
-    flights_df = flights_df[flights_df['dest'] == dest]
-    flights_df = flights_df[flights_df['month'].isin(months)]
 
-    delays = list(flights_df['dep_delay']) #Creates a list from departure delay column of dataframe
-    
-    delayed_flights = 0 #Counter for number of delayed flights
-    # Iterates through each delay value
-    for num in delays:
-        #If the value is positive that means a delay occurred and the delayed flight counter will be increased by 1
-        if num > 0:
-            delayed_flights += 1
+    # Flights to the destination with a positive departure delay, summed over each listed month once in every year of the delay cube
+    cube = delay_cube.get_delay_cube()
+    delayed_flights = sum(cube.counts({'dest': dest}, cube.month_range(month, year))['delayed']
+                          for year in cube.years() for month in sorted(set(months)))
 
     return delayed_flights # Returns the total number of delayed flights
 
@@ -341,50 +300,67 @@ def delayed_flights_by_destination(months, dest):
 Parameters:
     dest -> faa code for destination airport
 '''
-def top_airplane_manufacturers(dest):
-    """Return the top 5 airplane manufacturers with planes departing to the specified destination."""
-    
-    lst = []
-
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
+@database.versioned_cache()
+def _load_destination_manufacturers():
+    """(ranking table, {dest: rows of that destination}), rebuilt when the database changes."""
+    # Flights per destination and tailnum for every destination at once in SQLite, then flights and
+    # distinct planes per destination and manufacturer, resolved through the cached planes dimension
+    counts = (FlightQuery()
+              .select('dest', 'tailnum')
+              .count()
+              .group_by('dest', 'tailnum')
+              .fetch())
+    table = (_with_plane_column(counts, 'manufacturer')
+             .groupby(['dest', 'manufacturer'], dropna=False)
+             .agg(num_flights=('num_flights', 'sum'), num_planes=('tailnum', 'nunique'))
+             .reset_index())
+
+    # Share of the destination's flights and rank by flights and by planes, ties broken by name
+    totals = table.groupby('dest')['num_flights'].transform('sum')
+    table['percentage'] = (table['num_flights'] / totals * 100).round(2)
+    table = table.sort_values(['dest', 'num_flights', 'manufacturer'], ascending=[True, False, True])
+    table['flight_rank'] = table.groupby('dest').cumcount() + 1
+    table = table.sort_values(['dest', 'num_planes', 'manufacturer'], ascending=[True, False, True])
+    table['plane_rank'] = table.groupby('dest').cumcount() + 1
+    table = table.sort_values(['dest', 'flight_rank']).reset_index(drop=True)
+
+    lookup = {dest: rows.reset_index(drop=True) for dest, rows in table.groupby('dest', sort=False)}
+    return table, lookup
+
+
+def destination_manufacturers():
+    """
+    Number of flights and distinct planes per manufacturer for every destination, from one group-by and the planes dimension.
+    Cached until the database changes.
+    returns: DataFrame with dest, manufacturer, num_flights, num_planes, percentage (of the destination's
+             flights with a known manufacturer), flight_rank and plane_rank columns
+    """
+    return _load_destination_manufacturers()[0].copy()
 
-    query1 = f'SELECT tailnum, dest FROM flights'
-    cursor.execute(query1)
-    flights_df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description]) #Dataframe of flights data
-    
-    query2 = f'SELECT tailnum, manufacturer FROM planes'
-    cursor.execute(query2)
-    planes_df = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description]) #Dataframe of planes data
 
-    flights_df = flights_df[flights_df['dest'] == dest] #Fliters the flights dataframe based on the given desitnation airport
-    
-    tailnum_lst = list(flights_df['tailnum']) #Creates a list of all the tailnum values in the filtered flights dataframe
+def top_manufacturers(dest, k=5, by='num_flights'):
+    """Top k manufacturers of one destination ranked by num_flights or num_planes, a keyed lookup in the cached table."""
+    rank = {'num_flights': 'flight_rank', 'num_planes': 'plane_rank'}[by]
+    rows = _load_destination_manufacturers()[1].get(dest)
+    if rows is None:
+        return destination_manufacturers().iloc[0:0]
+    return rows[rows[rank] <= k].sort_values(rank).reset_index(drop=True)
 
-    manufacturers = set(planes_df['manufacturer']) #Gets all the names of the manufacturers in the planes dataframe
 
-    # Iterates throught each manufacture
-    for man in manufacturers:
-        #Filters the plane data frame based on the the current manufacturer and if the tailnum is from a flight to given destination
-        df = planes_df[planes_df['manufacturer'] == man]
-        df = df[df['tailnum'].isin(tailnum_lst)]
+def top_airplane_manufacturers(dest):
+    """Return the top 5 airplane manufacturers with planes departing to the specified destination."""
+    
+    # Ranks manufacturers by the number of distinct planes that flew to the destination
+    df = top_manufacturers(dest, k=5, by='num_planes')
 
-        lst.append((df.size,man)) # Adds a tuple to a list in the form (number of planes creates, manufacturer)
+    rtn_lst = list(df['manufacturer'])
 
-    lst.sort(reverse=True,key=lambda tup: tup[0]) #Sorts list from high to low based on number of planes created by the manufacturer
-    
-    #Creates a list of the top five manufacturer names
-    rtn_lst = []
-    for i in range(5):
-        rtn_lst.append(lst[i][1])
-    
     return rtn_lst #Returns the list of top 5 manufacturers
 
     
 
 def analyze_distance_vs_arrival_delay():
     """Investigate the relationship between flight distance and arrival delay time."""
-    conn = sqlite3.connect('flights_database.db')
 
     # Query to select distance and arr_delay where both columns have a non-null value for that entry.
     query = """
@@ -393,132 +369,70 @@ def analyze_distance_vs_arrival_delay():
     WHERE arr_delay IS NOT NULL AND distance IS NOT NULL;
     """
 
-    df = pd.read_sql_query(query, conn)
+    # Summary statistics are computed while streaming the rows in chunks (see streaming_stats.py), the flights are never all in memory
+    stats = streaming_stats.stream_query(query)
 
-    # Close the connection
-    conn.close()
+    # Get summary statistics, specifically the count, mean, standard deviation, minimum, Q1, median, Q3, and maximum for distance and arr_delay
+    print(stats.describe())
 
-    # Get summary statistics of the data frame, specifically the count, mean, standard deviation, minimum, Q1, median, Q3, and maximum for distance and arr_delay
-    print(df.describe())
+    # Density grid of the flights with the mean and median delay per distance column instead of a scatter of every
+    # flight, binned in chunks (see binning.py) so drawing takes the same time for any number of flights
+    density = binning.density('distance_vs_arrival_delay')
+    profile = density.profile()
 
-    # Set up the scatter plot
     plt.figure(figsize=(10,6))
-    sns.scatterplot(x='distance', y='arr_delay', data=df, alpha=0.5)
+    plt.pcolormesh(density.bins.x_edges, density.bins.y_edges, np.ma.masked_equal(density.grid().T, 0),
+                   norm=LogNorm(), cmap='viridis')
+    plt.colorbar(label='Flights')
+    plt.plot(profile['x'], profile['mean'], color='red', label='Mean delay')
+    plt.plot(profile['x'], profile['p50'], color='orange', label='Median delay')
+    plt.legend()
     plt.title('Flight Distance vs Arrival Delay Time')
     plt.xlabel('Distance (miles)')
     plt.ylabel('Arrival Delay Time (minutes)')
     plt.grid(True)
 
-    # Display the scatter plot
+    # Display the plot
     plt.show()
 
     # Compute the correlation between distance and arr_delay
-    correlation = df['distance'].corr(df['arr_delay'])
+    correlation = stats.corr().loc['distance', 'arr_delay']
     # Print out the correlation
     print(f"Correlation coefficient between flight distance and arrival delay time: {correlation:.2f}")
    
-def calculate_average_plane_speed():
-    """Calculate the average speed (in mph) for each plane model.
-    and update the speed column in the planes table."""
-
-    
-    conn = sqlite3.connect('flights_database.db')
-
-    flights_df = pd.read_sql_query("SELECT tailnum, distance, air_time FROM flights WHERE air_time > 0", conn)
-    planes_df = pd.read_sql_query("SELECT tailnum, model, speed FROM planes", conn)
-
-    # Compute the average speed per tailnum (aircraft)
-    flights_df["speed"] = flights_df["distance"] / (flights_df["air_time"] / 60)  # Convert air_time to hours
-    avg_speeds = round((flights_df.groupby("tailnum")["speed"].mean().reset_index()), 4)  # Average speed per tailnum and round to 4dp
+def calculate_average_plane_speed(force=False):
+    """Calculate the average speed (in mph) for each plane
+    and update the speed column in the planes table.
+    Runs as the plane_speed job (see jobs.py): one bulk UPDATE, skipped when the flights data has not changed."""
 
-    # Merge the new speeds with planes DataFrame
-    planes_df = planes_df.merge(avg_speeds, on="tailnum", how="left")
+    return jobs.update_plane_speeds(force)
 
-    # # Rename columns correctly, after merging the tables the columns came out as speed_y(the average speed calculated), speed_x(old speed(0))
-    planes_df.rename(columns={"speed_y": "speed", "speed_x": "old_speed"}, inplace=True)
 
-    # Drop the old speed column 
-    planes_df.drop(columns=["old_speed"], inplace=True)
 
-    # Remove rows where speed couldn't be calculated
-    planes_df.dropna(subset=["speed"], inplace=True)
-
-    #  Update the database with the computed speeds
-    for index, row in planes_df.iterrows():
-        conn.execute("UPDATE planes SET speed = ? WHERE tailnum = ?", (row["speed"], row["tailnum"]))
-
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
-
-    print("Speed column updated successfully in planes table using Pandas.")
-
-
-
-def compute_flight_directions(conn):
+def compute_flight_directions(conn=None, force=False):
     """
-    Determine the flight direction (direction_x, direction_y) for each flight
+    Determine the flight direction of every route: the initial great-circle bearing and its
+    unit vector (direction_x east, direction_y north), stored in the routes table (see distances.py).
+    Flights get their direction by joining routes on origin and dest.
+    Runs as the routes job when no connection is given, otherwise rebuilds the table on that connection.
     """
+    if conn is not None:
+        return distances.build_routes(conn)
 
-    cursor = conn.cursor()
-    try:
-        cursor.execute("ALTER TABLE flights ADD COLUMN direction_x REAL")
-    except sqlite3.OperationalError:
-        pass  
-
-    try:
-        cursor.execute("ALTER TABLE flights ADD COLUMN direction_y REAL")
-    except sqlite3.OperationalError:
-        pass  
+    jobs.update_routes(force)
+    return database.query(f'SELECT * FROM {distances.ROUTES_TABLE}', cache=False)
 
-    # 1) JOIN flights->airports (origin) and flights->airports (dest)
-    query = """
-        SELECT 
-            f.rowid AS flight_rowid,
-            f.origin, 
-            f.dest,
-            a1.lat AS origin_lat,
-            a1.lon AS origin_lon,
-            a2.lat AS dest_lat,
-            a2.lon AS dest_lon
-        FROM flights AS f
-        JOIN airports a1
-          ON f.origin = a1.faa
-        JOIN airports a2
-          ON f.dest   = a2.faa
+def compute_wind_effect_on_flights(conn=None, tolerance=weather_join.WEATHER_TOLERANCE_HOURS):
     """
-    df = pd.read_sql_query(query, conn)
-    
-    if df.empty:
-        print("No flights/airports data found. Check your joins or data.")
-        return df
-    
-    # 2) Compute direction as simple difference in lon and lat
-
-    df['direction_x'] = df['dest_lon'] - df['origin_lon']
-    df['direction_y'] = df['dest_lat'] - df['origin_lat']
-    
-    # 3) Update 'flights' table with direction_x, direction_y 
-    update_data = df[['direction_x','direction_y','flight_rowid']].values.tolist()
-    
-    try:
-        cursor.executemany("""
-            UPDATE flights
-               SET direction_x = ?,
-                   direction_y = ?
-             WHERE rowid = ?
-        """, update_data)
-        conn.commit()
-        print("Updated flights.direction_x, flights.direction_y successfully.")
-    except sqlite3.OperationalError as e:
-        print("Could not update flights table with direction_x/direction_y. Check if columns exist.")
-        print("Error:", e)
-    finally:
-        cursor.close()
-
-    return df
-
-def compute_wind_effect_on_flights(conn):
+    Wind speed component along the route of every flight, from the weather observation closest to its
+    scheduled hour at the origin (see weather_join.py), stored in flights.wind_effect.
+    Positive values are tailwinds, negative values headwinds.
+    Uses the shared writer connection when no connection is given.
+    """
+    if conn is None:
+        jobs.update_routes()
+        with database.write_connection() as conn:
+            return compute_wind_effect_on_flights(conn, tolerance)
 
     cursor = conn.cursor()
     try:
@@ -531,38 +445,40 @@ def compute_wind_effect_on_flights(conn):
             f.rowid AS flight_rowid,
             f.origin,
             f.dest,
-            f.direction_x,
-            f.direction_y,
-            -- no more origin_lon, dest_lon, etc. needed 
-            w.wind_speed,
-            w.wind_dir
+            f.year,
+            f.month,
+            f.day,
+            f.hour,
+            r.direction_x,
+            r.direction_y
         FROM flights AS f
-        JOIN weather AS w
-          ON f.origin = w.origin
-         AND f.year   = w.year
-         AND f.month  = w.month
-         AND f.day    = w.day
-         AND f.hour   = w.hour
+        JOIN routes AS r
+          ON r.origin = f.origin
+         AND r.dest   = f.dest
     """
 
     df = pd.read_sql_query(query, conn)
     if df.empty:
-        print("No joined weather/flight data found. Check your JOIN conditions.")
+        print("No flights with a known route found. Check the routes table.")
         return df
 
-    # Convert wind_dir to radians
+    # Nearest weather observation at the origin within the tolerance, flights without one get no wind effect
+    df = weather_join.attach_weather(df, ['wind_speed', 'wind_dir'], tolerance)
+
+    # Convert wind_dir to radians. wind_dir is the direction the wind blows from,
+    # so the wind vector (x east, y north) points the opposite way
     df['wind_dir_radians'] = np.radians(df['wind_dir'])
-    df['wind_x'] = df['wind_speed'] * np.sin(df['wind_dir_radians'])
-    df['wind_y'] = df['wind_speed'] * np.cos(df['wind_dir_radians'])
+    df['wind_x'] = -df['wind_speed'] * np.sin(df['wind_dir_radians'])
+    df['wind_y'] = -df['wind_speed'] * np.cos(df['wind_dir_radians'])
 
-    # Dot product with direction_x, direction_y
+    # Dot product with the unit route direction: the wind speed component along the flight path,
+    # positive for a tailwind and negative for a headwind
     df['wind_effect'] = df['direction_x'] * df['wind_x'] + df['direction_y'] * df['wind_y']
 
     print(df[['flight_rowid','origin','dest','wind_speed','wind_dir','wind_effect']].head())
 
-    update_data = df[['wind_effect','flight_rowid']].values.tolist()
     try:
-        cursor.executemany("UPDATE flights SET wind_effect = ? WHERE rowid = ?", update_data)
+        jobs.bulk_update(conn, 'flights', df, ['wind_effect'], df_key='flight_rowid')
         conn.commit()
         print("Wind effect computed and stored in flights.wind_effect.")
     except sqlite3.OperationalError as e:
@@ -573,50 +489,36 @@ def compute_wind_effect_on_flights(conn):
 
     return df
 
-def analyze_wind_effect_on_air_time(conn):
+def analyze_wind_effect_on_air_time():
     """
     Analyze if the wind effect (dot product between flight direction and wind vector)
     has a relationship with air time. Specifically, we check whether flights with
     a positive wind effect (tailwind) differ in average air time from those with
-    a negative wind effect (headwind).
+    a negative wind effect (headwind). Reads flights.wind_effect as stored by
+    compute_wind_effect_on_flights, rerun it on databases computed before the sign fix.
     """
 
-    # 1) Query the flights table for wind_effect, air_time
-    query = """
-        SELECT wind_effect, air_time
-          FROM flights
-         WHERE wind_effect IS NOT NULL
-           AND air_time    IS NOT NULL
-    """
-    df = pd.read_sql_query(query, conn)
+    # 1) Bin wind_effect against air_time in hexagons, the flights are read in chunks (see binning.py)
+    stats = binning.density('wind_effect_vs_air_time', kind='hex')
 
     # If the table or columns are empty, just return
-    if df.empty:
+    if stats.count.sum() == 0:
         print("No data found with both wind_effect and air_time.")
         return
 
-       # 2) Split the DataFrame into positive and negative subsets
-    df_pos = df[df['wind_effect'] >= 0]
-    df_neg = df[df['wind_effect'] < 0]
-
-    # 3) QQ-plots 
-    fig, axs = plt.subplots(1, 2, figsize=(12, 6), sharey=True)
+    # 2) Tailwind flights (wind blowing along the route) lie right of zero, headwind flights left of it
+    cells = stats.count > 0
+    fig, ax = plt.subplots(figsize=(12, 6))
     fig.suptitle('Wind Effect vs. Air Time (Tailwind vs. Headwind)')
 
-    # --- PLOT 1: Positive (Tailwind) ---
-    axs[0].scatter(df_pos['wind_effect'], df_pos['air_time'],
-                   color='blue', alpha=0.5)
-    axs[0].set_title('Positive Wind Effect (Tailwind)')
-    axs[0].set_xlabel('Wind Effect (Dot Product)')
-    axs[0].set_ylabel('Air Time (minutes)')
-    axs[0].grid(True)
-
-    # --- PLOT 2: Negative (Headwind) ---
-    axs[1].scatter(df_neg['wind_effect'], df_neg['air_time'],
-                   color='red', alpha=0.5)
-    axs[1].set_title('Negative Wind Effect (Headwind)')
-    axs[1].set_xlabel('Wind Effect (Dot Product)')
-    axs[1].grid(True)
+    hexagons = PolyCollection(stats.bins.polygons()[cells], array=stats.count[cells], cmap='viridis', norm=LogNorm())
+    ax.add_collection(hexagons)
+    ax.autoscale_view()
+    fig.colorbar(hexagons, ax=ax, label='Flights')
+    ax.axvline(0, color='black', linestyle='--')
+    ax.set_xlabel('Wind Effect (mph along the route)')
+    ax.set_ylabel('Air Time (minutes)')
+    ax.grid(True)
 
     plt.tight_layout()
     plt.show()
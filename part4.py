@@ -1,4 +1,7 @@
 import sqlite3
+import database
+import jobs
+import weather_join
 import pandas as pd
 import openmeteo_requests
 import requests_cache
@@ -17,13 +20,8 @@ def find_duplicants():
 
     flights_dict = dict()
 
-    conn = sqlite3.connect('flights_database.db')
-    cursor = conn.cursor()
-
     query = f'SELECT * FROM flights'
-    cursor.execute(query)
-
-    flights = pd.DataFrame(cursor.fetchall(), columns = [x[0] for x in cursor.description])
+    flights = database.query(query)
     
 
     dups = flights.duplicated()
@@ -127,12 +125,15 @@ def validate_flight_data(conn):
 
 
 #Create a column for local arrival time considering time zone differences
-def compute_local_arrival_time(conn):
+def compute_local_arrival_time(conn=None):
     """
     Compute the local arrival time for each flight by adjusting `arr_time`
     using the time difference between departure and arrival airports.
-    
+    Uses the shared writer connection when no connection is given.
     """
+    if conn is None:
+        with database.write_connection() as conn:
+            return compute_local_arrival_time(conn)
 
     cursor = conn.cursor()
 
@@ -181,11 +182,8 @@ def compute_local_arrival_time(conn):
     df['local_arr_time_minutes'] = df['local_arr_time_total_minutes'] % 60
     df['local_arr_time'] = df['local_arr_time_hours'] * 100 + df['local_arr_time_minutes']
 
-    # Prepare data for update
-    update_data = df[['local_arr_time', 'flight_rowid']].values.tolist()
-
     try:
-        cursor.executemany("UPDATE flights SET local_arr_time = ? WHERE rowid = ?", update_data)
+        jobs.bulk_update(conn, 'flights', df, ['local_arr_time'], df_key='flight_rowid')
         conn.commit()
         # print("Updated flights.local_arr_time successfully.")
     except sqlite3.OperationalError as e:
@@ -211,8 +209,18 @@ def analyze_fastest_flights(conn):
 	pass
 def analyze_most_frequent_routes(conn):
 	pass
-def analyze_weather_vs_delay(conn):
-	pass
+def analyze_weather_vs_delay(conn=None):
+    """
+    Correlation of the departure delay with every weather variable, using the observation at the origin
+    closest to the scheduled departure hour (see weather_join.py).
+    returns: Series indexed by weather column.
+    """
+    query = "SELECT origin, year, month, day, hour, dep_delay FROM flights WHERE dep_delay IS NOT NULL"
+    df = database.query(query) if conn is None else pd.read_sql_query(query, conn)
+    df = weather_join.attach_weather(df)
+
+    columns = [c for c in weather_join.WEATHER_COLUMNS if c in df.columns]
+    return df[['dep_delay'] + columns].corr()['dep_delay'].drop('dep_delay')
 
 
 ###########  Import missing temperature entries  for JFK, LGA, EWR  ###########
@@ -223,8 +231,6 @@ cache_session = requests_cache.CachedSession('.cache', expire_after=-1)
 retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
 openmeteo = openmeteo_requests.Client(session=retry_session)
 
-DB_PATH = "flights_database.db"
-
 
 # Define coordinates
 airport_coords = {
@@ -289,10 +295,7 @@ def get_openmeteo_daily_temperatures():
     return pd.concat(all_data, ignore_index=True) if all_data else pd.DataFrame()
 
 def load_weather_from_db():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM weather", conn)
-    conn.close()
-    return df
+    return database.query("SELECT * FROM weather")
 
 def merge_and_fill_weather(weather_df, temp_df):
     """Merge temperature data and fill missing temperature values (only for JFK, LGA, EWR)."""
@@ -345,7 +348,7 @@ def ensure_weather_columns(conn):
     conn.commit()
 
 
-def save_daily_temperatures_to_db(merged_df, db_path='flights_database.db'):
+def save_daily_temperatures_to_db(merged_df):
     """Adds temp_min, temp_avg, temp_max columns to the weather table and fills them."""
 
     print("[DEBUG] Columns in merged_df:", merged_df.columns.tolist())  # 🔍 DEBUG LINE
@@ -359,35 +362,31 @@ def save_daily_temperatures_to_db(merged_df, db_path='flights_database.db'):
         print("[ABORT] Cannot proceed with saving to DB. Missing required columns.")
         return
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    with database.write_connection() as conn:
+        cursor = conn.cursor()
 
-    # Add columns if not exist
-    for col in ['temp_min', 'temp_avg', 'temp_max']:
-        try:
-            cursor.execute(f"ALTER TABLE weather ADD COLUMN {col} REAL")
-        except sqlite3.OperationalError:
-            pass
+        # Add columns if not exist
+        for col in ['temp_min', 'temp_avg', 'temp_max']:
+            try:
+                cursor.execute(f"ALTER TABLE weather ADD COLUMN {col} REAL")
+            except sqlite3.OperationalError:
+                pass
 
-    # Prepare updates
-    updates = merged_df[required_cols].dropna()
+        # Prepare updates
+        updates = merged_df[required_cols].dropna()
 
-    update_query = """
-        UPDATE weather
-        SET temp_min = ?, temp_avg = ?, temp_max = ?
-        WHERE origin = ? AND month = ? AND day = ?
-    """
-    cursor.executemany(update_query, updates.values.tolist())
-    conn.commit()
+        update_query = """
+            UPDATE weather
+            SET temp_min = ?, temp_avg = ?, temp_max = ?
+            WHERE origin = ? AND month = ? AND day = ?
+        """
+        cursor.executemany(update_query, updates.values.tolist())
 
     print(f"[INFO] Updated {cursor.rowcount} rows in weather table.")
-    conn.close()
 
 
 def verify_temperature_columns():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT origin, month, day, temp_min, temp_avg, temp_max FROM weather LIMIT 10", conn)
-    conn.close()
+    df = database.query("SELECT origin, month, day, temp_min, temp_avg, temp_max FROM weather LIMIT 10")
     print(df.head())
     print(df[["temp_min", "temp_avg", "temp_max"]].isna().sum())
     return df
@@ -0,0 +1,203 @@
+import database
+
+
+
+# Column types of every table the builder can touch. Filter values are checked against these
+# and column names are only ever taken from here, so user input never ends up in the SQL text.
+TABLE_COLUMNS = {
+    'flights': {
+        'year': int, 'month': int, 'day': int,
+        'dep_time': float, 'sched_dep_time': int, 'dep_delay': float,
+        'arr_time': float, 'sched_arr_time': int, 'arr_delay': float,
+        'carrier': str, 'flight': int, 'tailnum': str,
+        'origin': str, 'dest': str,
+        'air_time': float, 'distance': float,
+        'hour': int, 'minute': int, 'time_hour': str,
+    },
+    'planes': {
+        'tailnum': str, 'year': int, 'type': str, 'manufacturer': str, 'model': str,
+        'engines': int, 'seats': int, 'speed': float, 'engine': str,
+    },
+    'airlines': {
+        'carrier': str, 'name': str,
+    },
+}
+
+# How each dimension table is attached to flights
+JOINS = {
+    'planes': 'JOIN planes ON planes.tailnum = flights.tailnum',
+    'airlines': 'JOIN airlines ON airlines.carrier = flights.carrier',
+}
+
+COMPARISONS = ('=', '!=', '<', '<=', '>', '>=')
+AGGREGATES = ('COUNT', 'SUM', 'AVG', 'MIN', 'MAX')
+
+
+class FlightQuery:
+    """
+    Builds a parameterized SELECT over the flights table.
+    Filters are pushed down into the WHERE clause with bound parameters so only matching rows leave SQLite.
+
+    Example:
+        FlightQuery().select('carrier').count().where(origin='JFK', month=[1, 2]).group_by('carrier').fetch()
+    """
+
+    def __init__(self):
+        self._joins = []
+        self._columns = []
+        self._conditions = []
+        self._params = []
+        self._group_by = []
+        self._order_by = []
+        self._limit = None
+
+    ############# column handling ############################
+
+    def _resolve(self, column):
+        """Return the qualified column name and its python type, raising ValueError for unknown columns."""
+        table, _, name = column.rpartition('.')
+        table = table or 'flights'
+
+        if table != 'flights' and table not in self._joins:
+            raise ValueError(f"Table '{table}' must be joined before using column '{column}'")
+        if name not in TABLE_COLUMNS.get(table, {}):
+            raise ValueError(f"Unknown column '{column}'")
+
+        return f'{table}.{name}', TABLE_COLUMNS[table][name]
+
+    def _check_value(self, column, kind, value):
+        if value is None:
+            return value
+        if kind is str and not isinstance(value, str):
+            raise TypeError(f"Filter on '{column}' expects a string, got {type(value).__name__}")
+        if kind in (int, float):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                # numpy scalars are accepted through their python equivalent
+                if hasattr(value, 'item'):
+                    return value.item()
+                raise TypeError(f"Filter on '{column}' expects a number, got {type(value).__name__}")
+        return value
+
+    ############# builder methods ############################
+
+    def join(self, table):
+        """Join a dimension table (planes or airlines) onto flights."""
+        if table not in JOINS:
+            raise ValueError(f"Cannot join table '{table}'")
+        if table not in self._joins:
+            self._joins.append(table)
+        return self
+
+    def select(self, *columns):
+        """Add columns to the projection. Use 'table.column' for joined tables."""
+        for column in columns:
+            qualified, _ = self._resolve(column)
+            self._columns.append(f'{qualified} AS {column.rpartition(".")[2]}')
+        return self
+
+    def aggregate(self, func, column='*', alias=None, distinct=False):
+        """Add an aggregate (COUNT, SUM, AVG, MIN, MAX) to the projection."""
+        func = func.upper()
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{func}'")
+
+        if column == '*':
+            if func != 'COUNT' or distinct:
+                raise ValueError("Only COUNT(*) may be used without a column")
+            target = '*'
+        else:
+            target, _ = self._resolve(column)
+            if distinct:
+                target = f'DISTINCT {target}'
+
+        alias = alias or f"{func.lower()}_{column.rpartition('.')[2] if column != '*' else 'rows'}"
+        if not alias.isidentifier():
+            raise ValueError(f"Invalid alias '{alias}'")
+        self._columns.append(f'{func}({target}) AS {alias}')
+        return self
+
+    def count(self, alias='num_flights'):
+        """Shortcut for COUNT(*)."""
+        return self.aggregate('COUNT', '*', alias)
+
+    def where(self, **filters):
+        """
+        Add equality filters. A list, tuple or set becomes an IN clause and None becomes IS NULL.
+        Keyword names are flights columns, e.g. where(origin='JFK', month=[1, 2, 3]).
+        """
+        for column, value in filters.items():
+            qualified, kind = self._resolve(column)
+
+            if value is None:
+                self._conditions.append(f'{qualified} IS NULL')
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                values = [self._check_value(column, kind, v) for v in value]
+                if not values:
+                    # An empty IN list can never match
+                    self._conditions.append('0')
+                    continue
+                placeholders = ', '.join('?' for _ in values)
+                self._conditions.append(f'{qualified} IN ({placeholders})')
+                self._params.extend(values)
+            else:
+                self._conditions.append(f'{qualified} = ?')
+                self._params.append(self._check_value(column, kind, value))
+        return self
+
+    def where_compare(self, column, op, value):
+        """Add a comparison filter such as where_compare('dep_delay', '>', 0)."""
+        if op not in COMPARISONS:
+            raise ValueError(f"Unknown comparison '{op}'")
+        qualified, kind = self._resolve(column)
+        self._conditions.append(f'{qualified} {op} ?')
+        self._params.append(self._check_value(column, kind, value))
+        return self
+
+    def where_not_null(self, *columns):
+        for column in columns:
+            qualified, _ = self._resolve(column)
+            self._conditions.append(f'{qualified} IS NOT NULL')
+        return self
+
+    def group_by(self, *columns):
+        for column in columns:
+            qualified, _ = self._resolve(column)
+            self._group_by.append(qualified)
+        return self
+
+    def order_by(self, column, descending=False):
+        """Order by a flights column or by the alias of an aggregate in the projection."""
+        if any(c.endswith(f' AS {column}') for c in self._columns):
+            target = column
+        else:
+            target, _ = self._resolve(column)
+        self._order_by.append(f'{target} DESC' if descending else target)
+        return self
+
+    def limit(self, n):
+        self._limit = int(n)
+        return self
+
+    ############# output ############################
+
+    def to_sql(self):
+        """Return the (sql, params) pair for this query."""
+        columns = ', '.join(self._columns) if self._columns else 'flights.*'
+        sql = [f'SELECT {columns}', 'FROM flights']
+        sql.extend(JOINS[table] for table in self._joins)
+
+        if self._conditions:
+            sql.append('WHERE ' + ' AND '.join(self._conditions))
+        if self._group_by:
+            sql.append('GROUP BY ' + ', '.join(self._group_by))
+        if self._order_by:
+            sql.append('ORDER BY ' + ', '.join(self._order_by))
+        if self._limit is not None:
+            sql.append(f'LIMIT {self._limit}')
+
+        return '\n'.join(sql), tuple(self._params)
+
+    def fetch(self):
+        """Run the query on the shared read pool and return a DataFrame."""
+        sql, params = self.to_sql()
+        return database.query(sql, params)
@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+
+
+EARTH_RADIUS = 3958.8    # miles, same radius as part1.R
+CELL_MILES = 50          # Edge length of a grid cell, roughly the search radius the index is tuned for
+MAX_RANGES = 4096        # Above this many cell ranges per query it is cheaper to scan every airport
+
+
+def to_unit_vectors(lat, lon):
+    """Converts latitude/longitude in degrees to 3D points on the unit sphere, shape (n, 3)."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_miles(chord):
+    """Great-circle distance in miles for a straight-line distance between two unit vectors."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def miles_to_chord(miles):
+    """Straight-line distance between two unit vectors that are `miles` apart along the sphere."""
+    return 2 * np.sin(np.clip(np.asarray(miles, dtype=np.float64) / (2 * EARTH_RADIUS), 0, np.pi / 2))
+
+
+class AirportIndex:
+    """
+    Spatial index over airports for radius and nearest-neighbour queries.
+    Airports are placed on the unit sphere and bucketed into a uniform 3D grid. Points are sorted by
+    cell key so the airports in a run of cells are found with np.searchsorted instead of a full scan.
+    Distances returned are great-circle miles.
+    """
+
+    def __init__(self, df, cell_miles=CELL_MILES):
+        df = df.reset_index(drop=True)
+        self.faa = df['faa'].to_numpy()
+        self.names = df['name'].to_numpy() if 'name' in df.columns else None
+        self.lat = df['lat'].to_numpy(dtype=np.float64)
+        self.lon = df['lon'].to_numpy(dtype=np.float64)
+        self.xyz = to_unit_vectors(self.lat, self.lon)
+
+        self.cell = float(miles_to_chord(cell_miles))
+        self.grid = int(np.ceil(2 / self.cell)) + 1
+
+        cells = self._cells(self.xyz)
+        keys = self._keys(cells)
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        self.sorted_xyz = self.xyz[self.order]
+
+    def __len__(self):
+        return len(self.faa)
+
+    def _cells(self, xyz):
+        return np.floor((xyz + 1) / self.cell).astype(np.int64)
+
+    def _keys(self, cells):
+        return (cells[..., 0] * self.grid + cells[..., 1]) * self.grid + cells[..., 2]
+
+    def _candidates(self, point, reach):
+        """Sorted-array positions of every airport in the cube of cells `reach` cells around the point's cell."""
+        if (2 * reach + 1) ** 2 > MAX_RANGES:
+            return None
+
+        cx, cy, cz = self._cells(point)
+        offsets = np.arange(-reach, reach + 1)
+        x = np.clip(cx + offsets, 0, self.grid - 1)
+        y = np.clip(cy + offsets, 0, self.grid - 1)
+        xs, ys = np.meshgrid(np.unique(x), np.unique(y), indexing='ij')
+
+        # Within one (x, y) column the z cells are consecutive keys, so each column is a single range
+        base = (xs.ravel() * self.grid + ys.ravel()) * self.grid
+        low = np.searchsorted(self.sorted_keys, base + max(cz - reach, 0), side='left')
+        high = np.searchsorted(self.sorted_keys, base + min(cz + reach, self.grid - 1), side='right')
+
+        lengths = high - low
+        total = lengths.sum()
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Expand every [low, high) range into positions without a Python loop
+        starts = np.repeat(low - np.cumsum(lengths) + lengths, lengths)
+        return starts + np.arange(total)
+
+    def _chords(self, point, positions):
+        if positions is None:
+            return np.arange(len(self.sorted_xyz)), np.linalg.norm(self.sorted_xyz - point, axis=1)
+        return positions, np.linalg.norm(self.sorted_xyz[positions] - point, axis=1)
+
+    ############# queries ############################
+
+    def within(self, lat, lon, miles):
+        """
+        Batched radius query.
+        params: arrays (or scalars) of latitude and longitude, radius in miles.
+        returns: DataFrame with query (position in the input), faa and distance columns, nearest first per query.
+        """
+        points = to_unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))
+        radius = float(miles_to_chord(miles))
+        reach = int(np.ceil(radius / self.cell))
+
+        frames = []
+        for q, point in enumerate(points):
+            positions, chords = self._chords(point, self._candidates(point, reach))
+            hit = chords <= radius
+            idx = self.order[positions[hit]]
+            dist = chord_to_miles(chords[hit])
+            sort = np.argsort(dist, kind='stable')
+            frames.append(pd.DataFrame({'query': q, 'faa': self.faa[idx[sort]], 'distance': dist[sort]}))
+
+        if not frames:
+            return pd.DataFrame(columns=['query', 'faa', 'distance'])
+        return pd.concat(frames, ignore_index=True)
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Batched k-nearest-neighbour query.
+        params: arrays (or scalars) of latitude and longitude, number of neighbours.
+        returns: (indices, distances), both shaped (n_queries, k). Indices are row positions in the airports DataFrame.
+        """
+        points = to_unit_vectors(np.atleast_1d(lat), np.atleast_1d(lon))
+        k = min(k, len(self))
+        indices = np.empty((len(points), k), dtype=np.int64)
+        distances = np.empty((len(points), k), dtype=np.float64)
+
+        for q, point in enumerate(points):
+            reach = 1
+            while True:
+                candidates = self._candidates(point, reach)
+                positions, chords = self._chords(point, candidates)
+                scanned_all = candidates is None or len(positions) == len(self)
+
+                # Everything within reach * cell of the point is guaranteed to be among the candidates
+                if len(chords) >= k:
+                    best = np.argpartition(chords, k - 1)[:k]
+                    best = best[np.argsort(chords[best], kind='stable')]
+                    if scanned_all or chords[best[-1]] <= reach * self.cell:
+                        break
+                reach *= 2
+
+            indices[q] = self.order[positions[best]]
+            distances[q] = chord_to_miles(chords[best])
+
+        return indices, distances
+
+    def nearest_faa(self, lat, lon, k=1):
+        """Like nearest() but returns a DataFrame with query, rank, faa and distance columns."""
+        indices, distances = self.nearest(lat, lon, k)
+        n, k = indices.shape
+        return pd.DataFrame({
+            'query': np.repeat(np.arange(n), k),
+            'rank': np.tile(np.arange(1, k + 1), n),
+            'faa': self.faa[indices.ravel()],
+            'distance': distances.ravel(),
+        })
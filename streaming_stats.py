@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import database
+
+
+
+CHUNK_ROWS = 50000                # Rows fetched from SQLite per fetchmany call
+RELATIVE_ACCURACY = 0.01          # Quantiles are within this fraction of the true value
+DESCRIBE_QUANTILES = (0.25, 0.5, 0.75)
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles in the style of DDSketch: values are counted in logarithmic buckets whose
+    width grows with the magnitude, so every quantile is within relative_accuracy of an actual value.
+    Memory grows with the logarithm of the value range, not with the number of values.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _add_buckets(self, buckets, magnitudes):
+        keys, counts = np.unique(np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, n in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + n
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self._add_buckets(self.positive, values[values > 0])
+        self._add_buckets(self.negative, -values[values < 0])
+        self.zeros += int((values == 0).sum())
+        self.count += len(values)
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError('Can only merge sketches with the same relative accuracy')
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, n in theirs.items():
+                mine[key] = mine.get(key, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Approximate q-quantile, NaN when the sketch is empty."""
+        if self.count == 0:
+            return float('nan')
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return float('nan')
+
+
+class StreamingStats:
+    """
+    Count, mean, variance, covariance, min, max and approximate quantiles of a few numeric columns,
+    updated one chunk of rows at a time in memory that does not depend on the number of rows.
+    Chunks are folded in with the pairwise form of Welford's update (Chan et al.), which also merges the
+    statistics of two partitions, so a dataset can be summarized in pieces and combined afterwards.
+    Rows with a missing value in any column are skipped, like the IS NOT NULL filters of the analyses.
+    """
+
+    def __init__(self, columns, relative_accuracy=RELATIVE_ACCURACY):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(k)
+        self.comoment = np.zeros((k, k))  # Sum of products of deviations from the mean, M2 on the diagonal
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+        self.sketches = [QuantileSketch(relative_accuracy) for _ in self.columns]
+
+    def _combine(self, count, mean, comoment):
+        total = self.count + count
+        delta = mean - self.mean
+        self.comoment += comoment + np.outer(delta, delta) * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+    def update(self, rows):
+        """Fold a chunk of rows (one value per column, e.g. a fetchmany result) into the statistics."""
+        chunk = np.asarray(rows, dtype=np.float64).reshape(-1, len(self.columns))
+        chunk = chunk[~np.isnan(chunk).any(axis=1)]
+        if len(chunk) == 0:
+            return self
+
+        mean = chunk.mean(axis=0)
+        deviations = chunk - mean
+        self._combine(len(chunk), mean, deviations.T @ deviations)
+        self.min = np.minimum(self.min, chunk.min(axis=0))
+        self.max = np.maximum(self.max, chunk.max(axis=0))
+        for sketch, values in zip(self.sketches, chunk.T):
+            sketch.update(values)
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another partition over the same columns, returns self."""
+        if other.columns != self.columns:
+            raise ValueError('Can only merge StreamingStats over the same columns')
+        if other.count:
+            self._combine(other.count, other.mean, other.comoment)
+            self.min = np.minimum(self.min, other.min)
+            self.max = np.maximum(self.max, other.max)
+            for mine, theirs in zip(self.sketches, other.sketches):
+                mine.merge(theirs)
+        return self
+
+    def cov(self):
+        """Sample covariance matrix as a DataFrame."""
+        values = self.comoment / (self.count - 1) if self.count > 1 else np.full_like(self.comoment, np.nan)
+        return pd.DataFrame(values, index=self.columns, columns=self.columns)
+
+    def var(self):
+        return pd.Series(np.diag(self.cov().to_numpy()), index=self.columns)
+
+    def std(self):
+        return np.sqrt(self.var())
+
+    def corr(self):
+        """Pearson correlation matrix as a DataFrame."""
+        scale = np.sqrt(np.diag(self.comoment))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = self.comoment / np.outer(scale, scale)
+        return pd.DataFrame(values, index=self.columns, columns=self.columns)
+
+    def quantile(self, q):
+        return pd.Series([sketch.quantile(q) for sketch in self.sketches], index=self.columns)
+
+    def describe(self, quantiles=DESCRIBE_QUANTILES):
+        """Summary in the layout of DataFrame.describe(), with approximate quantiles."""
+        rows = {
+            'count': pd.Series(float(self.count), index=self.columns),
+            'mean': pd.Series(self.mean if self.count else np.nan, index=self.columns),
+            'std': self.std(),
+            'min': pd.Series(self.min if self.count else np.nan, index=self.columns),
+        }
+        for q in quantiles:
+            rows[f'{q * 100:g}%'] = self.quantile(q)
+        rows['max'] = pd.Series(self.max if self.count else np.nan, index=self.columns)
+        return pd.DataFrame(rows).T
+
+
+def stream_query(sql, params=(), chunk_size=CHUNK_ROWS, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    StreamingStats over every column of a query, reading the rows with cursor.fetchmany on a pooled
+    read connection, so only one chunk of chunk_size rows is held in memory at a time.
+    """
+    with database.read_connection() as conn:
+        cursor = conn.execute(sql, params)
+        stats = StreamingStats([d[0] for d in cursor.description], relative_accuracy)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            stats.update(rows)
+    return stats
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+
+ORIGINS = ['EWR', 'JFK', 'LGA']
+DESTS = ['ATL', 'BOS', 'LAX', 'ORD']
+CARRIERS = ['AA', 'B6', 'DL', 'UA']
+NUM_FLIGHTS = 3000
+NUM_PLANES = 40
+
+AIRPORTS = pd.DataFrame({
+    'faa': ['EWR', 'JFK', 'LGA', 'ATL', 'BOS', 'LAX', 'ORD'],
+    'name': ['Newark Liberty Intl', 'John F Kennedy Intl', 'La Guardia', 'Hartsfield Jackson Atlanta Intl',
+             'General Edward Lawrence Logan Intl', 'Los Angeles Intl', 'Chicago Ohare Intl'],
+    'lat': [40.6925, 40.639751, 40.777245, 33.636719, 42.364347, 33.942536, 41.978603],
+    'lon': [-74.168667, -73.778925, -73.872608, -84.428067, -71.005181, -118.408075, -87.904842],
+    'alt': [18, 13, 22, 1026, 19, 126, 668],
+    'tz': [-5, -5, -5, -5, -5, -8, -6],
+    'dst': ['A'] * 7,
+    'tzone': ['America/New_York'] * 5 + ['America/Los_Angeles', 'America/Chicago'],
+})
+
+
+def make_flights(rng, n, years=(2023,)):
+    """Random flights shaped like the flights table, with some missing delays and times."""
+    dates = pd.to_datetime([f'{y}-01-01' for y in rng.choice(years, n)]) + pd.to_timedelta(rng.integers(0, 365, n), unit='D')
+    sched_dep = rng.integers(5, 23, n) * 100 + rng.choice([0, 15, 30, 45], n)
+    dep_delay = np.round(rng.gamma(1.5, 20, n) - 15)
+    dep_delay[rng.random(n) < 0.05] = np.nan
+    air_time = rng.integers(40, 360, n).astype(float)
+
+    df = pd.DataFrame({
+        'year': dates.year,
+        'month': dates.month,
+        'day': dates.day,
+        'dep_time': np.where(np.isnan(dep_delay), np.nan, sched_dep + np.nan_to_num(dep_delay)),
+        'sched_dep_time': sched_dep,
+        'dep_delay': dep_delay,
+        'arr_time': np.nan,
+        'sched_arr_time': np.nan,
+        'arr_delay': dep_delay + np.round(rng.normal(0, 10, n)),
+        'carrier': rng.choice(CARRIERS, n),
+        'flight': rng.integers(1, 2000, n),
+        'tailnum': [f'N{i:03d}' for i in rng.integers(0, NUM_PLANES, n)],
+        'origin': rng.choice(ORIGINS, n),
+        'dest': rng.choice(DESTS, n),
+        'air_time': air_time,
+        'distance': np.round(air_time * 7.5),
+        'hour': sched_dep // 100,
+        'minute': sched_dep % 100,
+    })
+    df['time_hour'] = dates.strftime('%Y-%m-%d') + df['hour'].map(' {:02d}:00:00'.format)
+    return df
+
+
+def make_weather(rng, years=(2023,)):
+    """Hourly weather at every origin with a share of the hours left out and one duplicated observation."""
+    hours = pd.date_range(f'{min(years)}-01-01', f'{max(years)}-12-31 23:00', freq='h')
+    frames = []
+    for origin in ORIGINS:
+        kept = hours[rng.random(len(hours)) > 0.15]
+        frames.append(pd.DataFrame({
+            'origin': origin,
+            'year': kept.year, 'month': kept.month, 'day': kept.day, 'hour': kept.hour,
+            'temp': np.round(rng.normal(55, 18, len(kept)), 1),
+            'dewp': np.round(rng.normal(40, 15, len(kept)), 1),
+            'humid': np.round(rng.uniform(20, 100, len(kept)), 1),
+            'wind_dir': rng.integers(0, 36, len(kept)) * 10.0,
+            'wind_speed': np.round(rng.gamma(2, 5, len(kept)), 2),
+            'wind_gust': np.nan,
+            'precip': 0.0,
+            'pressure': np.round(rng.normal(1017, 7, len(kept)), 1),
+            'visib': 10.0,
+            'time_hour': kept.strftime('%Y-%m-%d %H:00:00'),
+        }))
+    weather = pd.concat(frames, ignore_index=True)
+    return pd.concat([weather, weather.iloc[[10]].assign(temp=-99.0)], ignore_index=True)
+
+
+def write_database(path, flights, weather):
+    conn = sqlite3.connect(path)
+    flights.to_sql('flights', conn, index=False)
+    weather.to_sql('weather', conn, index=False)
+    AIRPORTS.to_sql('airports', conn, index=False)
+    pd.DataFrame({'carrier': CARRIERS, 'name': ['American', 'JetBlue', 'Delta', 'United']}).to_sql('airlines', conn, index=False)
+    pd.DataFrame({
+        'tailnum': [f'N{i:03d}' for i in range(NUM_PLANES)],
+        'year': 2000 + np.arange(NUM_PLANES) % 20,
+        'type': 'Fixed wing multi engine',
+        'manufacturer': np.where(np.arange(NUM_PLANES) % 3 == 0, 'AIRBUS', 'BOEING'),
+        'model': 'A320',
+        'engines': 2,
+        'seats': 180,
+        'speed': np.nan,
+        'engine': 'Turbo-fan',
+    }).to_sql('planes', conn, index=False)
+    conn.close()
+
+
+@pytest.fixture
+def flights_db(tmp_path, monkeypatch):
+    """
+    A small synthetic flights database that every module talks to through database.DB_PATH.
+    returns: (path, flights DataFrame, weather DataFrame) as written to the database.
+    """
+    rng = np.random.default_rng(13)
+    flights = make_flights(rng, NUM_FLIGHTS)
+    weather = make_weather(rng)
+    path = str(tmp_path / 'flights_database.db')
+    write_database(path, flights, weather)
+
+    database.close_all()
+    monkeypatch.setattr(database, 'DB_PATH', path)
+    monkeypatch.setattr(database, '_cache', None)
+    yield path, flights, weather
+    database.close_all()
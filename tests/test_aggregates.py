@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import aggregates
+import database
+
+
+def stored(name, keys):
+    return database.query(f'SELECT * FROM {name}', cache=False).sort_values(list(keys)).reset_index(drop=True)
+
+
+def test_build_matches_pandas_group_by(flights_db):
+    _, flights, _ = flights_db
+    aggregates.build_aggregates()
+
+    routes = flights.groupby(['origin', 'dest']).agg(
+        num_flights=('dep_delay', 'size'),
+        min_distance=('distance', 'min'),
+        max_distance=('distance', 'max'),
+        delay_count=('dep_delay', 'count'),
+        delay_sum=('dep_delay', 'sum'),
+        min_delay=('dep_delay', 'min'),
+        max_delay=('dep_delay', 'max'),
+    ).reset_index()
+    table = stored('agg_routes', ['origin', 'dest'])
+    pd.testing.assert_frame_equal(table[routes.columns], routes, check_dtype=False)
+
+    carrier_month = flights.groupby(['carrier', 'year', 'month']).size().rename('num_flights').reset_index()
+    pd.testing.assert_frame_equal(stored('agg_carrier_month', ['carrier', 'year', 'month']), carrier_month, check_dtype=False)
+
+    timed = flights.dropna(subset=['dep_delay', 'dep_time'])
+    hourly = (timed.assign(dep_hour=timed['dep_time'].astype(int) // 100 % 24)
+              .groupby(['origin', 'year', 'month', 'day', 'dep_hour'])['dep_delay'].agg(['count', 'sum']).reset_index())
+    table = stored('agg_hourly_delay', ['origin', 'year', 'month', 'day', 'dep_hour'])
+    np.testing.assert_array_equal(table['delay_count'], hourly['count'])
+    np.testing.assert_allclose(table['delay_sum'], hourly['sum'])
+
+    assert all(aggregates.is_fresh(name) for name in aggregates.AGGREGATES)
+
+
+def test_verify_reports_changed_groups(flights_db):
+    aggregates.build_aggregates()
+    assert aggregates.verify_aggregates() == {name: 0 for name in aggregates.AGGREGATES}
+
+    with database.write_connection() as conn:
+        conn.execute("UPDATE agg_carrier_delay SET delay_sum = delay_sum + 1 WHERE carrier = 'AA'")
+        conn.execute("DELETE FROM agg_routes WHERE origin = 'JFK' AND dest = 'LAX'")
+
+    report = aggregates.verify_aggregates(['agg_carrier_delay', 'agg_routes', 'agg_origin_day'])
+    assert report == {'agg_carrier_delay': 1, 'agg_routes': 1, 'agg_origin_day': 0}
+
+
+def new_flights(flights):
+    """Appended rows: copies of existing flights with other delays, some on a route and day not seen before."""
+    df = flights.sample(400, random_state=2).reset_index(drop=True)
+    df['dep_delay'] = df['dep_delay'] * 2 - 5
+    df['distance'] = df['distance'] + 1
+    df.loc[:49, ['dest', 'month', 'day']] = ['SEA', 2, 28]
+    df.loc[50:59, 'dep_delay'] = np.nan
+    return df
+
+
+def test_append_matches_full_rebuild(flights_db):
+    _, flights, _ = flights_db
+    aggregates.build_aggregates()
+    df = new_flights(flights)
+
+    updated = aggregates.append_flights(df, verify=True)
+
+    assert sorted(updated) == sorted(aggregates.AGGREGATES)
+    assert aggregates.verify_aggregates() == {name: 0 for name in aggregates.AGGREGATES}
+    assert all(aggregates.is_fresh(name) for name in aggregates.AGGREGATES)
+
+    everything = pd.concat([flights, df], ignore_index=True)
+    routes = everything.groupby(['origin', 'dest'])['dep_delay'].agg(['size', 'count', 'sum', 'min', 'max']).reset_index()
+    table = stored('agg_routes', ['origin', 'dest'])
+    np.testing.assert_array_equal(table['num_flights'], routes['size'])
+    np.testing.assert_array_equal(table['delay_count'], routes['count'])
+    np.testing.assert_allclose(table['delay_sum'], routes['sum'])
+    np.testing.assert_array_equal(table['min_delay'], routes['min'])
+    np.testing.assert_array_equal(table['max_delay'], routes['max'])
+
+
+def test_append_leaves_stale_tables_alone(flights_db):
+    _, flights, _ = flights_db
+    aggregates.build_aggregates()
+    with database.write_connection() as conn:
+        conn.execute("UPDATE aggregate_builds SET flights_version = -1 WHERE name = 'agg_origin_day'")
+    before = stored('agg_origin_day', ['origin', 'year', 'month', 'day'])
+
+    updated = aggregates.append_flights(new_flights(flights))
+
+    assert 'agg_origin_day' not in updated
+    assert not aggregates.is_fresh('agg_origin_day')
+    pd.testing.assert_frame_equal(stored('agg_origin_day', ['origin', 'year', 'month', 'day']), before)
+    assert len(database.query('SELECT * FROM flights', cache=False)) == len(flights) + 400
+
+
+def test_append_of_a_new_year_keeps_its_own_days(flights_db):
+    _, flights, _ = flights_db
+    aggregates.build_aggregates()
+    new_year = flights[(flights['month'] == 1) & (flights['day'] == 1)].assign(year=2024)
+
+    aggregates.append_flights(new_year, verify=True)
+
+    days = database.query("SELECT year, SUM(num_flights) AS num_flights FROM agg_origin_day "
+                          "WHERE month = 1 AND day = 1 GROUP BY year ORDER BY year", cache=False)
+    assert days['year'].tolist() == [2023, 2024]
+    assert days['num_flights'].tolist() == [len(new_year), len(new_year)]
+
+    timed = new_year[new_year['origin'] == 'JFK'].dropna(subset=['dep_delay', 'dep_time'])
+    expected = timed.groupby(timed['dep_time'].astype(int) // 100 % 24)['dep_delay'].mean()
+    hourly = aggregates.hourly_delays(['JFK'], 2024, 1, 1)
+    np.testing.assert_array_equal(hourly['hour_numeric'], expected.index)
+    np.testing.assert_allclose(hourly['dep_delay'], expected.to_numpy())
+
+
+def test_tables_without_the_year_key_are_stale(flights_db):
+    _, flights, _ = flights_db
+    aggregates.build_aggregates()
+    with database.write_connection() as conn:
+        conn.execute('DROP TABLE agg_origin_day')
+        conn.execute('CREATE TABLE agg_origin_day AS SELECT origin, month, day, COUNT(*) AS num_flights '
+                     'FROM flights GROUP BY origin, month, day')
+
+    assert not aggregates.is_fresh('agg_origin_day')
+    assert 'agg_origin_day' not in aggregates.append_flights(new_flights(flights))
@@ -0,0 +1,65 @@
+import time
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import binning
+import database
+
+
+def distance_delay(flights):
+    df = flights[['distance', 'arr_delay']].dropna()
+    return df['distance'].to_numpy(dtype=float), df['arr_delay'].to_numpy(dtype=float)
+
+
+def test_grid_matches_histogram2d(flights_db):
+    _, flights, _ = flights_db
+    x, y = distance_delay(flights)
+    stats = binning.density('distance_vs_arrival_delay', 'grid', 20)
+
+    counts, _, _ = np.histogram2d(x, y, bins=20, range=[[x.min(), x.max()], [y.min(), y.max()]])
+    sums, _, _ = np.histogram2d(x, y, bins=20, range=[[x.min(), x.max()], [y.min(), y.max()]], weights=y)
+    np.testing.assert_array_equal(stats.grid(), counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.testing.assert_allclose(stats.mean().reshape(20, 20), sums / counts)
+
+    profile = stats.profile()
+    column = np.minimum(np.searchsorted(stats.bins.x_edges, x, side='right') - 1, 19)
+    expected = pd.Series(y).groupby(column).agg(['size', 'mean']).reindex(range(20))
+    np.testing.assert_array_equal(profile['count'], expected['size'].fillna(0))
+    np.testing.assert_allclose(profile['mean'], expected['mean'])
+
+
+def test_hexbin_matches_matplotlib(flights_db):
+    _, flights, _ = flights_db
+    x, y = distance_delay(flights)
+    stats = binning.density('distance_vs_arrival_delay', 'hex', 15)
+
+    fig, ax = plt.subplots()
+    expected = ax.hexbin(x, y, gridsize=15).get_array()
+    plt.close(fig)
+    np.testing.assert_array_equal(stats.count, expected)
+
+
+def test_chunked_binning_equals_single_chunk(flights_db):
+    sql = binning.DENSITY_PLOTS['distance_vs_arrival_delay'][0]
+    whole = binning.bin_query(sql, kind='grid', gridsize=10)
+    chunked = binning.bin_query(sql, kind='grid', gridsize=10, chunk_size=97)
+
+    np.testing.assert_array_equal(chunked.count, whole.count)
+    np.testing.assert_allclose(chunked.sum, whole.sum)
+    np.testing.assert_array_equal(chunked.hist, whole.hist)
+
+
+def test_density_is_rebuilt_when_the_database_changes(flights_db):
+    first = binning.density('distance_vs_arrival_delay')
+    assert binning.density('distance_vs_arrival_delay') is first
+
+    time.sleep(0.05)    # file_version() reads the file's mtime, which only advances with the kernel's clock tick
+    with database.write_connection() as conn:
+        conn.execute('UPDATE flights SET arr_delay = arr_delay + 500 WHERE rowid <= 10')
+
+    second = binning.density('distance_vs_arrival_delay')
+    assert second is not first
+    assert second.count.sum() == first.count.sum()
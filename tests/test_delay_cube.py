@@ -0,0 +1,66 @@
+import sqlite3
+import pandas as pd
+import pytest
+import delay_cube
+import part3
+
+
+def pandas_counts(flights, dest=None, origin=None, start=None, end=None):
+    df = flights
+    if dest is not None:
+        df = df[df['dest'].isin(dest if isinstance(dest, list) else [dest])]
+    if origin is not None:
+        df = df[df['origin'] == origin]
+    dates = pd.to_datetime(df[['year', 'month', 'day']])
+    if start is not None:
+        df = df[(dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))]
+    return {
+        'flights': len(df),
+        'delayed': int((df['dep_delay'] > 0).sum()),
+        'delay_count': int(df['dep_delay'].count()),
+        'delay_sum': float(df['dep_delay'].sum()),
+    }
+
+
+def add_year(path, flights, year):
+    """Copy the flights into another year, so the database spans more than one."""
+    conn = sqlite3.connect(path)
+    flights.assign(year=year).to_sql('flights', conn, index=False, if_exists='append')
+    conn.close()
+    return pd.concat([flights, flights.assign(year=year)], ignore_index=True)
+
+
+@pytest.mark.parametrize('dest, origin, start, end', [
+    (None, None, None, None),
+    ('LAX', None, '2023-03-01', '2023-03-31'),
+    (['ATL', 'BOS'], 'JFK', '2023-06-15', '2023-09-02'),
+    ('ORD', 'EWR', '2022-12-01', '2023-01-10'),    # Clipped to the first day in the cube
+    ('SEA', None, None, None),                      # Destination that never occurs
+])
+def test_counts_match_pandas(flights_db, dest, origin, start, end):
+    _, flights, _ = flights_db
+    filters = {key: value for key, value in (('dest', dest), ('origin', origin)) if value is not None}
+    date_range = None if start is None else (start, end)
+
+    assert delay_cube.delay_counts(filters, date_range) == pytest.approx(pandas_counts(flights, dest, origin, start, end))
+
+
+def test_counts_span_years(flights_db):
+    path, flights, _ = flights_db
+    flights = add_year(path, flights, 2024)
+    cube = delay_cube.get_delay_cube()
+
+    assert cube.years() == [2023, 2024]
+    assert cube.counts({'dest': 'BOS'}, cube.month_range(2, 2024)) == pytest.approx(
+        pandas_counts(flights, 'BOS', None, '2024-02-01', '2024-02-29'))
+    assert cube.counts({'dest': 'BOS'}, ('2023-11-20', '2024-01-31')) == pytest.approx(
+        pandas_counts(flights, 'BOS', None, '2023-11-20', '2024-01-31'))
+
+
+def test_delayed_flights_by_destination_over_every_year(flights_db):
+    path, flights, _ = flights_db
+    flights = add_year(path, flights, 2024)
+
+    expected = int(((flights['dest'] == 'LAX') & flights['month'].isin([1, 2]) & (flights['dep_delay'] > 0)).sum())
+    assert part3.delayed_flights_by_destination([1, 2, 2], 'LAX') == expected
+    assert part3.delayed_flights_by_destination([], 'LAX') == 0
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import aggregates
+import database
+import jobs
+import migrations
+
+
+def read_flights(columns):
+    return database.query(f"SELECT rowid AS flight_rowid, {', '.join(columns)} FROM flights ORDER BY rowid", cache=False)
+
+
+def test_bulk_update_matches_row_by_row_update(flights_db):
+    path, flights, _ = flights_db
+    df = read_flights(['air_time', 'distance'])
+    df['speed'] = df['distance'] / (df['air_time'] / 60)
+    df.loc[df.index % 7 == 0, 'speed'] = np.nan    # NULLs are written as NULL
+    df = df.sample(frac=1, random_state=1)          # Order of the DataFrame does not matter
+
+    with database.write_connection() as conn:
+        conn.execute('ALTER TABLE flights ADD COLUMN speed REAL')
+        updated = jobs.bulk_update(conn, 'flights', df, ['speed'], df_key='flight_rowid', chunk_size=700)
+
+    assert updated == len(flights)
+    stored = read_flights(['speed']).set_index('flight_rowid')['speed']
+    expected = df.set_index('flight_rowid')['speed'].sort_index()
+    pd.testing.assert_series_equal(stored, expected, check_names=False)
+
+
+def test_bulk_update_on_text_key_updates_only_matching_rows(flights_db):
+    planes = database.query('SELECT tailnum FROM planes', cache=False)
+    df = planes.iloc[::2].assign(speed=np.arange(len(planes.iloc[::2]), dtype=float) + 400)
+
+    with database.write_connection() as conn:
+        updated = jobs.bulk_update(conn, 'planes', df, ['speed'], key='tailnum', chunk_size=3)
+
+    assert updated == len(df)
+    stored = database.query('SELECT tailnum, speed FROM planes', cache=False)
+    expected = planes.merge(df, on='tailnum', how='left')
+    pd.testing.assert_frame_equal(stored, expected)
+
+
+def test_bulk_update_of_derived_column_keeps_data_version(flights_db):
+    df = read_flights(['distance']).assign(wind_effect=1.0)
+    with database.write_connection() as conn:
+        migrations.apply_migrations(conn)
+        before = aggregates.current_version(conn)
+        conn.execute('ALTER TABLE flights ADD COLUMN wind_effect REAL')
+        jobs.bulk_update(conn, 'flights', df, ['wind_effect'], df_key='flight_rowid')
+        assert aggregates.current_version(conn) == before
@@ -0,0 +1,31 @@
+import sqlite3
+import migrations
+
+
+def index_columns(conn, table):
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,))]
+    return {name: [row[2] for row in conn.execute(f'PRAGMA index_info({name})')] for name in names}
+
+
+def test_no_flights_index_is_a_prefix_of_another(flights_db):
+    path, _, _ = flights_db
+    conn = sqlite3.connect(path)
+    migrations.apply_migrations(conn)
+
+    indexes = index_columns(conn, 'flights')
+    for name, columns in indexes.items():
+        for other, longer in indexes.items():
+            assert other == name or longer[:len(columns)] != columns, f'{name} is covered by {other}'
+    conn.close()
+
+
+def test_redundant_indexes_of_older_databases_are_dropped(flights_db):
+    path, _, _ = flights_db
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE INDEX ix_flights_origin_dest ON flights(origin, dest)')
+    conn.execute('CREATE INDEX cx_flights_dest_month_delay ON flights(dest, month, dep_delay)')
+    migrations.apply_migrations(conn)
+
+    assert 'ix_flights_origin_dest' not in index_columns(conn, 'flights')
+    assert 'cx_flights_dest_month_delay' not in index_columns(conn, 'flights')
+    conn.close()
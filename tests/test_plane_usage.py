@@ -0,0 +1,46 @@
+import sqlite3
+import pandas as pd
+import database
+import part3
+
+
+def add_unknown_planes(path):
+    """Flights whose tailnum is not in planes or missing, which the usage tables leave out."""
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE flights SET tailnum = 'N999' WHERE rowid % 50 = 0")
+    conn.execute('UPDATE flights SET tailnum = NULL WHERE rowid % 70 = 0')
+    conn.commit()
+    conn.close()
+
+
+def test_route_plane_usage_matches_join(flights_db):
+    path, _, _ = flights_db
+    add_unknown_planes(path)
+
+    for by in ('type', 'manufacturer'):
+        expected = database.query(f"""
+            SELECT f.origin, f.dest, p.{by}, COUNT(*) AS num_flights
+            FROM flights f JOIN planes p ON p.tailnum = f.tailnum
+            GROUP BY f.origin, f.dest, p.{by}
+        """, cache=False)
+        pd.testing.assert_frame_equal(part3.route_plane_usage(by), expected, check_dtype=False)
+
+    route = expected[(expected['origin'] == 'JFK') & (expected['dest'] == 'LAX')]
+    assert part3.route_usage('JFK', 'LAX', 'manufacturer') == dict(zip(route['manufacturer'], route['num_flights']))
+
+
+def test_destination_manufacturers_matches_join(flights_db):
+    path, _, _ = flights_db
+    add_unknown_planes(path)
+
+    expected = database.query("""
+        SELECT f.dest, p.manufacturer, COUNT(*) AS num_flights, COUNT(DISTINCT p.tailnum) AS num_planes
+        FROM flights f JOIN planes p ON p.tailnum = f.tailnum
+        GROUP BY f.dest, p.manufacturer
+    """, cache=False)
+    table = part3.destination_manufacturers()
+    merged = table.merge(expected, on=['dest', 'manufacturer'], suffixes=('', '_sql'))
+
+    assert len(merged) == len(table) == len(expected)
+    assert (merged['num_flights'] == merged['num_flights_sql']).all()
+    assert (merged['num_planes'] == merged['num_planes_sql']).all()
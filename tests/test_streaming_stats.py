@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+import streaming_stats
+from streaming_stats import QuantileSketch, StreamingStats
+
+
+QUERY = 'SELECT distance, arr_delay, dep_delay FROM flights'
+
+
+def expected_rows(flights):
+    """The rows StreamingStats keeps: those without a missing value in any column."""
+    return flights[['distance', 'arr_delay', 'dep_delay']].dropna()
+
+
+def test_stream_query_matches_pandas(flights_db):
+    _, flights, _ = flights_db
+    df = expected_rows(flights)
+    stats = streaming_stats.stream_query(QUERY, chunk_size=251)
+
+    assert stats.count == len(df)
+    pd.testing.assert_series_equal(pd.Series(stats.mean, index=stats.columns), df.mean(), check_names=False)
+    pd.testing.assert_series_equal(stats.std(), df.std(), check_names=False)
+    pd.testing.assert_frame_equal(stats.cov(), df.cov())
+    pd.testing.assert_frame_equal(stats.corr(), df.corr())
+
+    summary = stats.describe()
+    expected = df.describe()
+    for row in ('count', 'mean', 'std', 'min', 'max'):
+        pd.testing.assert_series_equal(summary.loc[row], expected.loc[row], check_names=False)
+
+
+def test_quantiles_within_relative_accuracy(flights_db):
+    _, flights, _ = flights_db
+    df = expected_rows(flights)
+    stats = streaming_stats.stream_query(QUERY, chunk_size=500, relative_accuracy=0.01)
+
+    for q in (0.1, 0.25, 0.5, 0.9, 0.99):
+        exact = df.quantile(q, interpolation='lower')
+        approx = stats.quantile(q)
+        assert np.all(np.abs(approx - exact) <= 0.01 * np.abs(exact) + 1e-9), q
+
+
+def test_merged_partitions_equal_single_pass(flights_db):
+    _, flights, _ = flights_db
+    df = expected_rows(flights)
+    single = StreamingStats(df.columns).update(df.to_numpy())
+
+    merged = StreamingStats(df.columns)
+    for _, part in df.groupby(flights.loc[df.index, 'month']):
+        merged.merge(StreamingStats(df.columns).update(part.to_numpy()))
+
+    assert merged.count == single.count
+    np.testing.assert_allclose(merged.mean, single.mean)
+    np.testing.assert_allclose(merged.comoment, single.comoment)
+    np.testing.assert_array_equal(merged.min, single.min)
+    np.testing.assert_array_equal(merged.max, single.max)
+    pd.testing.assert_series_equal(merged.quantile(0.5), single.quantile(0.5))
+
+
+def test_rows_with_missing_values_are_skipped():
+    stats = StreamingStats(['a', 'b']).update([[1.0, 2.0], [np.nan, 3.0], [3.0, 6.0]])
+    assert stats.count == 2
+    assert stats.corr().loc['a', 'b'] == pytest.approx(1.0)
+
+
+def test_empty_sketch_returns_nan():
+    assert np.isnan(QuantileSketch().quantile(0.5))
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
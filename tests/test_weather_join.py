@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+import weather_join
+
+
+COLUMNS = ['temp', 'wind_speed', 'wind_dir']
+
+
+def hours_since_epoch(df):
+    dates = pd.to_datetime(df[['year', 'month', 'day']])
+    return ((dates - pd.Timestamp(1970, 1, 1)).dt.days * 24 + df['hour']).astype(np.int64)
+
+
+def nearest_by_merge(flights, weather, tolerance):
+    """
+    The as-of join spelled out with equality merges: try the observation at the flight's hour, then one hour
+    before, one after, two before and so on, keeping the first match. The first of duplicate observations wins.
+    """
+    weather = weather.drop_duplicates(subset=['origin', 'year', 'month', 'day', 'hour'])
+    weather = weather.assign(epoch_hour=hours_since_epoch(weather))[['origin', 'epoch_hour'] + COLUMNS]
+
+    out = flights.assign(epoch_hour=hours_since_epoch(flights), weather_offset_hours=np.nan)
+    for column in COLUMNS:
+        out[column] = np.nan
+    for offset in [0] + [d for k in range(1, tolerance + 1) for d in (-k, k)]:
+        missing = out['weather_offset_hours'].isna()
+        found = (out.loc[missing, ['origin', 'epoch_hour']]
+                 .assign(epoch_hour=lambda df: df['epoch_hour'] + offset)
+                 .reset_index()
+                 .merge(weather, on=['origin', 'epoch_hour'])
+                 .set_index('index'))
+        out.loc[found.index, COLUMNS] = found[COLUMNS]
+        out.loc[found.index, 'weather_offset_hours'] = abs(offset)
+    return out.drop(columns='epoch_hour')
+
+
+@pytest.mark.parametrize('tolerance', [0, 1, 2])
+def test_attach_matches_equality_merges(flights_db, tolerance):
+    _, flights, weather = flights_db
+    attached = weather_join.attach_weather(flights, COLUMNS, tolerance)
+    expected = nearest_by_merge(flights, weather, tolerance)
+
+    assert len(attached) == len(flights)
+    pd.testing.assert_frame_equal(attached[COLUMNS + ['weather_offset_hours']],
+                                  expected[COLUMNS + ['weather_offset_hours']], check_dtype=False)
+
+
+def test_flights_without_weather_are_kept(flights_db):
+    _, flights, _ = flights_db
+    df = flights.head(3).assign(origin=['JFK', 'SEA', None], hour=[5, 5, 5])
+    df.loc[0, 'day'] = np.nan
+
+    attached = weather_join.attach_weather(df, COLUMNS)
+
+    assert len(attached) == 3
+    assert attached[COLUMNS + ['weather_offset_hours']].isna().all().all()
+
+
+def test_day_weather_matches_filter(flights_db):
+    _, _, weather = flights_db
+    day = weather_join.day_weather('LGA', 7, 4)
+
+    expected = (weather[(weather['origin'] == 'LGA') & (weather['month'] == 7) & (weather['day'] == 4)]
+                .drop_duplicates(subset='hour').sort_values('hour'))
+    np.testing.assert_array_equal(day['hour'].astype(int), expected['hour'])
+    np.testing.assert_array_equal(day['temp'].astype(float), expected['temp'])
+    assert weather_join.day_weather('SEA', 7, 4).empty
+
+
+def test_first_of_duplicate_observations_wins(flights_db):
+    _, flights, weather = flights_db
+    duplicate = weather.iloc[-1]
+    df = flights.head(1).assign(**{key: duplicate[key] for key in ('origin', 'year', 'month', 'day', 'hour')})
+
+    attached = weather_join.attach_weather(df, COLUMNS)
+
+    assert duplicate['temp'] == -99.0
+    assert attached['temp'].iloc[0] == weather.iloc[10]['temp']
+    assert attached['weather_offset_hours'].iloc[0] == 0
@@ -0,0 +1,49 @@
+import time
+import numpy as np
+import database
+import jobs
+import part3
+
+
+def test_wind_effect_is_positive_for_a_tailwind(flights_db):
+    part3.compute_wind_effect_on_flights()
+
+    df = database.query("""
+        SELECT f.origin, f.year, f.month, f.day, f.hour, f.wind_effect, r.bearing
+        FROM flights AS f JOIN routes AS r ON r.origin = f.origin AND r.dest = f.dest
+    """, cache=False)
+    weather = part3.weather_join.attach_weather(df, ['wind_speed', 'wind_dir'])
+
+    # Wind blowing from the direction the plane heads to is a headwind: the effect is -speed * cos(from - bearing)
+    expected = -weather['wind_speed'] * np.cos(np.radians(weather['wind_dir'] - weather['bearing']))
+    np.testing.assert_allclose(df['wind_effect'], expected, atol=1e-9)
+    assert df['wind_effect'].notna().any()
+
+
+def test_wind_from_behind_the_plane(flights_db):
+    jobs.update_routes()
+    flight = database.query('SELECT f.rowid, f.*, r.bearing FROM flights AS f JOIN routes AS r '
+                            'ON r.origin = f.origin AND r.dest = f.dest WHERE f.hour = 12 LIMIT 1', cache=False).iloc[0]
+
+    # Wind from straight behind the plane at 10 mph around the flight's hour
+    time.sleep(0.05)    # The weather index is reloaded on the next file_version(), see test_binning.py
+    with database.write_connection() as conn:
+        conn.execute('UPDATE weather SET wind_speed = 10, wind_dir = ? WHERE origin = ? AND year = ? AND month = ? '
+                     'AND day = ? AND hour BETWEEN 11 AND 13',
+                     ((flight['bearing'] + 180) % 360, flight['origin'], int(flight['year']), int(flight['month']), int(flight['day'])))
+    part3.compute_wind_effect_on_flights()
+
+    stored = database.query('SELECT wind_effect FROM flights WHERE rowid = ?', (int(flight['rowid']),), cache=False)
+    assert abs(stored['wind_effect'].iloc[0] - 10) < 1e-6
+
+
+def test_tailwind_flights_lie_right_of_zero(flights_db):
+    jobs.update_routes()
+    with database.write_connection() as conn:
+        conn.execute("UPDATE weather SET wind_speed = 20, wind_dir = 270")    # Wind from the west everywhere
+    part3.compute_wind_effect_on_flights()
+
+    # Eastbound routes (to BOS) fly with the wind, westbound routes (to LAX) against it
+    df = database.query('SELECT dest, wind_effect FROM flights WHERE wind_effect IS NOT NULL', cache=False)
+    assert (df.loc[df['dest'] == 'BOS', 'wind_effect'] > 0).all()
+    assert (df.loc[df['dest'] == 'LAX', 'wind_effect'] < 0).all()
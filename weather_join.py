@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import database
+
+
+
+WEATHER_TOLERANCE_HOURS = 1       # Flights more than this many hours from any observation at their origin get no weather
+WEATHER_COLUMNS = ['temp', 'dewp', 'humid', 'wind_dir', 'wind_speed', 'wind_gust', 'precip', 'pressure', 'visib']
+
+_ORIGIN_STRIDE = 1 << 40          # Sort key spacing between origins, far above any epoch hour
+
+
+def epoch_hours(year, month, day, hour):
+    """Hours since 1970-01-01 for arrays of local year, month, day and hour, NaN where a part is missing."""
+    dates = pd.to_datetime(pd.DataFrame({
+        'year': pd.to_numeric(pd.Series(year), errors='coerce'),
+        'month': pd.to_numeric(pd.Series(month), errors='coerce'),
+        'day': pd.to_numeric(pd.Series(day), errors='coerce'),
+    }), errors='coerce')
+    days = (dates - pd.Timestamp(1970, 1, 1)).dt.days.to_numpy(dtype=np.float64)
+    return days * 24 + pd.to_numeric(pd.Series(hour), errors='coerce').to_numpy(dtype=np.float64)
+
+
+class WeatherIndex:
+    """
+    The weather table held in memory, sorted by (origin, epoch hour).
+    Each observation gets one integer sort key, so attaching the nearest observation at the same origin
+    to any number of flights is a single np.searchsorted over that key instead of an SQL equality join.
+    When an (origin, hour) pair occurs more than once the first observation wins.
+    """
+
+    def __init__(self, df):
+        df = df.copy()
+        df['epoch_hour'] = epoch_hours(df['year'], df['month'], df['day'], df['hour'])
+        df = df.dropna(subset=['origin', 'epoch_hour'])
+        df = df.sort_values(['origin', 'epoch_hour'], kind='stable')
+        df = df.drop_duplicates(subset=['origin', 'epoch_hour']).reset_index(drop=True)
+
+        self.origins = {code: i for i, code in enumerate(pd.unique(df['origin']))}
+        self.codes = df['origin'].map(self.origins).to_numpy(dtype=np.int64)
+        self.hours = df['epoch_hour'].to_numpy(dtype=np.int64)
+        self.sort_key = self.codes * _ORIGIN_STRIDE + self.hours
+        self.year = int(df['year'].min()) if len(df) else 2023
+        self.columns = {c: df[c].to_numpy() for c in df.columns if c != 'epoch_hour'}
+
+    def __len__(self):
+        return len(self.hours)
+
+    def nearest(self, origins, hours, tolerance=WEATHER_TOLERANCE_HOURS):
+        """
+        Position of the observation closest in time at the same origin for every (origin, epoch hour) pair.
+        Ties go to the earlier observation.
+        returns: (positions, offsets) where positions is -1 and offsets NaN when nothing lies within tolerance hours.
+        """
+        codes = pd.Series(np.asarray(origins, dtype=object)).map(self.origins).to_numpy(dtype=np.float64)
+        hours = np.asarray(hours, dtype=np.float64)
+        positions = np.full(len(hours), -1, dtype=np.int64)
+        offsets = np.full(len(hours), np.nan)
+
+        valid = ~np.isnan(codes) & ~np.isnan(hours)
+        if not valid.any() or len(self) == 0:
+            return positions, offsets
+
+        code = codes[valid].astype(np.int64)
+        hour = hours[valid].astype(np.int64)
+        after = np.searchsorted(self.sort_key, code * _ORIGIN_STRIDE + hour, side='left')
+        before = after - 1
+
+        best = np.full(len(hour), -1, dtype=np.int64)
+        best_offset = np.full(len(hour), np.inf)
+        for candidate in (before, after):
+            inside = (candidate >= 0) & (candidate < len(self))
+            pos = np.where(inside, candidate, 0)
+            offset = np.abs(self.hours[pos] - hour).astype(np.float64)
+            usable = inside & (self.codes[pos] == code) & (offset <= tolerance) & (offset < best_offset)
+            best = np.where(usable, pos, best)
+            best_offset = np.where(usable, offset, best_offset)
+
+        positions[valid] = best
+        offsets[valid] = np.where(best >= 0, best_offset, np.nan)
+        return positions, offsets
+
+    def attach(self, df, columns=None, tolerance=WEATHER_TOLERANCE_HOURS, origin='origin'):
+        """
+        As-of join: copy of a flights DataFrame (origin, year, month, day, hour) with the weather columns of the
+        nearest observation at its origin added, plus weather_offset_hours. Every flight is kept, those without
+        an observation within tolerance hours get NaN.
+        """
+        columns = [c for c in (columns or WEATHER_COLUMNS) if c in self.columns]
+        hours = epoch_hours(df['year'], df['month'], df['day'], df['hour'])
+        positions, offsets = self.nearest(df[origin].to_numpy(), hours, tolerance)
+
+        out = df.copy()
+        found = positions >= 0
+        for column in columns:
+            values = np.full(len(out), np.nan, dtype=object)
+            values[found] = self.columns[column][positions[found]]
+            out[column] = pd.to_numeric(pd.Series(values, index=out.index), errors='coerce')
+        out['weather_offset_hours'] = offsets
+        return out
+
+    def day(self, origin, month, day, year=None):
+        """All observations at one origin on one day, ordered by hour, as a DataFrame."""
+        code = self.origins.get(origin)
+        if code is None:
+            return pd.DataFrame(columns=list(self.columns))
+
+        start = epoch_hours([self.year if year is None else year], [month], [day], [0])[0]
+        if np.isnan(start):
+            return pd.DataFrame(columns=list(self.columns))
+        low, high = np.searchsorted(self.sort_key, [code * _ORIGIN_STRIDE + int(start), code * _ORIGIN_STRIDE + int(start) + 24])
+        return pd.DataFrame({c: values[low:high] for c, values in self.columns.items()})
+
+
+############# shared instance ############################
+
+@database.versioned_cache()
+def get_weather_index():
+    """
+    Return the process-wide WeatherIndex.
+    The weather table is loaded once on first use and reloaded when the database file changes.
+    """
+    return WeatherIndex(database.query('SELECT * FROM weather', cache=False))
+
+
+def attach_weather(df, columns=None, tolerance=WEATHER_TOLERANCE_HOURS):
+    """Flights with the nearest weather observation at their origin attached, see WeatherIndex.attach."""
+    return get_weather_index().attach(df, columns, tolerance)
+
+
+def day_weather(origin, month, day):
+    """Weather observations at an airport on one day, see WeatherIndex.day."""
+    return get_weather_index().day(origin, month, day)